@@ -0,0 +1,310 @@
+# server/admission.py
+"""
+admission.py
+Controle de admissão e descarte de carga (load shedding) dos endpoints do
+questionário.
+
+Para cada endpoint protegido (get-group, finaliza-pesquisa, tcle, score-batch):
+- token bucket global do endpoint (estouro -> 503) e, com
+  ADMISSION_TRUSTED_PROXIES configurado, token bucket por IP do cliente
+  (estouro -> 429);
+- limite de requisições simultâneas. Acima dele a requisição espera numa
+  fila curta; com a fila cheia, ou depois de ADMISSION_QUEUE_TIMEOUT
+  segundos esperando, recebe 503 na hora. Todas as recusas levam Retry-After.
+
+Há também um limite global de requisições simultâneas. ADMISSION_RESERVED
+vagas dele ficam reservadas para o /api/tcle (crítico): os outros endpoints
+param antes disso, e quando uma vaga abre a fila do tcle é atendida primeiro.
+O tcle também não é barrado pelo limite global de fila.
+
+Configuração por endpoint: ADMISSION_<NOME>_{CONCURRENCY,QUEUE,RATE,BURST,
+IP_RATE,IP_BURST}, com NOME em GET_GROUP, FINALIZA, TCLE, SCORE_BATCH
+(RATE = 0 desliga o bucket). Os limites valem por processo: com N workers
+o total é N vezes maior.
+
+Limites por IP só valem com ADMISSION_TRUSTED_PROXIES (IPs ou redes CIDR
+dos proxies na frente do servidor, separados por vírgula). Sem isso, atrás
+do proxy da hospedagem todos os clientes teriam o mesmo IP. O IP do cliente
+é o primeiro endereço não confiável lendo o X-Forwarded-For da direita para
+a esquerda, a partir da conexão: as entradas à esquerda dele podem ter sido
+escritas pelo próprio cliente. Sem proxy, use o IP do servidor local (ex.:
+127.0.0.1) para limitar pelo endereço da conexão.
+"""
+
+import os
+import json
+import math
+import time
+import asyncio
+import ipaddress
+import logging
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+import metrics
+
+logger = logging.getLogger("admission")
+
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "1") == "1"
+GLOBAL_CONCURRENCY = int(os.getenv("ADMISSION_GLOBAL_CONCURRENCY", "48"))
+RESERVED_CRITICAL = int(os.getenv("ADMISSION_RESERVED", "8"))  # vagas globais só do tcle
+GLOBAL_QUEUE = int(os.getenv("ADMISSION_GLOBAL_QUEUE", "128"))  # total em espera antes de descartar
+QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "5"))
+SHED_RETRY_AFTER = int(os.getenv("ADMISSION_RETRY_AFTER", "2"))
+MAX_CLIENTS = int(os.getenv("ADMISSION_MAX_CLIENTS", "10000"))  # buckets por IP guardados (LRU)
+TRUSTED_PROXIES = [ipaddress.ip_network(p.strip(), strict=False)
+                   for p in os.getenv("ADMISSION_TRUSTED_PROXIES", "").split(",") if p.strip()]
+
+ADMITTED, QUEUED, SHED = "admitted", "queued", "shed"
+
+ADMISSION_EVENTS = metrics.counter("admission_requests_total", "Decisões do controle de admissão por endpoint (admitted, queued, shed).", ("endpoint", "result"))
+ADMISSION_SHED = metrics.counter("admission_shed_total", "Requisições recusadas por motivo.", ("endpoint", "reason"))
+
+
+class TokenBucket:
+    """Bucket de `burst` fichas reposto a `rate` fichas por segundo."""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+    def take(self) -> float:
+        """Consome uma ficha. Devolve 0 se conseguiu, ou quantos segundos faltam para a próxima."""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+def _env(name: str, key: str, default: float) -> float:
+    return float(os.getenv(f"ADMISSION_{name}_{key}", str(default)))
+
+
+class EndpointPolicy:
+    def __init__(self, name: str, method: str, path: str, critical: bool = False, *, concurrency: int,
+                 queue: int, rate: float, burst: float, ip_rate: float, ip_burst: float):
+        self.name = name
+        self.method = method
+        self.path = path
+        self.critical = critical
+        self.concurrency = int(_env(name, "CONCURRENCY", concurrency))
+        self.queue = int(_env(name, "QUEUE", queue))
+        rate, burst = _env(name, "RATE", rate), _env(name, "BURST", burst)
+        self.ip_rate, self.ip_burst = _env(name, "IP_RATE", ip_rate), _env(name, "IP_BURST", ip_burst)
+        self.bucket = TokenBucket(rate, burst) if rate > 0 else None
+        self.clients: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self.in_flight = 0
+        self.waiters: Deque[asyncio.Future] = deque()
+
+    def client_bucket(self, ip: Optional[str]) -> Optional[TokenBucket]:
+        if self.ip_rate <= 0 or ip is None:
+            return None
+        bucket = self.clients.get(ip)
+        if bucket is None:
+            bucket = self.clients[ip] = TokenBucket(self.ip_rate, self.ip_burst)
+            if len(self.clients) > MAX_CLIENTS:
+                self.clients.popitem(last=False)
+        else:
+            self.clients.move_to_end(ip)
+        return bucket
+
+
+# Um participante faz get-group, finaliza-pesquisa e tcle uma vez cada; os
+# limites por IP (só com ADMISSION_TRUSTED_PROXIES) são folgados porque uma
+# turma inteira pode sair do mesmo NAT.
+# O tcle não tem bucket global: o envio já é limitado pela caixa de saída.
+POLICIES = [
+    EndpointPolicy("GET_GROUP", "GET", "/api/get-group", concurrency=16, queue=64, rate=100, burst=200, ip_rate=5, ip_burst=60),
+    EndpointPolicy("FINALIZA", "POST", "/api/finaliza-pesquisa", concurrency=16, queue=64, rate=100, burst=200, ip_rate=5, ip_burst=60),
+    EndpointPolicy("TCLE", "POST", "/api/tcle", critical=True, concurrency=16, queue=128, rate=0, burst=0, ip_rate=2, ip_burst=30),
+    # pontuação em lote é ferramenta de análise: CPU, poucas de cada vez
+    EndpointPolicy("SCORE_BATCH", "POST", "/api/score-batch", concurrency=2, queue=8, rate=0, burst=0, ip_rate=1, ip_burst=5),
+]
+_BY_ROUTE: Dict[Tuple[str, str], EndpointPolicy] = {(p.method, p.path): p for p in POLICIES}
+# os críticos primeiro: ao abrir uma vaga global, a fila do tcle é atendida antes
+_WAKE_ORDER = sorted(POLICIES, key=lambda p: not p.critical)
+
+_global_in_flight = 0
+
+
+class Rejected(Exception):
+    def __init__(self, status: int, reason: str, retry_after: float, detail: str):
+        super().__init__(detail)
+        self.status = status
+        self.reason = reason
+        self.retry_after = retry_after
+        self.detail = detail
+
+
+def _can_start(policy: EndpointPolicy) -> bool:
+    limit = GLOBAL_CONCURRENCY if policy.critical else GLOBAL_CONCURRENCY - RESERVED_CRITICAL
+    return policy.in_flight < policy.concurrency and _global_in_flight < limit
+
+
+def _start(policy: EndpointPolicy) -> None:
+    global _global_in_flight
+    policy.in_flight += 1
+    _global_in_flight += 1
+
+
+def _prune(policy: EndpointPolicy) -> None:
+    """Tira do começo da fila quem já desistiu (timeout/desconexão)."""
+    while policy.waiters and policy.waiters[0].done():
+        policy.waiters.popleft()
+
+
+def _waiting_total() -> int:
+    return sum(len(p.waiters) for p in POLICIES)
+
+
+def _wake() -> None:
+    """Passa as vagas livres para quem está na fila (críticos primeiro, FIFO em cada endpoint)."""
+    for policy in _WAKE_ORDER:
+        while policy.waiters and _can_start(policy):
+            fut = policy.waiters.popleft()
+            if fut.done():
+                continue  # desistiu (timeout/desconexão)
+            _start(policy)
+            fut.set_result(None)
+
+
+def release(policy: EndpointPolicy) -> None:
+    global _global_in_flight
+    policy.in_flight -= 1
+    _global_in_flight -= 1
+    _wake()
+
+
+def _shed(policy: EndpointPolicy, status: int, reason: str, retry_after: float, detail: str) -> Rejected:
+    ADMISSION_EVENTS.inc(policy.name.lower(), SHED)
+    ADMISSION_SHED.inc(policy.name.lower(), reason)
+    return Rejected(status, reason, retry_after, detail)
+
+
+async def acquire(policy: EndpointPolicy, client_ip: Optional[str]) -> None:
+    """Admite a requisição (talvez depois de esperar na fila) ou levanta Rejected."""
+    name = policy.name.lower()
+    bucket = policy.client_bucket(client_ip)
+    wait = bucket.take() if bucket is not None else 0.0
+    if wait:
+        raise _shed(policy, 429, "client_rate", wait, "Muitas requisições deste endereço; tente novamente em instantes.")
+    if policy.bucket is not None:
+        wait = policy.bucket.take()
+        if wait:
+            raise _shed(policy, 503, "global_rate", wait, "Serviço sobrecarregado; tente novamente em instantes.")
+
+    _prune(policy)
+    if not policy.waiters and _can_start(policy):
+        _start(policy)
+        ADMISSION_EVENTS.inc(name, ADMITTED)
+        return
+    if len(policy.waiters) >= policy.queue or (not policy.critical and _waiting_total() >= GLOBAL_QUEUE):
+        raise _shed(policy, 503, "queue_full", SHED_RETRY_AFTER, "Serviço sobrecarregado; tente novamente em instantes.")
+
+    ADMISSION_EVENTS.inc(name, QUEUED)
+    fut = asyncio.get_running_loop().create_future()
+    policy.waiters.append(fut)
+    try:
+        await asyncio.wait_for(asyncio.shield(fut), QUEUE_TIMEOUT)
+    except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+        if fut.done() and not fut.cancelled():
+            release(policy)  # a vaga chegou junto com o timeout/cancelamento
+        else:
+            fut.cancel()
+            # sai da fila já: senão conta como espera (fila cheia, gauges) até o próximo _wake
+            try:
+                policy.waiters.remove(fut)
+            except ValueError:
+                pass
+        if isinstance(e, asyncio.CancelledError):
+            raise
+        raise _shed(policy, 503, "queue_timeout", SHED_RETRY_AFTER, "Serviço sobrecarregado; tente novamente em instantes.")
+    ADMISSION_EVENTS.inc(name, ADMITTED)
+
+
+def _trusted(hop: str) -> bool:
+    try:
+        address = ipaddress.ip_address(hop)
+    except ValueError:
+        return False
+    return any(address in network for network in TRUSTED_PROXIES)
+
+
+def _client_ip(scope: Dict[str, Any]) -> Optional[str]:
+    """IP do cliente para os limites por IP; None (sem limite por IP) sem proxies confiáveis configurados."""
+    if not TRUSTED_PROXIES:
+        return None
+    hops: List[str] = []
+    for key, value in scope.get("headers", ()):
+        if key == b"x-forwarded-for":
+            hops.extend(h.strip() for h in value.decode("latin-1").split(",") if h.strip())
+    client = scope.get("client")
+    if client:
+        hops.append(client[0])
+    for hop in reversed(hops):
+        if not _trusted(hop):
+            return hop
+    # todos confiáveis (requisição vinda de dentro da rede dos proxies)
+    return hops[0] if hops else None
+
+
+class AdmissionMiddleware:
+    """Middleware ASGI: aplica a política do endpoint antes de chamar o app."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        policy = _BY_ROUTE.get((scope.get("method"), scope.get("path"))) if scope["type"] == "http" and ADMISSION_ENABLED else None
+        if policy is None:
+            return await self.app(scope, receive, send)
+        try:
+            await acquire(policy, _client_ip(scope))
+        except Rejected as r:
+            return await _reject(send, r)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            release(policy)
+
+
+async def _reject(send, r: Rejected) -> None:
+    body = json.dumps({"detail": r.detail}, ensure_ascii=False).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": r.status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(max(1, math.ceil(r.retry_after))).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+def status() -> Dict[str, Any]:
+    """Vagas em uso, fila e limites por endpoint (GET /api/inflight)."""
+    return {
+        "enabled": ADMISSION_ENABLED,
+        "per_ip_limits": bool(TRUSTED_PROXIES),
+        "global": {"in_flight": _global_in_flight, "limit": GLOBAL_CONCURRENCY, "reserved_critical": RESERVED_CRITICAL,
+                   "waiting": _waiting_total(), "queue_limit": GLOBAL_QUEUE},
+        "endpoints": {
+            p.path: {"in_flight": p.in_flight, "waiting": len(p.waiters), "concurrency": p.concurrency,
+                     "queue": p.queue, "critical": p.critical, "clients_tracked": len(p.clients)}
+            for p in POLICIES
+        },
+    }
+
+
+@metrics.register_collector
+def _collect_admission():
+    yield ("admission_in_flight", "gauge", "Requisições admitidas em andamento por endpoint.",
+           [({"endpoint": p.name.lower()}, p.in_flight) for p in POLICIES])
+    yield ("admission_waiting", "gauge", "Requisições na fila de admissão por endpoint.",
+           [({"endpoint": p.name.lower()}, len(p.waiters)) for p in POLICIES])
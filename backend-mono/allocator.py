@@ -0,0 +1,274 @@
+# server/allocator.py
+"""
+allocator.py
+Alocação atômica do contador de participantes (que define o grupo par/ímpar).
+
+Backends (env GROUP_ALLOCATOR):
+- "memory": contador atômico em memória. Correto apenas com um único worker;
+  com mais workers (concurrency.web_workers) o backend "sqlite" é usado no lugar.
+- "sqlite": contador em SQLite local (BEGIN IMMEDIATE), correto com vários
+  workers do uvicorn na mesma máquina. Padrão.
+- "sheet": reserva blocos de GROUP_LEASE_SIZE ids na planilha por round-trip
+  e distribui localmente. Entre workers da mesma máquina a reserva é
+  serializada por uma trava de arquivo.
+
+Nos backends "memory" e "sqlite" a planilha é apenas um espelho: o valor
+atual é gravado em segundo plano, no máximo a cada GROUP_SYNC_INTERVAL
+segundos, por um único worker (LeaderLock).
+Na inicialização o contador continua a partir do valor da planilha. Se a
+leitura falhar a inicialização falha (e é tentada de novo na próxima
+chamada): começar do zero reiniciaria a numeração e o balanceamento dos
+grupos. O espelho nunca grava um valor menor que o da planilha.
+"""
+
+import os
+import threading
+import logging
+from typing import Callable, Optional
+
+import g_sheets
+from concurrency import web_workers
+from local_db import LeaderLock, connect, file_lock
+from metrics import timed
+
+logger = logging.getLogger("allocator")
+
+ALLOCATOR_BACKEND = os.getenv("GROUP_ALLOCATOR", "sqlite").lower()
+LEASE_SIZE = int(os.getenv("GROUP_LEASE_SIZE", "20"))
+SYNC_INTERVAL = float(os.getenv("GROUP_SYNC_INTERVAL", "5"))
+
+
+def _parse_count(raw: Optional[str]) -> int:
+    """Célula vazia vale 0; qualquer outro valor não numérico levanta ValueError."""
+    text = "" if raw is None else str(raw).strip()
+    if text == "":
+        return 0
+    try:
+        return int(text)
+    except ValueError:
+        raise ValueError(f"Valor de contador inválido na planilha: {raw!r}") from None
+
+
+def _read_sheet_count(tab_name: str, cell: str) -> int:
+    """
+    Lê o contador da planilha (sem SPREADSHEET_ID, começa do zero). Falhas
+    de leitura sobem depois dos retries de g_sheets em vez de virar 0.
+    """
+    if not g_sheets.SPREADSHEET_ID:
+        return 0
+    try:
+        return _parse_count(g_sheets.get_cell_value(tab_name, cell, use_cache=False))
+    except Exception:
+        logger.exception("Não foi possível ler o contador inicial em %s!%s.", tab_name, cell)
+        raise
+
+
+class _SheetSync:
+    """
+    Thread de fundo que espelha o valor atual do contador na planilha.
+    Só o worker que detém a trava de líder grava; ele confere o valor a cada
+    intervalo (o contador SQLite é incrementado por todos os workers).
+    Antes de gravar lê a célula: se a planilha estiver à frente (estado local
+    perdido), não grava e avança o contador local com `advance`.
+    """
+
+    def __init__(self, tab_name: str, cell: str, current: Callable[[], int], advance: Callable[[int], None],
+                 interval: float = SYNC_INTERVAL):
+        self.tab_name = tab_name
+        self.cell = cell
+        self.current = current
+        self.advance = advance
+        self.interval = interval
+        self._leader = LeaderLock(f"counter-sync-{tab_name}-{cell}")
+        self._stop = threading.Event()
+        self._last_synced: Optional[int] = None
+        self._thread = threading.Thread(target=self._run, name="allocator-sheet-sync", daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            if self._leader.try_acquire():
+                self.flush()
+
+    def flush(self) -> None:
+        value = self.current()
+        if value == self._last_synced or not g_sheets.SPREADSHEET_ID:
+            return
+        try:
+            in_sheet = _parse_count(g_sheets.get_cell_value(self.tab_name, self.cell, use_cache=False))
+            if in_sheet > value:
+                logger.error("Contador na planilha (%d) à frente do local (%d); avançando o local sem gravar.", in_sheet, value)
+                self.advance(in_sheet)
+                self._last_synced = in_sheet
+                return
+            g_sheets.set_cell_value(self.tab_name, self.cell, value)
+            self._last_synced = value
+            logger.debug("Contador sincronizado na planilha: %d", value)
+        except Exception:
+            logger.exception("Falha ao sincronizar contador na planilha; nova tentativa no próximo ciclo.")
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join(timeout=self.interval + 1)
+        # o líder (ou quem assumir, se ele já encerrou) grava o valor final
+        if self._leader.held or self._leader.try_acquire():
+            self.flush()
+        self._leader.release()
+
+
+class GroupAllocator:
+    """Interface: `next()` devolve o novo valor do contador (1, 2, 3, ...)."""
+
+    def next(self) -> int:
+        raise NotImplementedError
+
+    def current(self) -> int:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class MemoryAllocator(GroupAllocator):
+    def __init__(self, tab_name: str, cell: str, start: Optional[int] = None):
+        self._lock = threading.Lock()
+        self._value = _read_sheet_count(tab_name, cell) if start is None else start
+        self._sync = _SheetSync(tab_name, cell, self.current, self.advance)
+
+    def next(self) -> int:
+        with self._lock:
+            self._value += 1
+            return self._value
+
+    def current(self) -> int:
+        with self._lock:
+            return self._value
+
+    def advance(self, value: int) -> None:
+        with self._lock:
+            self._value = max(self._value, value)
+
+    def close(self) -> None:
+        self._sync.stop()
+
+
+class SQLiteAllocator(GroupAllocator):
+    DB_NAME = "counters"
+
+    def __init__(self, tab_name: str, cell: str):
+        self.key = f"{tab_name}!{cell}"
+        conn = connect(self.DB_NAME)
+        conn.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        row = conn.execute("SELECT value FROM counters WHERE name = ?", (self.key,)).fetchone()
+        if row is None:
+            # sem fallback para 0: se a leitura falhar, nada é semeado e a próxima chamada tenta de novo
+            seed = _read_sheet_count(tab_name, cell)
+            conn.execute("INSERT OR IGNORE INTO counters (name, value) VALUES (?, ?)", (self.key, seed))
+        self._sync = _SheetSync(tab_name, cell, self.current, self.advance)
+
+    def next(self) -> int:
+        conn = connect(self.DB_NAME)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("UPDATE counters SET value = value + 1 WHERE name = ?", (self.key,))
+            value = conn.execute("SELECT value FROM counters WHERE name = ?", (self.key,)).fetchone()[0]
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return value
+
+    def current(self) -> int:
+        row = connect(self.DB_NAME).execute("SELECT value FROM counters WHERE name = ?", (self.key,)).fetchone()
+        return row[0] if row else 0
+
+    def advance(self, value: int) -> None:
+        connect(self.DB_NAME).execute("UPDATE counters SET value = MAX(value, ?) WHERE name = ?", (value, self.key))
+
+    def close(self) -> None:
+        self._sync.stop()
+
+
+class SheetLeaseAllocator(GroupAllocator):
+    """
+    Reserva blocos de `lease_size` ids gravando o novo limite na planilha
+    (um read + um write a cada bloco) e distribui os ids localmente.
+    Ids não usados de um bloco são descartados ao reiniciar. Workers na
+    mesma máquina reservam um de cada vez (file_lock); processos em máquinas
+    diferentes não são coordenados.
+    """
+
+    def __init__(self, tab_name: str, cell: str, lease_size: int = LEASE_SIZE):
+        self.tab_name = tab_name
+        self.cell = cell
+        self.lease_size = max(1, lease_size)
+        self._lock = threading.Lock()
+        self._next = 1
+        self._limit = 0
+
+    def _lease(self) -> None:
+        with file_lock(f"group-lease-{self.tab_name}-{self.cell}"):
+            high = _parse_count(g_sheets.get_cell_value(self.tab_name, self.cell, use_cache=False))
+            g_sheets.set_cell_value(self.tab_name, self.cell, high + self.lease_size)
+        self._next, self._limit = high + 1, high + self.lease_size
+        logger.info("Bloco de ids reservado: %d..%d", self._next, self._limit)
+
+    def next(self) -> int:
+        with self._lock:
+            if self._next > self._limit:
+                self._lease()
+            value = self._next
+            self._next += 1
+            return value
+
+    def current(self) -> int:
+        with self._lock:
+            return self._next - 1
+
+
+_BACKENDS = {
+    "memory": MemoryAllocator,
+    "sqlite": SQLiteAllocator,
+    "sheet": SheetLeaseAllocator,
+}
+
+_allocators = {}
+_allocators_lock = threading.Lock()
+
+
+def get_allocator(tab_name: str = "counter", cell: str = "A1") -> GroupAllocator:
+    key = (tab_name, cell)
+    allocator = _allocators.get(key)
+    if allocator is not None:
+        return allocator
+    with _allocators_lock:
+        allocator = _allocators.get(key)
+        if allocator is None:
+            backend = ALLOCATOR_BACKEND
+            workers = web_workers()
+            if backend == "memory" and workers > 1:
+                logger.warning("GROUP_ALLOCATOR=memory não é compartilhado entre %d workers; usando 'sqlite'.", workers)
+                backend = "sqlite"
+            cls = _BACKENDS.get(backend)
+            if cls is None:
+                raise RuntimeError(f"GROUP_ALLOCATOR inválido: {backend!r} (use {', '.join(_BACKENDS)}).")
+            logger.info("Usando alocador de grupos '%s' para %s!%s", backend, tab_name, cell)
+            allocator = _allocators[key] = cls(tab_name, cell)
+    return allocator
+
+
+@timed("group_allocate")
+def allocate(tab_name: str = "counter", cell: str = "A1") -> int:
+    """Incrementa o contador e devolve o novo valor (mesma semântica de increment_counter)."""
+    return get_allocator(tab_name, cell).next()
+
+
+def close_all() -> None:
+    """Grava o valor final na planilha e encerra as threads de sincronização."""
+    with _allocators_lock:
+        for allocator in _allocators.values():
+            try:
+                allocator.close()
+            except Exception:
+                logger.exception("Erro ao encerrar alocador.")
+        _allocators.clear()
@@ -0,0 +1,113 @@
+# server/brevo_stub.py
+"""
+brevo_stub.py
+Servidor HTTP local que imita POST /v3/smtp/email do Brevo, para testes.
+
+Uso:
+    python brevo_stub.py --port 8025 --latency 0.05 --error-rate 0.1
+    BREVO_API_URL=http://127.0.0.1:8025/v3/smtp/email uvicorn main:app
+
+GET /_stats devolve quantos envios foram recebidos/aceitos/recusados.
+"""
+
+import json
+import time
+import uuid
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class BrevoStubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency: float = 0.0, error_rate: float = 0.0, error_status: int = 503):
+        super().__init__(address, _Handler)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.lock = threading.Lock()
+        self.stats = {"received": 0, "accepted": 0, "rejected": 0}
+        self.recipients = []
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v3/smtp/email"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: BrevoStubServer
+
+    def _reply(self, status: int, body: dict) -> None:
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == "/_stats":
+            with self.server.lock:
+                return self._reply(200, dict(self.server.stats))
+        self._reply(404, {"message": "not found"})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        raw = self.rfile.read(length)
+        if self.path != "/v3/smtp/email":
+            return self._reply(404, {"message": "not found"})
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        with self.server.lock:
+            self.server.stats["received"] += 1
+        if not self.headers.get("api-key"):
+            with self.server.lock:
+                self.server.stats["rejected"] += 1
+            return self._reply(401, {"code": "unauthorized", "message": "Key not found"})
+        if random.random() < self.server.error_rate:
+            with self.server.lock:
+                self.server.stats["rejected"] += 1
+            return self._reply(self.server.error_status, {"code": "stub_error", "message": "erro injetado"})
+
+        try:
+            payload = json.loads(raw)
+            to = [t["email"] for t in payload["to"]]
+        except (ValueError, KeyError, TypeError):
+            with self.server.lock:
+                self.server.stats["rejected"] += 1
+            return self._reply(400, {"code": "bad_request", "message": "payload inválido"})
+
+        with self.server.lock:
+            self.server.stats["accepted"] += 1
+            self.server.recipients.extend(to)
+        self._reply(201, {"messageId": f"<{uuid.uuid4().hex}@stub>"})
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub(port: int = 0, latency: float = 0.0, error_rate: float = 0.0, error_status: int = 503) -> BrevoStubServer:
+    """Sobe o stub numa thread e devolve o servidor (use server.url e server.shutdown())."""
+    server = BrevoStubServer(("127.0.0.1", port), latency=latency, error_rate=error_rate, error_status=error_status)
+    threading.Thread(target=server.serve_forever, name="brevo-stub", daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stub local da API de email do Brevo.")
+    parser.add_argument("--port", type=int, default=8025)
+    parser.add_argument("--latency", type=float, default=0.0, help="segundos de atraso por envio")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fração de envios que falham")
+    parser.add_argument("--error-status", type=int, default=503)
+    args = parser.parse_args()
+
+    server = BrevoStubServer(("127.0.0.1", args.port), args.latency, args.error_rate, args.error_status)
+    print(f"Stub do Brevo em {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
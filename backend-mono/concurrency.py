@@ -0,0 +1,137 @@
+# server/concurrency.py
+"""
+concurrency.py
+Executa chamadas bloqueantes (Google Sheets, Brevo, SQLite local) fora do
+event loop do asyncio.
+
+Todas as chamadas usam um único ThreadPoolExecutor limitado (IO_THREADS) e,
+por cima dele, um limite de concorrência por backend, para que uma API lenta
+não ocupe todas as threads do pool. O número de chamadas em andamento e em
+espera por backend fica disponível em `inflight()`.
+
+Número de processos do servidor (web_workers): WEB_CONCURRENCY é só o
+padrão do uvicorn e do gunicorn; o valor efetivo é o --workers/-w da linha
+de comando do servidor, lida em /proc (o supervisor do uvicorn --workers N
+é o processo pai de cada worker). O gunicorn_conf.py grava o valor efetivo
+em WEB_CONCURRENCY em cada worker.
+"""
+
+import os
+import asyncio
+import functools
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+logger = logging.getLogger("concurrency")
+
+IO_THREADS = int(os.getenv("IO_THREADS", "32"))
+BACKEND_LIMITS = {
+    "sheets": int(os.getenv("SHEETS_CONCURRENCY", "8")),
+    "email": int(os.getenv("EMAIL_CONCURRENCY", "4")),
+    "local": int(os.getenv("LOCAL_IO_CONCURRENCY", "16")),
+}
+
+_executor = ThreadPoolExecutor(max_workers=IO_THREADS, thread_name_prefix="io")
+_semaphores: Dict[str, asyncio.Semaphore] = {}
+_counts_lock = threading.Lock()
+_in_flight: Dict[str, int] = {name: 0 for name in BACKEND_LIMITS}
+_waiting: Dict[str, int] = {name: 0 for name in BACKEND_LIMITS}
+
+
+def _cmdline(pid: int) -> List[str]:
+    try:
+        with open(f"/proc/{pid}/cmdline", "rb") as f:
+            return f.read().decode("utf-8", "replace").split("\0")
+    except OSError:
+        return []
+
+
+def _is_server(argv: Sequence[str]) -> bool:
+    return any(os.path.basename(arg) in ("uvicorn", "gunicorn") for arg in argv[:3])
+
+
+def _cli_workers(argv: Sequence[str]) -> Optional[int]:
+    """Valor de --workers N, --workers=N, -w N ou -wN numa linha de comando."""
+    for i, arg in enumerate(argv):
+        if arg.startswith("--workers="):
+            value = arg.split("=", 1)[1]
+        elif arg in ("--workers", "-w") and i + 1 < len(argv):
+            value = argv[i + 1]
+        elif arg.startswith("-w") and arg[2:].isdigit():
+            value = arg[2:]
+        else:
+            continue
+        return int(value) if value.isdigit() else None
+    return None
+
+
+_web_workers: Optional[int] = None
+
+
+def web_workers() -> int:
+    """Processos do servidor: --workers da linha de comando do servidor ou, sem ele, WEB_CONCURRENCY."""
+    global _web_workers
+    if _web_workers is None:
+        configured = int(os.getenv("WEB_CONCURRENCY", "1"))
+        workers = configured
+        # o próprio processo (uvicorn sem supervisor) ou o pai (supervisor do uvicorn / mestre do gunicorn)
+        for argv in (_cmdline(os.getpid()), _cmdline(os.getppid())):
+            if _is_server(argv):
+                cli = _cli_workers(argv)
+                if cli is not None:
+                    workers = cli
+                break
+        if workers != configured:
+            logger.warning("O servidor roda com %d workers, mas WEB_CONCURRENCY=%d; usando %d.", workers, configured, workers)
+        _web_workers = workers
+    return _web_workers
+
+
+def _semaphore(backend: str) -> asyncio.Semaphore:
+    sem = _semaphores.get(backend)
+    if sem is None:
+        if backend not in BACKEND_LIMITS:
+            raise ValueError(f"Backend desconhecido: {backend!r}")
+        sem = _semaphores[backend] = asyncio.Semaphore(BACKEND_LIMITS[backend])
+    return sem
+
+
+def _add(counter: Dict[str, int], backend: str, n: int) -> None:
+    with _counts_lock:
+        counter[backend] += n
+
+
+async def run_blocking(backend: str, fn: Callable[..., Any], *args, **kwargs) -> Any:
+    """Executa `fn(*args, **kwargs)` no pool de I/O respeitando o limite do backend."""
+    sem = _semaphore(backend)
+    _add(_waiting, backend, 1)
+    try:
+        await sem.acquire()
+    finally:
+        _add(_waiting, backend, -1)
+    _add(_in_flight, backend, 1)
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_executor, functools.partial(fn, *args, **kwargs))
+    finally:
+        _add(_in_flight, backend, -1)
+        sem.release()
+
+
+def inflight() -> Dict[str, Any]:
+    """Chamadas em andamento, em espera e limite, por backend."""
+    with _counts_lock:
+        return {
+            "workers": web_workers(),
+            "pool": {"threads": IO_THREADS, "in_flight": sum(_in_flight.values())},
+            "backends": {
+                name: {"in_flight": _in_flight[name], "waiting": _waiting[name], "limit": limit}
+                for name, limit in BACKEND_LIMITS.items()
+            },
+        }
+
+
+def shutdown(wait: bool = True) -> None:
+    _executor.shutdown(wait=wait)
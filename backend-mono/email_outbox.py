@@ -0,0 +1,471 @@
+# server/email_outbox.py
+"""
+email_outbox.py
+Caixa de saída persistente para o envio do TCLE.
+
+/api/tcle grava o pedido numa tabela SQLite local e devolve um id na hora.
+Um pool de threads esvazia a caixa de saída respeitando o limite de envio
+do Brevo (token bucket) e tenta de novo, com backoff exponencial, as falhas
+transitórias (rede, 429, 5xx). O estado de cada mensagem fica consultável
+por id (queued → sending → sent | failed).
+Com vários workers do servidor, só um processo (LeaderLock) esvazia a
+caixa de saída, então o limite de envio vale para o serviço inteiro.
+
+Deduplicação por destinatário (submit/send_now): pedidos para o mesmo email
+(normalizado, indexado pelo hash SHA-256) dentro de TCLE_DEDUP_WINDOW
+segundos reaproveitam a mensagem já existente em vez de gerar outro envio.
+A coluna recipient_hash da tabela torna isso válido entre workers e
+reinícios; um LRU em memória com TTL evita a transação de escrita nas
+repetições. Mensagens com falha definitiva não contam: o reenvio passa.
+Mensagens terminadas (sent/failed) há mais de TCLE_DEDUP_WINDOW segundos
+perdem o email em texto (fica só o recipient_hash), em varreduras a cada
+PURGE_INTERVAL segundos.
+"""
+
+import os
+import time
+import uuid
+import random
+import hashlib
+import threading
+import logging
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional, Tuple
+
+import email_sender
+import metrics
+from local_db import LeaderLock, connect
+
+logger = logging.getLogger("email_outbox")
+
+DB_NAME = "email_outbox"
+EMAIL_OUTBOX = os.getenv("EMAIL_OUTBOX", "1") == "1"
+WORKERS = int(os.getenv("EMAIL_WORKERS", "2"))
+MAX_ATTEMPTS = int(os.getenv("EMAIL_MAX_ATTEMPTS", "6"))
+BACKOFF_BASE = float(os.getenv("EMAIL_BACKOFF_BASE", "2"))
+BACKOFF_MAX = float(os.getenv("EMAIL_BACKOFF_MAX", "600"))
+LEASE_SECONDS = float(os.getenv("EMAIL_LEASE_SECONDS", "60"))
+RATE_PER_SECOND = float(os.getenv("BREVO_RATE_PER_SECOND", "5"))
+RATE_BURST = int(os.getenv("BREVO_RATE_BURST", "10"))
+POLL_INTERVAL = float(os.getenv("EMAIL_POLL_INTERVAL", "1"))
+DEDUP_WINDOW = float(os.getenv("TCLE_DEDUP_WINDOW", "600"))  # segundos; 0 desliga
+DEDUP_MEMORY_SIZE = int(os.getenv("TCLE_DEDUP_MEMORY_SIZE", "10000"))
+PURGE_INTERVAL = 300.0
+
+QUEUED, SENDING, SENT, FAILED = "queued", "sending", "sent", "failed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id TEXT PRIMARY KEY,
+    destinatario TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    lease_until REAL NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    provider_status INTEGER,
+    last_error TEXT,
+    recipient_hash TEXT
+)
+"""
+
+_init_lock = threading.Lock()
+_initialized = False
+
+
+def _db():
+    global _initialized
+    conn = connect(DB_NAME)
+    if not _initialized:
+        with _init_lock:
+            if not _initialized:
+                conn.execute(_SCHEMA)
+                columns = {row[1] for row in conn.execute("PRAGMA table_info(outbox)")}
+                if "recipient_hash" not in columns:
+                    # caixa de saída criada antes da deduplicação
+                    conn.execute("ALTER TABLE outbox ADD COLUMN recipient_hash TEXT")
+                conn.execute("CREATE INDEX IF NOT EXISTS outbox_ready ON outbox (status, next_attempt_at)")
+                conn.execute("CREATE INDEX IF NOT EXISTS outbox_recipient ON outbox (recipient_hash, created_at)")
+                _init_counts(conn)
+                _initialized = True
+    return conn
+
+
+def _init_counts(conn) -> None:
+    """
+    Contagem por estado mantida por triggers na mesma transação de cada
+    mudança (vale entre workers); stats() lê 4 linhas em vez de varrer a tabela.
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'outbox_counts'").fetchone()
+        if exists is None:
+            conn.execute("CREATE TABLE outbox_counts (status TEXT PRIMARY KEY, n INTEGER NOT NULL)")
+            conn.execute("INSERT INTO outbox_counts (status, n) SELECT status, COUNT(*) FROM outbox GROUP BY status")
+        conn.execute(
+            "CREATE TRIGGER IF NOT EXISTS outbox_count_insert AFTER INSERT ON outbox BEGIN "
+            "INSERT INTO outbox_counts (status, n) VALUES (NEW.status, 1) "
+            "ON CONFLICT(status) DO UPDATE SET n = n + 1; END"
+        )
+        conn.execute(
+            "CREATE TRIGGER IF NOT EXISTS outbox_count_update AFTER UPDATE OF status ON outbox "
+            "WHEN OLD.status != NEW.status BEGIN "
+            "UPDATE outbox_counts SET n = n - 1 WHERE status = OLD.status; "
+            "INSERT INTO outbox_counts (status, n) VALUES (NEW.status, 1) "
+            "ON CONFLICT(status) DO UPDATE SET n = n + 1; END"
+        )
+        conn.execute(
+            "CREATE TRIGGER IF NOT EXISTS outbox_count_delete AFTER DELETE ON outbox BEGIN "
+            "UPDATE outbox_counts SET n = n - 1 WHERE status = OLD.status; END"
+        )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+class TokenBucket:
+    """Limita a taxa de envios: `rate` tokens por segundo, até `burst` acumulados."""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self) -> None:
+        """Bloqueia até haver um token disponível."""
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+_bucket = TokenBucket(RATE_PER_SECOND, RATE_BURST)
+_wakeup = threading.Event()
+
+
+def enqueue(destinatario: str) -> str:
+    """Grava o pedido de envio e devolve o id da mensagem (sem deduplicação, ver submit)."""
+    message_id = _insert(_db(), destinatario, recipient_hash(destinatario), QUEUED)
+    _wakeup.set()
+    return message_id
+
+
+def _insert(conn, destinatario: str, rhash: str, status: str, provider_status: Optional[int] = None,
+            error: Optional[str] = None) -> str:
+    message_id = uuid.uuid4().hex
+    now = time.time()
+    conn.execute(
+        "INSERT INTO outbox (id, destinatario, status, attempts, next_attempt_at, created_at, updated_at, "
+        "provider_status, last_error, recipient_hash) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (message_id, destinatario, status, 0 if status == QUEUED else 1, now, now, now,
+         provider_status, error[:500] if error else None, rhash),
+    )
+    return message_id
+
+
+# --- deduplicação por destinatário ---
+DEDUP_EVENTS = metrics.counter("tcle_dedup_total", "Pedidos de TCLE por resultado da deduplicação (new, duplicate, joined).", ("result",))
+
+_recent_lock = threading.Lock()
+_recent: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()  # hash -> (expira em, id da mensagem)
+_in_flight: Dict[str, Future] = {}
+
+
+def recipient_hash(destinatario: str) -> str:
+    """Hash do email normalizado (sem espaços nas pontas, minúsculo)."""
+    return hashlib.sha256(destinatario.strip().lower().encode("utf-8")).hexdigest()
+
+
+def _remember_locked(rhash: str, message_id: str, created_at: float) -> None:
+    """Como _remember, para quem já segura _recent_lock."""
+    _recent[rhash] = (created_at + DEDUP_WINDOW, message_id)
+    _recent.move_to_end(rhash)
+    while len(_recent) > DEDUP_MEMORY_SIZE:
+        _recent.popitem(last=False)
+
+
+def _remember(rhash: str, message_id: str, created_at: float) -> None:
+    with _recent_lock:
+        _remember_locked(rhash, message_id, created_at)
+
+
+def _forget(rhash: str) -> None:
+    with _recent_lock:
+        _recent.pop(rhash, None)
+
+
+def _recent_message(conn, rhash: str) -> Optional[Tuple[str, str]]:
+    """(id, estado) do pedido ainda válido para este destinatário na janela, se houver."""
+    if DEDUP_WINDOW <= 0:
+        return None
+    now = time.time()
+    with _recent_lock:
+        entry = _recent.get(rhash)
+        if entry is not None and entry[0] <= now:
+            del _recent[rhash]
+            entry = None
+    if entry is not None:
+        # só leitura pela chave primária: a mensagem pode ter falhado em outro worker
+        row = conn.execute("SELECT status FROM outbox WHERE id = ?", (entry[1],)).fetchone()
+        if row is not None and row[0] != FAILED:
+            with _recent_lock:
+                if rhash in _recent:
+                    _recent.move_to_end(rhash)
+            return entry[1], row[0]
+        _forget(rhash)
+    row = conn.execute(
+        "SELECT id, status, created_at FROM outbox WHERE recipient_hash = ? AND created_at > ? AND status != ? "
+        "ORDER BY created_at DESC LIMIT 1",
+        (rhash, now - DEDUP_WINDOW, FAILED),
+    ).fetchone()
+    if row is None:
+        return None
+    _remember(rhash, row[0], row[2])
+    return row[0], row[1]
+
+
+_last_redact = 0.0
+
+
+def redact_finished(conn=None, now: Optional[float] = None) -> int:
+    """Apaga o email das mensagens terminadas fora da janela de deduplicação."""
+    conn = conn or _db()
+    now = now if now is not None else time.time()
+    return conn.execute(
+        "UPDATE outbox SET destinatario = '' WHERE destinatario != '' AND status IN (?, ?) AND updated_at < ?",
+        (SENT, FAILED, now - DEDUP_WINDOW),
+    ).rowcount
+
+
+def _maybe_redact(conn) -> None:
+    global _last_redact
+    now = time.time()
+    if now - _last_redact < PURGE_INTERVAL:
+        return
+    _last_redact = now
+    redacted = redact_finished(conn, now)
+    if redacted:
+        logger.debug("email_outbox: email removido de %d mensagens antigas", redacted)
+
+
+def submit(destinatario: str) -> Tuple[str, str, bool]:
+    """
+    Enfileira o TCLE, a menos que o destinatário já tenha um pedido válido na
+    janela. Devolve (id, estado, repetido). A verificação e a gravação rodam
+    na mesma transação, então pedidos simultâneos (de qualquer worker) geram
+    uma única mensagem.
+    """
+    rhash = recipient_hash(destinatario)
+    conn = _db()
+    _maybe_redact(conn)
+    existing = _recent_message(conn, rhash)
+    if existing is None:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            existing = _recent_message(conn, rhash)
+            if existing is None:
+                message_id = _insert(conn, destinatario, rhash, QUEUED)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    if existing is not None:
+        DEDUP_EVENTS.inc("duplicate")
+        return existing[0], existing[1], True
+    if DEDUP_WINDOW > 0:
+        _remember(rhash, message_id, time.time())
+    DEDUP_EVENTS.inc("new")
+    _wakeup.set()
+    return message_id, QUEUED, False
+
+
+def send_now(destinatario: str) -> Tuple[str, int, bool]:
+    """
+    Envio direto (EMAIL_OUTBOX=0) com a mesma deduplicação: o envio é
+    registrado na tabela, e chamadas simultâneas para o mesmo destinatário
+    neste processo esperam o envio em andamento em vez de repeti-lo.
+    Devolve (id, status do Brevo, repetido); repetições de um envio bem
+    sucedido devolvem 201.
+    """
+    rhash = recipient_hash(destinatario)
+    conn = _db()
+    _maybe_redact(conn)
+    existing = _recent_message(conn, rhash)
+    if existing is not None:
+        DEDUP_EVENTS.inc("duplicate")
+        return existing[0], 201, True
+
+    with _recent_lock:
+        # de novo sob a trava: um envio pode ter terminado (e sido lembrado)
+        # entre a verificação acima e aqui
+        entry = _recent.get(rhash)
+        if entry is not None and entry[0] > time.time():
+            DEDUP_EVENTS.inc("duplicate")
+            return entry[1], 201, True
+        future = _in_flight.get(rhash)
+        owner = future is None
+        if owner:
+            future = _in_flight[rhash] = Future()
+    if not owner:
+        DEDUP_EVENTS.inc("joined")
+        message_id, status = future.result()
+        return message_id, status, True
+
+    sent_id = None
+    try:
+        status, detalhe = email_sender.envia_tcle(destinatario)
+        ok = status == 201
+        message_id = _insert(_db(), destinatario, rhash, SENT if ok else FAILED, status, None if ok else detalhe)
+        if ok:
+            sent_id = message_id
+        future.set_result((message_id, status))
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _recent_lock:
+            # lembrado e retirado de _in_flight sob a mesma trava: quem chegar
+            # depois encontra um dos dois
+            if sent_id is not None and DEDUP_WINDOW > 0:
+                _remember_locked(rhash, sent_id, time.time())
+            _in_flight.pop(rhash, None)
+    DEDUP_EVENTS.inc("new")
+    return message_id, status, False
+
+
+def get_status(message_id: str) -> Optional[Dict[str, Any]]:
+    row = _db().execute(
+        "SELECT id, status, attempts, created_at, updated_at, provider_status, last_error FROM outbox WHERE id = ?",
+        (message_id,),
+    ).fetchone()
+    if row is None:
+        return None
+    keys = ("id", "status", "attempts", "created_at", "updated_at", "provider_status", "last_error")
+    return dict(zip(keys, row))
+
+
+def stats() -> Dict[str, int]:
+    """Quantidade de mensagens por estado (tabela de contagem, ver _init_counts)."""
+    rows = _db().execute("SELECT status, n FROM outbox_counts").fetchall()
+    return {QUEUED: 0, SENDING: 0, SENT: 0, FAILED: 0, **dict(rows)}
+
+
+def _claim() -> Optional[tuple]:
+    """Arrenda a próxima mensagem pronta (inclui 'sending' com lease vencido, de worker que caiu)."""
+    conn = _db()
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute(
+            "SELECT id, destinatario, attempts FROM outbox "
+            "WHERE status IN (?, ?) AND next_attempt_at <= ? AND lease_until <= ? "
+            "ORDER BY next_attempt_at LIMIT 1",
+            (QUEUED, SENDING, now, now),
+        ).fetchone()
+        if row is not None:
+            conn.execute(
+                "UPDATE outbox SET status = ?, lease_until = ?, updated_at = ? WHERE id = ?",
+                (SENDING, now + LEASE_SECONDS, now, row[0]),
+            )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return row
+
+
+def _is_transient(status: int) -> bool:
+    return status == email_sender.ERRO_REDE or status == 429 or status >= 500
+
+
+def _backoff(attempts: int) -> float:
+    delay = min(BACKOFF_MAX, BACKOFF_BASE * (2 ** max(0, attempts - 1)))
+    return delay * random.uniform(0.5, 1.0)
+
+
+def process_one() -> bool:
+    """Envia uma mensagem pronta, se houver. Retorna False se a caixa estiver vazia."""
+    claimed = _claim()
+    if claimed is None:
+        return False
+    message_id, destinatario, attempts = claimed
+    attempts += 1
+
+    _bucket.acquire()
+    status, detalhe = email_sender.envia_tcle(destinatario)
+
+    now = time.time()
+    if status == 201:
+        new_status, next_at, error = SENT, now, None
+    elif _is_transient(status) and attempts < MAX_ATTEMPTS:
+        new_status, next_at, error = QUEUED, now + _backoff(attempts), detalhe
+    else:
+        new_status, next_at, error = FAILED, now, detalhe
+        _forget(recipient_hash(destinatario))
+    _db().execute(
+        "UPDATE outbox SET status = ?, attempts = ?, next_attempt_at = ?, lease_until = 0, "
+        "updated_at = ?, provider_status = ?, last_error = ? WHERE id = ?",
+        (new_status, attempts, next_at, now, status, error[:500] if error else None, message_id),
+    )
+    if new_status != SENT:
+        logger.warning("Envio %s: tentativa %d -> %s (status %s)", message_id, attempts, new_status, status)
+    return True
+
+
+class _Worker(threading.Thread):
+    def __init__(self, index: int, stop: threading.Event):
+        super().__init__(name=f"email-outbox-{index}", daemon=True)
+        self._stop_event = stop
+
+    def run(self) -> None:
+        while not self._stop_event.is_set():
+            if not _leader.try_acquire():
+                self._stop_event.wait(POLL_INTERVAL)
+                continue
+            try:
+                if process_one():
+                    continue
+                _maybe_redact(_db())
+            except Exception:
+                logger.exception("Erro inesperado no worker da caixa de saída.")
+            _wakeup.wait(POLL_INTERVAL)
+            _wakeup.clear()
+
+
+_stop = threading.Event()
+_workers: List[_Worker] = []
+_leader = LeaderLock("email-outbox")
+
+
+def start_workers(n: int = WORKERS) -> None:
+    if _workers:
+        return
+    _stop.clear()
+    for i in range(max(1, n)):
+        worker = _Worker(i, _stop)
+        worker.start()
+        _workers.append(worker)
+    logger.info("Caixa de saída de email iniciada com %d workers (%.1f envios/s)", len(_workers), RATE_PER_SECOND)
+
+
+def stop_workers(timeout: float = 5.0) -> None:
+    _stop.set()
+    _wakeup.set()
+    for worker in _workers:
+        worker.join(timeout=timeout)
+    _workers.clear()
+    _leader.release()
@@ -2,11 +2,84 @@ import os
 import requests
 import json
 import base64
-from dotenv import load_dotenv
-load_dotenv()
+import logging
+import threading
+import requests.adapters
+from typing import Tuple
+from metrics import CALL_ERRORS, timed
 
+logger = logging.getLogger("email_sender")
 
-BREVO_API_URL = "https://api.brevo.com/v3/smtp/email"
+# BREVO_API_URL pode apontar para um stub local em testes (ver brevo_stub.py)
+BREVO_API_URL = os.getenv("BREVO_API_URL", "https://api.brevo.com/v3/smtp/email")
+BREVO_TIMEOUT = float(os.getenv("BREVO_TIMEOUT", "15"))
+ERRO_REDE = 0
+ERRO_CONFIG = -1
+CAMINHO_TCLE = os.getenv("TCLE_PDF_PATH", "./data/pdf/TCLE_assinado.pdf")
+
+ASSUNTO = ("Termo de Consentimento Livre e Esclarecido (TCLE) - "
+           "Pesquisa: Do jogo à realidade: a relação da metacognição no reconhecimento de fake news")
+TERMO_CONSENTIMENTO = (
+
+    """Olá! Você aceitou participar da pesquisa “Do jogo à realidade: a relação da metacognição no reconhecimento de fake news com uso da gamificação”
+
+        Em anexo segue sua via do TCLE com todos os detalhes da pesquisa. Em caso de dúvidas ou desistência em participar da pesquisa basta entrar em contato com a pesquisadora pelos meios abaixo."""
+)
+
+# Sessão HTTP persistente (keep-alive) com a API do Brevo
+_session = requests.Session()
+_session.mount("https://", requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=int(os.getenv("EMAIL_CONCURRENCY", "4"))))
+
+# Payload pré-serializado: só o destinatário é inserido a cada envio.
+# É refeito quando o PDF (mtime) ou o remetente mudam.
+_DESTINATARIO_MARCADOR = "\u0000destinatario\u0000"
+_template_lock = threading.Lock()
+_template = {"chave": None, "prefixo": b"", "sufixo": b""}
+
+
+def _monta_template(from_email: str) -> tuple:
+    """Carrega e codifica o PDF do TCLE e devolve (prefixo, sufixo) do JSON do payload."""
+    mtime = os.stat(CAMINHO_TCLE).st_mtime_ns
+    chave = (mtime, from_email)
+    if _template["chave"] == chave:
+        return _template["prefixo"], _template["sufixo"]
+
+    with _template_lock:
+        if _template["chave"] != chave:
+            with open(CAMINHO_TCLE, "rb") as f:
+                # O Brevo espera uma string base64
+                tcle_base64 = base64.b64encode(f.read()).decode("utf-8")
+
+            payload = {
+                "sender": {"email": from_email},
+                "to": [{"email": _DESTINATARIO_MARCADOR}],
+                "subject": ASSUNTO,
+                "textContent": TERMO_CONSENTIMENTO,
+                "htmlContent": TERMO_CONSENTIMENTO.replace("\n", "<br/>"),
+                "attachment": [
+                    {
+                        "content": tcle_base64,
+                        "name": "TCLE Pesquisa.pdf"
+                    }
+                ]
+            }
+            prefixo, sufixo = json.dumps(payload).split(json.dumps(_DESTINATARIO_MARCADOR))
+            _template.update(chave=chave, prefixo=prefixo.encode("utf-8"), sufixo=sufixo.encode("utf-8"))
+            logger.info("TCLE carregado de %s (%d bytes em base64)", CAMINHO_TCLE, len(tcle_base64))
+        return _template["prefixo"], _template["sufixo"]
+
+
+def preload_tcle() -> bool:
+    """Carrega e codifica o TCLE antecipadamente (chamado na inicialização)."""
+    from_email = os.getenv("EMAIL_FROM")
+    if not from_email:
+        return False
+    try:
+        _monta_template(from_email)
+        return True
+    except FileNotFoundError:
+        logger.error("Arquivo %s não encontrado para anexo.", CAMINHO_TCLE)
+        return False
 
 def envia_email_simples(destinatario: str) -> bool:
     """
@@ -18,6 +91,19 @@ def envia_email_simples(destinatario: str) -> bool:
     - BREVO_API_KEY: (a sua chave de API v3 do Brevo)
     
     Retorna True se enviado com sucesso, False caso contrário.
+    As métricas do envio ficam em envia_tcle ("brevo_send").
+    """
+    status, _ = envia_tcle(destinatario)
+    return status == 201
+
+@timed("brevo_send")
+def envia_tcle(destinatario: str) -> Tuple[int, str]:
+    """
+    Igual a envia_email_simples, mas devolve (status, detalhe) para quem
+    precisa decidir se vale tentar de novo (ver email_outbox.py):
+    - status HTTP do Brevo (201 = enviado);
+    - ERRO_REDE (0) para falhas de rede/timeout;
+    - ERRO_CONFIG (-1) para configuração ou anexo ausentes.
     """
     
     
@@ -25,46 +111,22 @@ def envia_email_simples(destinatario: str) -> bool:
     from_email = os.getenv("EMAIL_FROM")
 
     if not api_key:
-        print("Erro: Variável de ambiente BREVO_API_KEY não configurada.")
-        return False
+        detalhe = "Erro: Variável de ambiente BREVO_API_KEY não configurada."
+        logger.error(detalhe)
+        return ERRO_CONFIG, detalhe
     if not from_email:
-        print("Erro: Variável de ambiente EMAIL_FROM não configurada.")
-        return False
+        detalhe = "Erro: Variável de ambiente EMAIL_FROM não configurada."
+        logger.error(detalhe)
+        return ERRO_CONFIG, detalhe
     
-    caminho_tcle = "./data/pdf/TCLE_assinado.pdf"
     try:
-        with open(caminho_tcle, "rb") as f:
-            conteudo_binario = f.read()
-            # O Brevo espera uma string base64
-            tcle_base64 = base64.b64encode(conteudo_binario).decode("utf-8")
+        prefixo, sufixo = _monta_template(from_email)
     except FileNotFoundError:
-        print(f"Erro: Arquivo {caminho_tcle} não encontrado para anexo.")
-        return False
+        detalhe = f"Erro: Arquivo {CAMINHO_TCLE} não encontrado para anexo."
+        logger.error(detalhe)
+        return ERRO_CONFIG, detalhe
 
-    
-    assunto = ("Termo de Consentimento Livre e Esclarecido (TCLE) - "
-               "Pesquisa: Do jogo à realidade: a relação da metacognição no reconhecimento de fake news")
-    termo_consentimento = (
-
-        """Olá! Você aceitou participar da pesquisa “Do jogo à realidade: a relação da metacognição no reconhecimento de fake news com uso da gamificação”
-
-        Em anexo segue sua via do TCLE com todos os detalhes da pesquisa. Em caso de dúvidas ou desistência em participar da pesquisa basta entrar em contato com a pesquisadora pelos meios abaixo."""
-    )
-
-    
-    payload = {
-        "sender": {"email": from_email},
-        "to": [{"email": destinatario}],
-        "subject": assunto,
-        "textContent": termo_consentimento, 
-        "htmlContent": termo_consentimento.replace("\n", "<br/>"), 
-        "attachment": [
-            {
-                "content": tcle_base64,
-                "name": "TCLE Pesquisa.pdf" 
-            }
-        ]
-    }
+    corpo = prefixo + json.dumps(destinatario).encode("utf-8") + sufixo
 
     
     headers = {
@@ -73,24 +135,25 @@ def envia_email_simples(destinatario: str) -> bool:
         "Accept": "application/json"
     }
 
-    print(f"Tentando enviar e-mail para {destinatario} via Brevo API...")
+    logger.debug("Tentando enviar e-mail para %s via Brevo API...", destinatario)
 
     try:
-        resp = requests.post(BREVO_API_URL, headers=headers, data=json.dumps(payload), timeout=15)
+        resp = _session.post(BREVO_API_URL, headers=headers, data=corpo, timeout=BREVO_TIMEOUT)
         
         # O Brevo retorna 201 (Created) em caso de sucesso no envio da API
         if resp.status_code == 201:
-            print(f"Email enviado com sucesso para {destinatario} (status {resp.status_code})")
-            return True
+            logger.debug("Email enviado com sucesso para %s (status %d)", destinatario, resp.status_code)
+            return resp.status_code, resp.text
         else:
             # Log útil para depuração
             body_text = resp.text
-            print(f"Falha ao enviar email para {destinatario}: status {resp.status_code} - {body_text}")
-            return False
+            CALL_ERRORS.inc("brevo_send", f"http_{resp.status_code}")
+            logger.warning("Falha ao enviar email para %s: status %d - %s", destinatario, resp.status_code, body_text)
+            return resp.status_code, body_text
             
     except requests.RequestException as e:
-        print(f"Erro de rede ao tentar enviar email para {destinatario}: {e}")
-        return False
+        logger.warning("Erro de rede ao tentar enviar email para %s: %s", destinatario, e)
+        return ERRO_REDE, str(e)
     except Exception as e:
-        print(f"Erro inesperado ao enviar email para {destinatario}: {e}")
-        return False
\ No newline at end of file
+        logger.exception("Erro inesperado ao enviar email para %s", destinatario)
+        return ERRO_CONFIG, str(e)
@@ -0,0 +1,127 @@
+# server/export.py
+"""
+export.py
+Exportação das respostas coletadas em CSV, NDJSON ou Parquet.
+
+Os formatos são gerados por geradores que leem o store página por página
+(storage.ResponseStore.iter_pages), então a memória fica constante não
+importa quantos participantes existam. As colunas seguem o layout de
+survey_schema (o mesmo de append_full_response).
+Parquet depende do pacote opcional pyarrow.
+"""
+
+import io
+import csv
+import logging
+from typing import Any, Iterator, List, Optional
+
+import orjson
+
+from survey_schema import HEADER, SCHEMA, ROW_LENGTH
+
+logger = logging.getLogger("export")
+
+FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+# colunas numéricas no Parquet: blocos de respostas e qap_sum
+_INT_COLUMNS = {
+    h for col in SCHEMA if col.is_block or col.key == "qap_sum" for h in col.headers()
+}
+
+
+def _fit(row: List[Any]) -> List[Any]:
+    """Completa/corta a linha no tamanho do layout (a planilha omite células vazias no fim)."""
+    if len(row) < ROW_LENGTH:
+        return row + [""] * (ROW_LENGTH - len(row))
+    return row[:ROW_LENGTH]
+
+
+def iter_csv(pages: Iterator[List[List[Any]]]) -> Iterator[bytes]:
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(HEADER)
+    for page in pages:
+        writer.writerows(_fit(r) for r in page)
+        yield buf.getvalue().encode("utf-8")
+        buf.seek(0)
+        buf.truncate()
+    if buf.tell():
+        yield buf.getvalue().encode("utf-8")
+
+
+def iter_ndjson(pages: Iterator[List[List[Any]]]) -> Iterator[bytes]:
+    for page in pages:
+        yield b"".join(orjson.dumps(dict(zip(HEADER, _fit(r)))) + b"\n" for r in page)
+
+
+def _to_int(v: Any) -> Optional[int]:
+    if v is None or v == "":
+        return None
+    try:
+        return int(v)
+    except (TypeError, ValueError):
+        return None
+
+
+class _ChunkSink(io.RawIOBase):
+    """Arquivo em memória que entrega o que foi escrito desde a última leitura."""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        self._chunks.append(bytes(b))
+        return len(b)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def parquet_available() -> bool:
+    try:
+        import pyarrow  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def iter_parquet(pages: Iterator[List[List[Any]]]) -> Iterator[bytes]:
+    """Um row group por página; os bytes saem à medida que cada grupo é escrito."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([(h, pa.int32() if h in _INT_COLUMNS else pa.string()) for h in HEADER])
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema)
+    try:
+        for page in pages:
+            rows = [_fit(r) for r in page]
+            arrays = []
+            for i, h in enumerate(HEADER):
+                if h in _INT_COLUMNS:
+                    arrays.append(pa.array([_to_int(r[i]) for r in rows], type=pa.int32()))
+                else:
+                    arrays.append(pa.array(["" if r[i] is None else str(r[i]) for r in rows], type=pa.string()))
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            chunk = sink.drain()
+            if chunk:
+                yield chunk
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+_GENERATORS = {"csv": iter_csv, "ndjson": iter_ndjson, "parquet": iter_parquet}
+
+
+def stream(fmt: str, pages: Iterator[List[List[Any]]]) -> Iterator[bytes]:
+    return _GENERATORS[fmt](pages)
@@ -2,16 +2,26 @@
 """
 g_sheets.py (com logs)
 Utilitário para gravar UMA LINHA por usuário no Google Sheets.
+
+O cliente do Google (google-auth, googleapiclient, httplib2) só é importado
+na primeira chamada à API (ou no warmup), para não pesar no cold start.
 """
 
 import os
 import json
 import logging
-from typing import List, Sequence, Any, Optional, Dict
-from google.oauth2.service_account import Credentials
-from googleapiclient.discovery import build
+import threading
+import time
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Collection, List, Sequence, Any, Optional, Dict
 from googleapiclient.errors import HttpError
 from datetime import datetime
+from metrics import timed
+import resilience
+from survey_schema import build_row, header_row, safe_cell as _safe
+
+if TYPE_CHECKING:
+    from google.auth.credentials import Credentials
 
 # --- logging setup (controlável por env LOG_LEVEL) ---
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
@@ -22,11 +32,32 @@ SCOPES = ["https://www.googleapis.com/auth/spreadsheets"]
 SPREADSHEET_ID = os.getenv("SPREADSHEET_ID")  # obrigatória
 DEFAULT_TAB = os.getenv("SHEET_TAB", "Respostas")  # aba padrão se quiser configurar
 
-def _get_service():
-    logger.debug("Entrando em _get_service()")
+# --- cliente Google Sheets compartilhado pelo processo ---
+# As credenciais e o documento de discovery são carregados uma única vez.
+# httplib2.Http não é thread-safe, então cada thread mantém o seu próprio
+# serviço (e pool de conexões keep-alive), todos usando as mesmas credenciais.
+TOKEN_REFRESH_MARGIN = int(os.getenv("SHEETS_TOKEN_REFRESH_MARGIN", "300"))  # segundos antes de expirar
+HTTP_TIMEOUT = float(os.getenv("SHEETS_HTTP_TIMEOUT", "30"))
+# endpoint alternativo da API (ex.: sheets_stub.py em benchmarks); sem service account configurado
+# as chamadas vão sem autenticação
+API_ENDPOINT = os.getenv("SHEETS_API_ENDPOINT")
+
+_client_lock = threading.Lock()
+_client_local = threading.local()
+_credentials: Optional["Credentials"] = None
+_discovery_doc: Optional[str] = None
+_client_stats = {"cache_hits": 0, "cache_misses": 0, "token_refreshes": 0, "token_refresh_errors": 0}
+_stats_lock = threading.Lock()
+
+
+def _bump(name: str, n: int = 1) -> None:
+    with _stats_lock:
+        _client_stats[name] += n
+
+
+def _load_creds_info() -> dict:
     sa_json = os.getenv("GOOGLE_SA_JSON")
     sa_path = os.getenv("GOOGLE_SA_JSON_PATH")  # se você subir arquivo e apontar o caminho
-    creds_info = None
 
     try:
         if sa_path:
@@ -34,11 +65,11 @@ def _get_service():
             if not os.path.exists(sa_path):
                 raise RuntimeError(f"GOOGLE_SA_JSON_PATH apontado mas arquivo não existe: {sa_path}")
             with open(sa_path, "r", encoding="utf-8") as f:
-                creds_info = json.load(f)
+                return json.load(f)
         elif sa_json:
             logger.debug("Usando GOOGLE_SA_JSON (string JSON)")
             try:
-                creds_info = json.loads(sa_json)
+                return json.loads(sa_json)
             except json.JSONDecodeError as e:
                 logger.error("Falha ao decodificar GOOGLE_SA_JSON: %s", e)
                 raise RuntimeError("GOOGLE_SA_JSON não contém um JSON válido.") from e
@@ -48,196 +79,353 @@ def _get_service():
         logger.exception("Erro ao carregar credenciais do service account.")
         raise
 
-    try:
-        creds = Credentials.from_service_account_info(creds_info, scopes=SCOPES)
-        service = build("sheets", "v4", credentials=creds, cache_discovery=False)
-        logger.debug("Serviço Google Sheets inicializado com sucesso.")
+
+def _token_needs_refresh(creds: "Credentials") -> bool:
+    from google.auth.credentials import AnonymousCredentials
+
+    if isinstance(creds, AnonymousCredentials):
+        return False
+    if not creds.token or creds.expiry is None:
+        return True
+    # creds.expiry é naive em UTC (convenção do google-auth)
+    remaining = (creds.expiry - datetime.utcnow()).total_seconds()
+    return remaining <= TOKEN_REFRESH_MARGIN
+
+
+def _get_credentials() -> "Credentials":
+    """Devolve as credenciais do processo, renovando o token antes de expirar."""
+    global _credentials
+    creds = _credentials
+    if creds is not None and not _token_needs_refresh(creds):
+        return creds
+
+    import google_auth_httplib2
+    import httplib2
+    from google.auth.credentials import AnonymousCredentials
+    from google.oauth2.service_account import Credentials
+
+    with _client_lock:
+        if _credentials is None:
+            if API_ENDPOINT and not (os.getenv("GOOGLE_SA_JSON") or os.getenv("GOOGLE_SA_JSON_PATH")):
+                logger.warning("SHEETS_API_ENDPOINT=%s sem service account: chamadas sem autenticação.", API_ENDPOINT)
+                _credentials = AnonymousCredentials()
+            else:
+                _credentials = Credentials.from_service_account_info(_load_creds_info(), scopes=SCOPES)
+        creds = _credentials
+        if _token_needs_refresh(creds):
+            try:
+                creds.refresh(google_auth_httplib2.Request(httplib2.Http(timeout=HTTP_TIMEOUT)))
+                _bump("token_refreshes")
+                logger.debug("Token OAuth renovado; expira em %s", creds.expiry)
+            except Exception:
+                _bump("token_refresh_errors")
+                logger.exception("Falha ao renovar token OAuth do service account.")
+                raise
+    return creds
+
+
+def _get_discovery_doc() -> str:
+    global _discovery_doc
+    if _discovery_doc is None:
+        with _client_lock:
+            if _discovery_doc is None:
+                from googleapiclient import discovery_cache
+
+                doc = discovery_cache.get_static_doc("sheets", "v4")
+                if doc is None:
+                    raise RuntimeError("Documento de discovery do Sheets v4 não encontrado.")
+                _discovery_doc = doc
+    return _discovery_doc
+
+
+def _get_service():
+    creds = _get_credentials()
+    service = getattr(_client_local, "service", None)
+    if service is not None:
+        _bump("cache_hits")
         return service
+
+    logger.debug("Criando cliente Google Sheets para a thread %s", threading.current_thread().name)
+    import google_auth_httplib2
+    import httplib2
+    from googleapiclient.discovery import build_from_document
+
+    try:
+        http = google_auth_httplib2.AuthorizedHttp(creds, http=httplib2.Http(timeout=HTTP_TIMEOUT))
+        client_options = {"api_endpoint": API_ENDPOINT} if API_ENDPOINT else None
+        service = build_from_document(_get_discovery_doc(), http=http, client_options=client_options)
     except Exception:
         logger.exception("Erro ao criar cliente Google Sheets (Credentials/build).")
         raise
-
-def _now_iso():
-    return datetime.utcnow().isoformat() + "Z"
-
-def _safe(v: Any) -> str:
-    """Converte valor para string segura para planilha (vazio para None)."""
-    if v is None:
-        return ""
-    if isinstance(v, bool):
-        return "1" if v else "0"
-    if isinstance(v, (int, float)):
-        return str(v)
-    # para strings: strip e retornar
-    s = str(v).strip()
-    return s
+    _client_local.service = service
+    _bump("cache_misses")
+    logger.debug("Serviço Google Sheets inicializado com sucesso.")
+    return service
+
+
+def warm_up(build_service: bool = True) -> None:
+    """
+    Carrega credenciais (com token válido) e o documento de discovery antes
+    da primeira requisição. Com build_service=True cria também o cliente da
+    thread atual; antes de um fork use False (conexões não podem ser herdadas).
+    """
+    _get_credentials()
+    _get_discovery_doc()
+    if build_service:
+        _get_service()
+
+
+def _set_http_timeout(request, seconds: float) -> None:
+    """
+    Timeout de socket da próxima tentativa: min(HTTP_TIMEOUT, o que resta do
+    prazo da chamada). Vale também para conexões keep-alive já abertas.
+    """
+    http = getattr(request.http, "http", request.http)  # AuthorizedHttp -> httplib2.Http
+    timeout = min(HTTP_TIMEOUT, seconds)
+    http.timeout = timeout
+    for conn in getattr(http, "connections", {}).values():
+        conn.timeout = timeout
+        if getattr(conn, "sock", None) is not None:
+            conn.sock.settimeout(timeout)
+
+
+def _execute(op: str, request, idempotent: bool = True) -> dict:
+    """
+    Executa um HttpRequest da API com retry/backoff e circuit breaker
+    (resilience.py). SHEETS_CALL_DEADLINE limita a chamada inteira, inclusive
+    cada tentativa HTTP, e não só as esperas entre elas. Requisições não
+    idempotentes (values().append) não são repetidas depois de uma falha
+    que pode ter sido aplicada.
+    """
+    return resilience.call(op, request.execute, set_timeout=lambda seconds: _set_http_timeout(request, seconds),
+                           idempotent=idempotent)
+
+
+def is_quota_error(exc: BaseException) -> bool:
+    """True se a falha (ou sua causa) for um HttpError 429/503 (quota ou sobrecarga)."""
+    while exc is not None:
+        if isinstance(exc, HttpError):
+            return getattr(exc.resp, "status", None) in (429, 503)
+        exc = exc.__cause__
+    return False
+
+
+def get_client_stats() -> Dict[str, int]:
+    """Contadores do cliente compartilhado (cache hits/misses e renovações de token)."""
+    with _stats_lock:
+        return dict(_client_stats)
+
+# --- cache local de leituras (read-through, TTL + LRU) ---
+# Escritas feitas por este processo (set_cell_value/append_rows) atualizam ou
+# invalidam o cache. Alterações feitas por fora (outro worker, edição manual
+# na planilha) só aparecem depois do TTL.
+READ_CACHE_TTL = float(os.getenv("SHEETS_READ_CACHE_TTL", "30"))
+READ_CACHE_SIZE = int(os.getenv("SHEETS_READ_CACHE_SIZE", "256"))
+ROW_COUNT_TTL = float(os.getenv("SHEETS_ROW_COUNT_TTL", "300"))
+
+
+class _ReadCache:
+    def __init__(self, ttl: float, max_size: int):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._data: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    def get(self, key: tuple) -> Any:
+        """Devolve o valor em cache ou _MISS."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    del self._data[key]
+                self.stats["misses"] += 1
+                return _MISS
+            self._data.move_to_end(key)
+            self.stats["hits"] += 1
+            return entry[1]
+
+    def put(self, key: tuple, value: Any, ttl: Optional[float] = None) -> None:
+        expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def update(self, key: tuple, fn) -> bool:
+        """Aplica fn ao valor em cache (sem renovar o TTL). Retorna False se não houver valor válido."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                return False
+            self._data[key] = (entry[0], fn(entry[1]))
+            return True
+
+    def invalidate_tab(self, tab_name: str, keep: tuple = ()) -> None:
+        with self._lock:
+            for key in [k for k in self._data if k[0] == tab_name and k not in keep]:
+                del self._data[key]
+                self.stats["invalidations"] += 1
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self.stats, "size": len(self._data)}
+
+
+_MISS = object()
+_read_cache = _ReadCache(READ_CACHE_TTL, READ_CACHE_SIZE)
+
+
+def get_cache_stats() -> Dict[str, int]:
+    """Hits/misses/evictions do cache de leituras (inclui contagem de linhas)."""
+    return _read_cache.snapshot()
+
+
+def clear_read_cache() -> None:
+    with _read_cache._lock:
+        _read_cache._data.clear()
 
 def append_row(tab_name: str, values: Sequence[Any], value_input_option: str = "RAW") -> dict:
     """Append uma linha (values) ao tab_name e retorna a resposta da API."""
-    logger.info("append_row: tab=%s len_values=%d", tab_name, len(values) if values is not None else 0)
+    return append_rows(tab_name, [values], value_input_option=value_input_option)
+
+@timed("sheets_append")
+def append_rows(tab_name: str, rows: Sequence[Sequence[Any]], value_input_option: str = "RAW") -> dict:
+    """Append várias linhas ao tab_name em UMA requisição e retorna a resposta da API."""
+    logger.debug("append_rows: tab=%s n_rows=%d", tab_name, len(rows))
     if not SPREADSHEET_ID:
         logger.error("SPREADSHEET_ID não configurado.")
         raise RuntimeError("SPREADSHEET_ID não configurado.")
     try:
         service = _get_service()
     except Exception as e:
-        logger.exception("append_row: falha ao obter serviço.")
+        logger.exception("append_rows: falha ao obter serviço.")
         raise
 
     range_name = f"{tab_name}!A:Z"
-    body = {"values": [list(values)]}
-    logger.debug("append_row: range=%s body_preview=%s", range_name, json.dumps(body["values"][0][:10], ensure_ascii=False))
+    body = {"values": [list(values) for values in rows]}
+    if body["values"] and logger.isEnabledFor(logging.DEBUG):
+        logger.debug("append_rows: range=%s body_preview=%s", range_name, json.dumps(body["values"][0][:10], ensure_ascii=False))
     try:
-        result = service.spreadsheets().values().append(
+        result = _execute("sheets_append", service.spreadsheets().values().append(
             spreadsheetId=SPREADSHEET_ID,
             range=range_name,
             valueInputOption=value_input_option,
             insertDataOption="INSERT_ROWS",
             body=body
-        ).execute()
-        logger.info("append_row: sucesso, updates=%s", result.get("updates"))
+        ), idempotent=False)
+        logger.debug("append_rows: sucesso, updates=%s", result.get("updates"))
+        # a contagem local de linhas acompanha o append; leituras da aba são invalidadas
+        count_key = (tab_name, "#rows")
+        added = (result.get("updates") or {}).get("updatedRows", len(rows))
+        _read_cache.invalidate_tab(tab_name, keep=(count_key,))
+        _read_cache.update(count_key, lambda n: n + added)
         return result
     except HttpError as e:
         # log detalhado do HttpError
-        logger.exception("Google Sheets API error durante append_row: %s", e)
+        logger.exception("Google Sheets API error durante append_rows: %s", e)
         raise RuntimeError(f"Google Sheets API error: {e}") from e
     except Exception:
-        logger.exception("Erro inesperado em append_row")
+        logger.exception("Erro inesperado em append_rows")
         raise
 
-def append_full_response(payload: Dict[str, Any], tab_name: str = DEFAULT_TAB) -> dict:
-    logger.info("append_full_response: iniciando. tab=%s", tab_name)
+def build_full_row(payload: Dict[str, Any], coerced: Collection[str] = ()) -> List[Any]:
+    """
+    Valida o payload e monta a linha completa (timestamp + 79 colunas) a partir
+    do schema em survey_schema.py. `coerced` lista blocos já convertidos para int.
+    """
     # Log parcial do payload (não logar tudo em produção)
-    try:
+    if logger.isEnabledFor(logging.DEBUG):
         logger.debug("payload keys: %s", list(payload.keys()))
-    except Exception:
-        logger.debug("append_full_response: não foi possível logar payload keys")
-
-    # campos básicos
-    idade = payload.get("idade", "")
-    genero = payload.get("genero", "")
-    etnia = payload.get("etnia", "")
-    escolaridade = payload.get("escolaridade", "")
-    estado = payload.get("estado", "")
-    autodeclaracao = payload.get("autodeclaracao", "")
-    atencao1 = payload.get("atencao1", "")
-    atencao2 = payload.get("atencao2", "")
-    exited_fullscreen = payload.get("exited_fullscreen", False)
-    had_inactivity = payload.get("had_inactivity", False)
-
-    # QAP: 37 respostas
-    qap = payload.get("qap_responses")
-    if qap is None or not isinstance(qap, (list, tuple)) or len(qap) != 37:
-        logger.error("Validação QAP falhou: tipo=%s len=%s", type(qap), len(qap) if qap is not None else None)
-        raise ValueError("Campo 'qap_responses' deve ser lista com 37 elementos.")
-    qap_vals = [int(x) if x is not None and x != "" else "" for x in qap]
-
-    # qap_sum: opcional
-    qap_sum = payload.get("qap_sum")
-    if qap_sum is None:
-        try:
-            qap_sum = sum([int(x) for x in qap if isinstance(x, (int, float, str)) and str(x).strip() != ""])
-        except Exception:
-            logger.exception("Erro ao calcular qap_sum dinamicamente.")
-            raise
-    else:
-        qap_sum = int(qap_sum)
-
-    # Wiscosin: 5 respostas (corrigido para 5)
-    wisc = payload.get("wisconsin")
-    if wisc is None or not isinstance(wisc, (list, tuple)) or len(wisc) != 5:
-        logger.error("Validação Wiscosin falhou: tipo=%s len=%s", type(wisc), len(wisc) if wisc is not None else None)
-        raise ValueError("Campo 'wisconsin' deve ser lista com 9 elementos.")
-    wisc_vals = [int(x) if x is not None and x != "" else "" for x in wisc]
-
-    # Noticias: first and second (12 cada)
-    news_first = payload.get("news_first")
-    news_second = payload.get("news_second")
-    if news_first is None or not isinstance(news_first, (list, tuple)) or len(news_first) != 12:
-        logger.error("Validação news_first falhou: tipo=%s len=%s", type(news_first), len(news_first) if news_first is not None else None)
-        raise ValueError("Campo 'news_first' deve ser lista com 12 elementos.")
-    if news_second is None or not isinstance(news_second, (list, tuple)) or len(news_second) != 12:
-        logger.error("Validação news_second falhou: tipo=%s len=%s", type(news_second), len(news_second) if news_second is not None else None)
-        raise ValueError("Campo 'news_second' deve ser lista com 12 elementos.")
-    news_first_vals = [int(x) if x is not None and x != "" else "" for x in news_first]
-    news_second_vals = [int(x) if x is not None and x != "" else "" for x in news_second]
-
-    # game and time
-    game = payload.get("game", "")
-    game_time = payload.get("game_time_seconds", "")
-
-    # timestamp opcional
-    timestamp = payload.get("timestamp", _now_iso())
-
-    # montar a linha na ordem exata pedida
-    row: List[Any] = []
-    row.append((idade))
-    row.append(_safe(genero))
-    row.append(_safe(etnia))
-    row.append(_safe(escolaridade))
-    row.append(_safe(estado))
-
-    # QAP 37
-    row.extend([(v) for v in qap_vals])  
-
-    # QAP sum
-    row.append(qap_sum)
-    # QAP autodeclaração
-    row.append(autodeclaracao)
-
-    # Wiscosin 9
-    row.extend([(v) for v in wisc_vals])  
-
-    # News first 12
-    row.extend([(v) for v in news_first_vals])  
-
-    # News second 12
-    row.extend([(v) for v in news_second_vals])  
-
-    # game
-    game = "badnews" if game == "par" else "pacman"
-    row.append(_safe(game))
-
-    # game time
-    row.append(game_time)
-    # Atenção 1 e 2
-    row.append(_safe("sim" if atencao1 else "não"))
-    row.append(_safe("sim" if atencao2 else "não"))
-    # Saída do fullscreen
-    row.append(_safe("não" if exited_fullscreen else "sim"))
-    # Inatividade (> 4 minutos sem interagir)
-    row.append(_safe("não" if had_inactivity else "sim"))
-
-    expected_len = 79
-    logger.debug("Linha montada length=%d expected=%d", len(row), expected_len)
-    if len(row) != expected_len:
-        logger.error("Comprimento da linha inválido: %d (esperado %d). Payload keys: %s", len(row), expected_len, list(payload.keys()))
-        raise RuntimeError(f"Comprimento da linha inválido: {len(row)} (esperado {expected_len}). Verifique os campos do payload.")
-
-    # opcional: prepend timestamp como coluna A
-    row = [_safe(timestamp)] + row
+    try:
+        return build_row(payload, coerced)
+    except ValueError as e:
+        logger.error("Validação do payload falhou: %s", e)
+        raise
+
+def append_full_response(payload: Dict[str, Any], tab_name: str = DEFAULT_TAB, coerced: Collection[str] = ()) -> dict:
+    logger.debug("append_full_response: iniciando. tab=%s", tab_name)
+    row = build_full_row(payload, coerced)
 
     # enviar ao Google Sheets
     try:
-        logger.info("Enviando linha para planilha tab=%s SPREADSHEET_ID=%s", tab_name, "set" if SPREADSHEET_ID else "unset")
+        logger.debug("Enviando linha para planilha tab=%s SPREADSHEET_ID=%s", tab_name, "set" if SPREADSHEET_ID else "unset")
         result = append_row(tab_name, row, value_input_option="RAW")
-        logger.info("append_full_response: OK, result=%s", result.get("updates") if isinstance(result, dict) else str(result))
+        logger.debug("append_full_response: OK, result=%s", result.get("updates") if isinstance(result, dict) else str(result))
         return result
     except Exception as e:
         logger.exception("Erro ao gravar linha no Google Sheets: %s", e)
         raise RuntimeError(f"Erro ao gravar linha no Google Sheets: {e}") from e
 
-def count_rows(tab_name: str = "Respostas") -> int:
+@timed("sheets_write_header")
+def write_header_row(tab_name: str = DEFAULT_TAB) -> dict:
+    """Grava o cabeçalho gerado pelo schema (survey_schema.HEADER) na linha 1 da aba."""
+    logger.info("write_header_row: tab=%s", tab_name)
+    if not SPREADSHEET_ID:
+        logger.error("write_header_row: SPREADSHEET_ID não configurado.")
+        raise RuntimeError("SPREADSHEET_ID não configurado.")
+    service = _get_service()
+    try:
+        return _execute("sheets_write_header", service.spreadsheets().values().update(
+            spreadsheetId=SPREADSHEET_ID,
+            range=f"{tab_name}!A1",
+            valueInputOption="RAW",
+            body={"values": [header_row()]}
+        ))
+    except HttpError as e:
+        logger.exception("write_header_row: HttpError ao escrever cabeçalho")
+        raise RuntimeError(f"Erro ao escrever cabeçalho em {tab_name}: {e}") from e
+
+def column_letter(n: int) -> str:
+    """Letra da coluna (1-based): 1 -> A, 26 -> Z, 80 -> CB."""
+    letters = ""
+    while n > 0:
+        n, rem = divmod(n - 1, 26)
+        letters = chr(65 + rem) + letters
+    return letters
+
+@timed("sheets_get_rows")
+def get_rows(tab_name: str, start_row: int, count: int, n_cols: int) -> List[List[Any]]:
+    """Lê `count` linhas a partir de start_row (1-based), colunas A até n_cols."""
+    logger.debug("get_rows: tab=%s start=%d count=%d", tab_name, start_row, count)
+    if not SPREADSHEET_ID:
+        logger.error("get_rows: SPREADSHEET_ID não configurado.")
+        raise RuntimeError("SPREADSHEET_ID não configurado.")
+    service = _get_service()
+    range_name = f"{tab_name}!A{start_row}:{column_letter(n_cols)}{start_row + count - 1}"
+    try:
+        result = _execute("sheets_get_rows", service.spreadsheets().values().get(spreadsheetId=SPREADSHEET_ID, range=range_name))
+        return result.get("values", [])
+    except HttpError as e:
+        logger.exception("get_rows: HttpError ao ler %s", range_name)
+        raise RuntimeError(f"Erro ao ler linhas de {tab_name}: {e}") from e
+
+@timed("sheets_count_rows")
+def count_rows(tab_name: str = "Respostas", use_cache: bool = True) -> int:
+    """
+    Número de linhas preenchidas na coluna A. A coluna inteira só é lida na
+    primeira chamada (e depois de SHEETS_ROW_COUNT_TTL); entre uma leitura e
+    outra a contagem é mantida localmente a cada append_rows.
+    """
     logger.debug("count_rows: tab=%s", tab_name)
     if not SPREADSHEET_ID:
         logger.error("count_rows: SPREADSHEET_ID não definido.")
         raise RuntimeError("SPREADSHEET_ID não definido.")
+    count_key = (tab_name, "#rows")
+    if use_cache:
+        cached = _read_cache.get(count_key)
+        if cached is not _MISS:
+            return cached
     try:
         service = _get_service()
         range_name = f"{tab_name}!A:A"
-        result = service.spreadsheets().values().get(spreadsheetId=SPREADSHEET_ID, range=range_name).execute()
+        result = _execute("sheets_count_rows", service.spreadsheets().values().get(spreadsheetId=SPREADSHEET_ID, range=range_name))
         values = result.get("values", [])
         logger.debug("count_rows: encontrado %d linhas", len(values))
+        _read_cache.put(count_key, len(values), ttl=ROW_COUNT_TTL)
         return len(values)
     except HttpError as e:
         logger.exception("count_rows: HttpError")
@@ -246,27 +434,37 @@ def count_rows(tab_name: str = "Respostas") -> int:
         logger.exception("count_rows: erro inesperado")
         raise
 
-def get_cell_value(tab_name: str, cell: str = "A1") -> Optional[str]:
+@timed("sheets_get_cell")
+def get_cell_value(tab_name: str, cell: str = "A1", use_cache: bool = True) -> Optional[str]:
+    """Lê uma célula; com use_cache=False ignora o cache (leituras que precisam estar atualizadas)."""
     logger.debug("get_cell_value: tab=%s cell=%s", tab_name, cell)
     if not SPREADSHEET_ID:
         logger.error("get_cell_value: SPREADSHEET_ID não configurado.")
         raise RuntimeError("SPREADSHEET_ID não configurado.")
+    key = (tab_name, cell)
+    if use_cache:
+        cached = _read_cache.get(key)
+        if cached is not _MISS:
+            return cached
     service = _get_service()
     range_name = f"{tab_name}!{cell}"
     try:
-        result = service.spreadsheets().values().get(spreadsheetId=SPREADSHEET_ID, range=range_name).execute()
+        result = _execute("sheets_get_cell", service.spreadsheets().values().get(spreadsheetId=SPREADSHEET_ID, range=range_name))
         values = result.get("values", [])
         if not values or not values[0]:
             logger.debug("get_cell_value: célula vazia")
+            _read_cache.put(key, "")
             return ""
         logger.debug("get_cell_value: valor='%s'", values[0][0])
+        _read_cache.put(key, values[0][0])
         return values[0][0]
     except HttpError as e:
         logger.exception("Erro ao ler célula %s em %s: %s", cell, tab_name, e)
         raise RuntimeError(f"Erro ao ler célula {cell} em {tab_name}: {e}") from e
 
+@timed("sheets_set_cell")
 def set_cell_value(tab_name: str, cell: str, value: Any) -> dict:
-    logger.info("set_cell_value: tab=%s cell=%s value_preview=%s", tab_name, cell, str(value)[:100])
+    logger.debug("set_cell_value: tab=%s cell=%s value=%r", tab_name, cell, value)
     if not SPREADSHEET_ID:
         logger.error("set_cell_value: SPREADSHEET_ID não configurado.")
         raise RuntimeError("SPREADSHEET_ID não configurado.")
@@ -274,22 +472,24 @@ def set_cell_value(tab_name: str, cell: str, value: Any) -> dict:
     range_name = f"{tab_name}!{cell}"
     body = {"values": [[_safe(value)]]}
     try:
-        result = service.spreadsheets().values().update(
+        result = _execute("sheets_set_cell", service.spreadsheets().values().update(
             spreadsheetId=SPREADSHEET_ID,
             range=range_name,
             valueInputOption="RAW",
             body=body
-        ).execute()
+        ))
         logger.debug("set_cell_value: resultado=%s", result)
+        _read_cache.put((tab_name, cell), body["values"][0][0])
         return result
     except HttpError as e:
         logger.exception("set_cell_value: HttpError ao escrever célula")
         raise RuntimeError(f"Erro ao escrever célula {cell} em {tab_name}: {e}") from e
 
+@timed("sheets_increment_counter")
 def increment_counter(tab_name: str = "counter", cell: str = "A1") -> int:
-    logger.info("increment_counter: tab=%s cell=%s", tab_name, cell)
-    # ler
-    raw = get_cell_value(tab_name, cell)
+    logger.debug("increment_counter: tab=%s cell=%s", tab_name, cell)
+    # ler (sem cache: o valor precisa estar atualizado)
+    raw = get_cell_value(tab_name, cell, use_cache=False)
     logger.debug("increment_counter: raw='%s'", raw)
     try:
         current = int(str(raw).strip()) if str(raw).strip() != "" else 0
@@ -300,7 +500,7 @@ def increment_counter(tab_name: str = "counter", cell: str = "A1") -> int:
     new = current + 1
     try:
         set_cell_value(tab_name, cell, new)
-        logger.info("increment_counter: novo valor=%d", new)
+        logger.debug("increment_counter: novo valor=%d", new)
         return new
     except Exception:
         logger.exception("increment_counter: falha ao escrever novo valor")
@@ -0,0 +1,44 @@
+# server/gunicorn_conf.py
+"""
+gunicorn_conf.py
+Modo multi-worker: vários processos uvicorn atrás do gunicorn, um por core.
+
+Uso:
+    gunicorn -c gunicorn_conf.py main:app
+    WEB_CONCURRENCY=4 PORT=8000 gunicorn -c gunicorn_conf.py main:app
+
+O estado compartilhado (contador de grupos, índice de idempotência, fila
+write-behind, caixa de saída) fica nos SQLite de STATE_DIR, então todos os
+workers precisam ver o mesmo diretório. Tarefas de fundo rodam em um único
+worker (local_db.LeaderLock). Com preload_app o app é importado uma vez no
+mestre e main.prefork_warmup carrega credenciais e o PDF do TCLE antes do fork.
+Métricas (/metrics) continuam sendo por processo.
+"""
+
+import os
+import multiprocessing
+
+workers = int(os.getenv("WEB_CONCURRENCY", str(multiprocessing.cpu_count())))
+# os módulos do app leem WEB_CONCURRENCY para saber que rodam com vários processos
+# (post_fork corrige o valor quando -w na linha de comando sobrepõe este arquivo)
+os.environ["WEB_CONCURRENCY"] = str(workers)
+
+bind = f"{os.getenv('HOST', '0.0.0.0')}:{os.getenv('PORT', '8000')}"
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "60"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+keepalive = 5
+accesslog = "-" if os.getenv("ACCESS_LOG", "0") == "1" else None
+
+
+def on_starting(server):
+    # roda no mestre depois do preload do app e antes do fork dos workers
+    from main import prefork_warmup
+
+    prefork_warmup()
+
+
+def post_fork(server, worker):
+    # valor efetivo, já com -w/--workers e GUNICORN_CMD_ARGS aplicados
+    os.environ["WEB_CONCURRENCY"] = str(server.cfg.workers)
@@ -0,0 +1,171 @@
+# server/idempotency.py
+"""
+idempotency.py
+Índice de deduplicação para submissões repetidas de /api/finaliza-pesquisa.
+
+A chave vem do cabeçalho Idempotency-Key ou, sem ele, do hash SHA-256 do
+payload canônico. O índice tem duas camadas: um LRU em memória com TTL
+(consultas repetidas não tocam o disco) e uma tabela SQLite local, que
+vale entre workers e reinícios. Entradas expiram após IDEMPOTENCY_TTL.
+
+Estados de uma chave:
+- "pending": a primeira requisição ainda está gravando;
+- "done": gravada; o resultado original é devolvido às repetições.
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+import orjson
+
+from local_db import connect
+
+logger = logging.getLogger("idempotency")
+
+DB_NAME = "idempotency"
+TTL = float(os.getenv("IDEMPOTENCY_TTL", str(24 * 3600)))
+MEMORY_SIZE = int(os.getenv("IDEMPOTENCY_MEMORY_SIZE", "10000"))
+PENDING_TIMEOUT = float(os.getenv("IDEMPOTENCY_PENDING_TIMEOUT", "60"))
+PURGE_INTERVAL = 300.0
+MAX_KEY_LENGTH = 200
+
+NEW, DONE, IN_PROGRESS = "new", "done", "in_progress"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS idempotency (
+    key TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    result TEXT,
+    created_at REAL NOT NULL
+)
+"""
+
+_init_lock = threading.Lock()
+_initialized = False
+_lock = threading.Lock()
+_memory: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+_last_purge = 0.0
+_stats = {"new": 0, "replayed": 0, "in_progress": 0}
+
+
+def _db():
+    global _initialized
+    conn = connect(DB_NAME)
+    if not _initialized:
+        with _init_lock:
+            if not _initialized:
+                conn.execute(_SCHEMA)
+                conn.execute("CREATE INDEX IF NOT EXISTS idempotency_created ON idempotency (created_at)")
+                _initialized = True
+    return conn
+
+
+def make_key(header_key: Optional[str], payload: Dict[str, Any]) -> str:
+    """Chave do cabeçalho (limitada) ou hash SHA-256 do payload com chaves ordenadas."""
+    if header_key and header_key.strip():
+        return "h:" + header_key.strip()[:MAX_KEY_LENGTH]
+    canonical = orjson.dumps(payload, option=orjson.OPT_SORT_KEYS)
+    return "p:" + hashlib.sha256(canonical).hexdigest()
+
+
+def _memory_get(key: str) -> Optional[Dict[str, Any]]:
+    with _lock:
+        entry = _memory.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.time():
+            del _memory[key]
+            return None
+        _memory.move_to_end(key)
+        return entry[1]
+
+
+def _memory_put(key: str, result: Dict[str, Any], created_at: float) -> None:
+    with _lock:
+        _memory[key] = (created_at + TTL, result)
+        _memory.move_to_end(key)
+        while len(_memory) > MEMORY_SIZE:
+            _memory.popitem(last=False)
+
+
+def _count(name: str) -> None:
+    with _lock:
+        _stats[name] += 1
+
+
+def _maybe_purge(conn, now: float) -> None:
+    global _last_purge
+    if now - _last_purge < PURGE_INTERVAL:
+        return
+    _last_purge = now
+    deleted = conn.execute("DELETE FROM idempotency WHERE created_at < ?", (now - TTL,)).rowcount
+    if deleted:
+        logger.debug("idempotency: %d chaves expiradas removidas", deleted)
+
+
+def begin(key: str) -> Tuple[str, Optional[Dict[str, Any]]]:
+    """
+    Reserva a chave. Devolve:
+    - (NEW, None): primeira vez, o chamador deve gravar e chamar complete/abort;
+    - (DONE, resultado): já gravada, devolver o resultado original;
+    - (IN_PROGRESS, None): outra requisição com a mesma chave ainda está gravando.
+    """
+    cached = _memory_get(key)
+    if cached is not None:
+        _count("replayed")
+        return DONE, cached
+
+    conn = _db()
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        _maybe_purge(conn, now)
+        row = conn.execute("SELECT status, result, created_at FROM idempotency WHERE key = ?", (key,)).fetchone()
+        if row is None or row[2] < now - TTL or (row[0] == "pending" and row[2] < now - PENDING_TIMEOUT):
+            # chave nova, expirada, ou pendente de uma requisição que não terminou
+            conn.execute(
+                "INSERT OR REPLACE INTO idempotency (key, status, result, created_at) VALUES (?, 'pending', NULL, ?)",
+                (key, now),
+            )
+            conn.execute("COMMIT")
+            _count("new")
+            return NEW, None
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+    status, result, created_at = row
+    if status == "done":
+        data = json.loads(result)
+        _memory_put(key, data, created_at)
+        _count("replayed")
+        return DONE, data
+    _count("in_progress")
+    return IN_PROGRESS, None
+
+
+def complete(key: str, result: Dict[str, Any]) -> None:
+    """Marca a chave como gravada, guardando o resultado para as repetições."""
+    now = time.time()
+    _db().execute(
+        "UPDATE idempotency SET status = 'done', result = ?, created_at = ? WHERE key = ?",
+        (json.dumps(result, ensure_ascii=False), now, key),
+    )
+    _memory_put(key, result, now)
+
+
+def abort(key: str) -> None:
+    """Libera a chave após uma falha, para que a repetição possa gravar."""
+    _db().execute("DELETE FROM idempotency WHERE key = ? AND status = 'pending'", (key,))
+
+
+def stats() -> Dict[str, int]:
+    with _lock:
+        return {**_stats, "memory_size": len(_memory)}
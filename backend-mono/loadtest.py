@@ -0,0 +1,356 @@
+# server/loadtest.py
+"""
+loadtest.py
+Benchmark de carga do backend com stand-ins locais do Google Sheets
+(sheets_stub.py) e do Brevo (brevo_stub.py).
+
+Sobe os dois stubs, inicia o app com uvicorn num processo separado
+(apontando para os stubs e para um STATE_DIR temporário) e simula
+participantes em paralelo: cada um chama /api/get-group,
+/api/finaliza-pesquisa (com o grupo recebido) e /api/tcle.
+
+Relatório: req/s e latência p50/p95/p99 por endpoint, erros por status,
+pico de memória (RSS) do servidor, chamadas recebidas por cada stub,
+tempo para esvaziar a fila write-behind e a caixa de saída, e o
+equilíbrio dos grupos (contadores repetidos indicam corrida).
+
+Uso:
+    python loadtest.py --participants 500 --concurrency 50 --sheets-latency 0.15 --brevo-latency 0.2
+    python loadtest.py --env STORAGE_BACKEND=sheets --env SHEETS_WRITE_BEHIND=0 --json
+    python loadtest.py --server gunicorn --workers 4
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import signal
+import argparse
+import tempfile
+import threading
+import subprocess
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+import requests
+
+import brevo_stub
+import sheets_stub
+
+ENDPOINTS = ("get-group", "finaliza-pesquisa", "tcle")
+
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * p / 100
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+def make_submission(group: str) -> Dict[str, Any]:
+    """Payload válido de /api/finaliza-pesquisa com respostas aleatórias."""
+    return {
+        "idade": str(random.randint(18, 70)),
+        "genero": random.choice(["feminino", "masculino", "outro"]),
+        "etnia": "parda",
+        "escolaridade": "superior",
+        "estado": "SP",
+        "qap_responses": [random.randint(1, 5) for _ in range(37)],
+        "autodeclaracao": "3",
+        "wisconsin": [random.randint(1, 5) for _ in range(5)],
+        "news_first": [random.randint(1, 5) for _ in range(12)],
+        "news_second": [random.randint(1, 5) for _ in range(12)],
+        "game": group,
+        "game_time_seconds": random.randint(60, 600),
+        "atencao1": True,
+        "atencao2": random.random() < 0.9,
+        "exited_fullscreen": False,
+        "had_inactivity": False,
+    }
+
+
+def _rss_kb(pid: int) -> int:
+    """RSS (kB) do processo e de todos os descendentes (workers do uvicorn), via /proc."""
+    total = 0
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    total += int(line.split()[1])
+                    break
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            children = [int(c) for c in f.read().split()]
+    except (OSError, ValueError):
+        return total
+    return total + sum(_rss_kb(c) for c in children)
+
+
+class MemorySampler(threading.Thread):
+    def __init__(self, pid: int, interval: float = 0.2):
+        super().__init__(name="rss-sampler", daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.peak_kb = 0
+        self.samples: List[int] = []
+        self._done = threading.Event()
+
+    def run(self):
+        while not self._done.is_set():
+            rss = _rss_kb(self.pid)
+            self.samples.append(rss)
+            self.peak_kb = max(self.peak_kb, rss)
+            self._done.wait(self.interval)
+
+    def stop(self):
+        self._done.set()
+        self.join()
+
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.statuses: Dict[str, Counter] = defaultdict(Counter)
+        self.groups: Counter = Counter()
+        self.counters: List[int] = []
+
+    def record(self, endpoint: str, seconds: float, status: Any) -> None:
+        with self.lock:
+            self.latencies[endpoint].append(seconds)
+            self.statuses[endpoint][str(status)] += 1
+
+
+def run_participant(base_url: str, session: requests.Session, rec: Recorder, index: int, timeout: float) -> None:
+    def call(endpoint: str, method: str, path: str, **kwargs) -> Optional[requests.Response]:
+        start = time.perf_counter()
+        try:
+            resp = session.request(method, base_url + path, timeout=timeout, **kwargs)
+        except requests.RequestException as e:
+            rec.record(endpoint, time.perf_counter() - start, type(e).__name__)
+            return None
+        rec.record(endpoint, time.perf_counter() - start, resp.status_code)
+        return resp
+
+    resp = call("get-group", "GET", "/api/get-group")
+    group = "par"
+    if resp is not None and resp.status_code == 200:
+        data = resp.json()
+        group = data["group"]
+        with rec.lock:
+            rec.groups[group] += 1
+            rec.counters.append(data["contador"])
+    call("finaliza-pesquisa", "POST", "/api/finaliza-pesquisa", json=make_submission(group))
+    call("tcle", "POST", "/api/tcle", json={"destinatario": f"participante{index}@bench.local"})
+
+
+def wait_ready(base_url: str, proc: subprocess.Popen, timeout: float = 30.0) -> Dict[str, float]:
+    """Espera o servidor responder /health (liveness) e depois /health/ready; devolve os tempos."""
+    start = time.monotonic()
+    times: Dict[str, float] = {}
+    for name, path in (("live_seconds", "/health"), ("ready_seconds", "/health/ready")):
+        while True:
+            if time.monotonic() - start > timeout:
+                raise RuntimeError("servidor não ficou pronto a tempo")
+            if proc.poll() is not None:
+                raise RuntimeError(f"servidor encerrou durante a inicialização (código {proc.returncode})")
+            try:
+                if requests.get(base_url + path, timeout=1).status_code == 200:
+                    times[name] = round(time.monotonic() - start, 3)
+                    break
+            except requests.RequestException:
+                pass
+            time.sleep(0.02)
+    return times
+
+
+def wait_drain(base_url: str, timeout: float) -> Dict[str, Any]:
+    """Espera a fila write-behind e a caixa de saída esvaziarem (ou o timeout)."""
+    start = time.monotonic()
+    status: Dict[str, Any] = {}
+    while time.monotonic() - start < timeout:
+        try:
+            status = requests.get(base_url + "/api/queue-status", timeout=5).json()
+        except (requests.RequestException, ValueError):
+            time.sleep(0.5)
+            continue
+        outbox = status.get("email_outbox", {})
+        if status.get("queue_depth", 0) == 0 and outbox.get("queued", 0) + outbox.get("sending", 0) == 0:
+            return {"drained": True, "seconds": round(time.monotonic() - start, 2), "status": status}
+        time.sleep(0.5)
+    return {"drained": False, "seconds": round(time.monotonic() - start, 2), "status": status}
+
+
+def _free_port() -> int:
+    import socket
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def run(args) -> Dict[str, Any]:
+    sheets = sheets_stub.start_stub(latency=args.sheets_latency, error_rate=args.error_rate, error_status=args.error_status)
+    brevo = brevo_stub.start_stub(latency=args.brevo_latency, error_rate=args.error_rate, error_status=args.error_status)
+    state_dir = tempfile.mkdtemp(prefix="loadtest-state-")
+    port = args.port or _free_port()
+    base_url = f"http://127.0.0.1:{port}"
+
+    env = {
+        **os.environ,
+        "SHEETS_API_ENDPOINT": sheets.url,
+        "SPREADSHEET_ID": "loadtest",
+        "BREVO_API_URL": brevo.url,
+        "BREVO_API_KEY": "loadtest",
+        "EMAIL_FROM": "loadtest@bench.local",
+        "STATE_DIR": state_dir,
+        "LOG_LEVEL": "WARNING",
+        "WEB_CONCURRENCY": str(args.workers),
+        "HOST": "127.0.0.1",
+        "PORT": str(port),
+    }
+    for item in args.env:
+        key, _, value = item.partition("=")
+        env[key] = value
+
+    if args.server == "gunicorn":
+        cmd = [sys.executable, "-m", "gunicorn", "-c", "gunicorn_conf.py", "--log-level", "warning", "main:app"]
+    else:
+        cmd = [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+               "--workers", str(args.workers), "--log-level", "warning", "--no-access-log"]
+    proc = subprocess.Popen(cmd, env=env, cwd=os.path.dirname(os.path.abspath(__file__)),
+                            stdout=subprocess.DEVNULL if args.quiet_server else None)
+    sampler = MemorySampler(proc.pid)
+    try:
+        startup = wait_ready(base_url, proc)
+        idle_kb = _rss_kb(proc.pid)
+        sampler.start()
+
+        rec = Recorder()
+        local = threading.local()
+
+        def task(i: int) -> None:
+            session = getattr(local, "session", None)
+            if session is None:
+                session = local.session = requests.Session()
+            run_participant(base_url, session, rec, i, args.timeout)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency, thread_name_prefix="participant") as pool:
+            list(pool.map(task, range(args.participants)))
+        elapsed = time.perf_counter() - start
+
+        drain = wait_drain(base_url, args.drain_timeout) if args.drain_timeout > 0 else None
+        sampler.stop()
+        try:
+            server_metrics = requests.get(base_url + "/api/sheets-status", timeout=5).json()
+        except (requests.RequestException, ValueError):
+            server_metrics = {}
+    finally:
+        if sampler.is_alive():
+            sampler.stop()
+        proc.send_signal(signal.SIGINT)
+        try:
+            proc.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+        sheets.shutdown()
+        brevo.shutdown()
+
+    endpoints = {}
+    total = 0
+    for name in ENDPOINTS:
+        lat = sorted(rec.latencies.get(name, []))
+        total += len(lat)
+        endpoints[name] = {
+            "requests": len(lat),
+            "req_per_s": round(len(lat) / elapsed, 1) if elapsed else 0.0,
+            "p50_ms": round(percentile(lat, 50) * 1000, 1),
+            "p95_ms": round(percentile(lat, 95) * 1000, 1),
+            "p99_ms": round(percentile(lat, 99) * 1000, 1),
+            "max_ms": round(lat[-1] * 1000, 1) if lat else 0.0,
+            "status": dict(rec.statuses.get(name, {})),
+        }
+
+    counters = rec.counters
+    duplicates = len(counters) - len(set(counters))
+    groups = dict(rec.groups)
+    imbalance = abs(groups.get("par", 0) - groups.get("impar", 0))
+    return {
+        "config": {
+            "participants": args.participants,
+            "concurrency": args.concurrency,
+            "server": args.server,
+            "workers": args.workers,
+            "sheets_latency": args.sheets_latency,
+            "brevo_latency": args.brevo_latency,
+            "error_rate": args.error_rate,
+            "env": args.env,
+        },
+        "startup": startup,
+        "elapsed_seconds": round(elapsed, 2),
+        "total_req_per_s": round(total / elapsed, 1) if elapsed else 0.0,
+        "endpoints": endpoints,
+        "memory": {"idle_rss_mb": round(idle_kb / 1024, 1), "peak_rss_mb": round(sampler.peak_kb / 1024, 1)},
+        "api_calls": {"sheets": dict(sheets.stats), "brevo": dict(brevo.stats)},
+        "sheets_rows": {tab: len(rows) for tab, rows in sheets.tabs.items()},
+        "drain": drain and {k: v for k, v in drain.items() if k != "status"},
+        "server": server_metrics,
+        "groups": {
+            "counts": groups,
+            "imbalance": imbalance,
+            # com contador atômico, a diferença entre os grupos é no máximo 1
+            "balanced": imbalance <= 1 and duplicates == 0,
+            "duplicate_counters": duplicates,
+        },
+    }
+
+
+def print_report(r: Dict[str, Any]) -> None:
+    cfg = r["config"]
+    print(f"\n{cfg['participants']} participantes, concorrência {cfg['concurrency']}, {cfg['server']} com {cfg['workers']} worker(s), "
+          f"latência sheets={cfg['sheets_latency']}s brevo={cfg['brevo_latency']}s, erros={cfg['error_rate']:.0%}")
+    print(f"servidor vivo em {r['startup']['live_seconds']}s, pronto em {r['startup']['ready_seconds']}s")
+    print(f"duração {r['elapsed_seconds']}s, {r['total_req_per_s']} req/s no total\n")
+    print(f"{'endpoint':<20}{'req':>7}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}  status")
+    for name, e in r["endpoints"].items():
+        print(f"{name:<20}{e['requests']:>7}{e['req_per_s']:>9}{e['p50_ms']:>9}{e['p95_ms']:>9}{e['p99_ms']:>9}{e['max_ms']:>9}  {e['status']}")
+    mem = r["memory"]
+    print(f"\nmemória do servidor: {mem['idle_rss_mb']} MB em repouso, pico {mem['peak_rss_mb']} MB")
+    print(f"chamadas ao Sheets: {r['api_calls']['sheets']}")
+    print(f"chamadas ao Brevo:  {r['api_calls']['brevo']}")
+    print(f"linhas por aba:     {r['sheets_rows']}")
+    if r["drain"]:
+        state = "esvaziadas" if r["drain"]["drained"] else "NÃO esvaziadas"
+        print(f"filas {state} em {r['drain']['seconds']}s após a carga")
+    g = r["groups"]
+    print(f"grupos: {g['counts']} (diferença {g['imbalance']}, contadores repetidos {g['duplicate_counters']}) "
+          f"-> {'OK' if g['balanced'] else 'DESBALANCEADO'}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark de carga com stubs locais do Google Sheets e do Brevo.")
+    parser.add_argument("--participants", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--workers", type=int, default=1, help="processos do servidor (WEB_CONCURRENCY)")
+    parser.add_argument("--server", choices=("uvicorn", "gunicorn"), default="uvicorn", help="gunicorn usa gunicorn_conf.py")
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--sheets-latency", type=float, default=0.1, help="segundos por chamada ao Sheets")
+    parser.add_argument("--brevo-latency", type=float, default=0.2, help="segundos por envio ao Brevo")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fração de chamadas aos stubs que falham")
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--timeout", type=float, default=30.0, help="timeout de cada requisição")
+    parser.add_argument("--drain-timeout", type=float, default=60.0, help="espera pelas filas após a carga (0 = não esperar)")
+    parser.add_argument("--env", action="append", default=[], metavar="CHAVE=VALOR", help="variável de ambiente extra do servidor")
+    parser.add_argument("--json", action="store_true", help="imprime o relatório em JSON")
+    parser.add_argument("--quiet-server", action="store_true", help="descarta o stdout do servidor")
+    args = parser.parse_args()
+
+    report = run(args)
+    if args.json:
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+    else:
+        print_report(report)
+    sys.exit(0 if report["groups"]["balanced"] else 1)
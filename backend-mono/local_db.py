@@ -0,0 +1,111 @@
+# server/local_db.py
+"""
+local_db.py
+Conexões SQLite locais (modo WAL) para o estado do backend que não pode
+depender da latência do Google Sheets (contador de grupos, filas, índices).
+
+Todo esse estado fica em STATE_DIR e vale para todos os workers da máquina
+(uvicorn --workers / gunicorn). Travas de arquivo (flock) coordenam o que
+não pode rodar em dois processos ao mesmo tempo.
+"""
+
+import os
+import fcntl
+import sqlite3
+import threading
+import logging
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+logger = logging.getLogger("local_db")
+
+STATE_DIR = os.getenv("STATE_DIR", "./data/state")
+BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+
+_local = threading.local()
+
+
+def db_path(name: str) -> str:
+    """Caminho do arquivo SQLite `name` dentro de STATE_DIR."""
+    return os.path.join(STATE_DIR, f"{name}.sqlite3")
+
+
+def connect(name: str) -> sqlite3.Connection:
+    """
+    Devolve a conexão da thread atual para o banco `name` (uma por thread,
+    sqlite3 não compartilha conexões entre threads com segurança).
+    A conexão usa autocommit; transações são abertas com BEGIN IMMEDIATE.
+    """
+    conns = getattr(_local, "conns", None)
+    if conns is None:
+        conns = _local.conns = {}
+    conn = conns.get(name)
+    if conn is not None:
+        return conn
+
+    os.makedirs(STATE_DIR, exist_ok=True)
+    path = db_path(name)
+    logger.debug("Abrindo SQLite %s", path)
+    conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT_MS / 1000, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+    conns[name] = conn
+    return conn
+
+
+def lock_path(name: str) -> str:
+    return os.path.join(STATE_DIR, f"{name}.lock")
+
+
+@contextmanager
+def file_lock(name: str) -> Iterator[None]:
+    """Trava exclusiva entre processos (bloqueante) enquanto durar o bloco with."""
+    os.makedirs(STATE_DIR, exist_ok=True)
+    fd = os.open(lock_path(name), os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        os.close(fd)  # fechar o descritor libera o flock
+
+
+class LeaderLock:
+    """
+    Elege um único processo para uma tarefa de fundo (flusher, caixa de
+    saída, espelho do contador). `try_acquire` não bloqueia: quem não
+    conseguiu tenta de novo no próximo ciclo. O SO libera a trava quando o
+    processo que a detém morre, e outro worker assume.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._fd: Optional[int] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    @property
+    def held(self) -> bool:
+        return self._fd is not None and self._pid == os.getpid()
+
+    def try_acquire(self) -> bool:
+        with self._lock:
+            if self.held:
+                return True
+            # descritor herdado de um fork não conta: a trava é do processo pai
+            os.makedirs(STATE_DIR, exist_ok=True)
+            fd = os.open(lock_path(self.name), os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(fd)
+                return False
+            self._fd, self._pid = fd, os.getpid()
+            logger.info("Processo %d assumiu a tarefa '%s'", self._pid, self.name)
+            return True
+
+    def release(self) -> None:
+        with self._lock:
+            if self.held:
+                os.close(self._fd)
+            self._fd = self._pid = None
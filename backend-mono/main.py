@@ -1,17 +1,51 @@
-from g_sheets import  append_full_response, increment_counter
-from fastapi import Request, FastAPI, HTTPException
-import os
-from email_sender import envia_email_simples
+import time
+import startup_profile
 from dotenv import load_dotenv
-from pydantic import BaseModel
-
 
+# único ponto que lê o .env: antes dos imports do app, que leem variáveis de ambiente ao carregar
 load_dotenv()
+startup_profile.install()
+
+from g_sheets import build_full_row
+import g_sheets
+import storage
+import write_queue
+import email_outbox
+import qap_scoring
+import export
+import idempotency
+import study_stats
+import response_archive
+import metrics
+import resilience
+import allocator
+from allocator import close_all as close_allocators
+import concurrency
+import admission
+from concurrency import run_blocking
+from fastapi import Request, FastAPI, HTTPException
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+import hmac
+import logging
+import os
+from email_sender import preload_tcle
+from pydantic import BaseModel, ValidationError, conint, conlist, validator
+from typing import Any, Optional
+import orjson
+import asyncio
 
 from fastapi.middleware.cors import CORSMiddleware
 
+startup_profile.mark("import do app", startup_profile.since_start())
+
+logger = logging.getLogger("main")
+
 app = FastAPI()
 
+# adicionado antes do CORS para ficar por dentro dele: as recusas (429/503)
+# também levam os cabeçalhos CORS e o frontend consegue ler o Retry-After
+app.add_middleware(admission.AdmissionMiddleware)
+
 # Ajuste as origens conforme necessário
 origins = [
     "http://localhost:5173",      # dev Vite
@@ -27,15 +61,57 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-INVERT_QAP_ITEMS_1BASED = {1,2,5,7,8,12,13,15,16,19,22,23,25,26,29,33,35}
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """Latência por rota (template, não o path bruto) e requisições em andamento."""
+    metrics.HTTP_IN_FLIGHT.inc()
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        path = getattr(route, "path", "unmatched")
+        metrics.HTTP_DURATION.observe(time.perf_counter() - start, request.method, path, str(status))
+        metrics.HTTP_IN_FLIGHT.dec()
+
+
+@metrics.register_collector
+def _collect_app_state():
+    """Contadores mantidos pelos outros módulos, lidos na hora da raspagem."""
+    client = g_sheets.get_client_stats()
+    cache = g_sheets.get_cache_stats()
+    queue = write_queue.status()
+    yield ("sheets_client_events_total", "counter", "Eventos do cliente Google Sheets (cache do cliente e renovação de token).",
+           [({"event": k}, v) for k, v in client.items()])
+    yield ("sheets_read_cache_events_total", "counter", "Eventos do cache local de leituras.",
+           [({"event": k}, v) for k, v in cache.items() if k != "size"])
+    yield ("sheets_read_cache_size", "gauge", "Entradas no cache local de leituras.", [({}, cache["size"])])
+    yield ("write_queue_depth", "gauge", "Linhas aguardando envio para a planilha.", [({}, queue["queue_depth"])])
+    yield ("write_queue_lag_seconds", "gauge", "Idade da linha pendente mais antiga.", [({}, queue["flush_lag_seconds"])])
+    yield ("write_queue_rows_flushed_total", "counter", "Linhas enviadas para a planilha.", [({}, queue["rows_flushed"])])
+    yield ("write_queue_flush_errors_total", "counter", "Falhas de envio de lotes.", [({}, queue["flush_errors"])])
+    backends = concurrency.inflight()["backends"]
+    yield ("io_in_flight", "gauge", "Chamadas bloqueantes em andamento por backend.",
+           [({"backend": k}, v["in_flight"]) for k, v in backends.items()])
+    yield ("io_waiting", "gauge", "Chamadas bloqueantes aguardando vaga por backend.",
+           [({"backend": k}, v["waiting"]) for k, v in backends.items()])
+    yield ("email_outbox_messages", "gauge", "Mensagens na caixa de saída por estado.",
+           [({"status": k}, v) for k, v in email_outbox.stats().items()])
+    yield ("idempotency_events_total", "counter", "Consultas ao índice de idempotência por resultado.",
+           [({"result": k}, v) for k, v in idempotency.stats().items() if k != "memory_size"])
+
 
 # === 1️⃣ Endpoint: recebe email e devolve grupo ===
 @app.get("/api/get-group")
 async def register_email(request: Request):
     """
     Recebe { "email": "..." } e devolve { group: "par"|"impar" }.
-    O grupo é definido pelo valor do contador na planilha:
-    - A cada requisição, incrementa a célula A1 da aba configurada (default 'contador').
+    O grupo é definido pelo valor do contador (ver allocator.py):
+    - A cada requisição, incrementa o contador atômico local, espelhado de forma
+      assíncrona na célula A1 da aba configurada (default 'contador').
     - Se o contador for par → grupo 'par'
     - Se o contador for ímpar → grupo 'impar'
     """
@@ -45,93 +121,255 @@ async def register_email(request: Request):
 
     try:
         # incrementa o contador e obtém o novo valor
-        new_count = increment_counter(tab_name=contador_tab, cell="A1")
+        # o backend "sheet" faz round-trips à planilha; os demais são locais
+        backend = "sheets" if allocator.ALLOCATOR_BACKEND == "sheet" else "local"
+        new_count = await run_blocking(backend, storage.increment_counter, tab_name=contador_tab, cell="A1")
 
         # define grupo a partir do contador
         group = "par" if (new_count - 1) % 2 == 0 else "impar"
 
         # aqui futuramente você pode chamar envia_email_simples(email, group)
-        print(f"contador={new_count - 1} | grupo={group}")
+        logger.debug("contador=%d | grupo=%s", new_count - 1, group)
 
         return {"ok": True, "group": group, "contador": new_count}
 
+    except resilience.CircuitOpenError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(int(e.retry_after) + 1)})
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao processar registro: {e}")
 
 
+# blocos de SurveySubmission que já chegam ao encoder da linha convertidos
+SUBMISSION_BLOCKS = ("qap_responses", "wisconsin", "news_first", "news_second")
+
+
+def _empty_to_none(v):
+    return None if v == "" else v
+
+
+def _none_to_empty(values):
+    return ["" if v is None else v for v in values]
+
+
+class SurveySubmission(BaseModel):
+    """Payload de /api/finaliza-pesquisa (ordem e layout das colunas em survey_schema.py)."""
+    idade: Any = ""
+    genero: Any = ""
+    etnia: Any = ""
+    escolaridade: Any = ""
+    estado: Any = ""
+    qap_responses: conlist(conint(ge=1, le=5), min_items=37, max_items=37)
+    qap_sum: Any = None  # ignorado (qualquer valor, como antes): o servidor recalcula
+    autodeclaracao: Any = ""
+    wisconsin: conlist(Optional[int], min_items=5, max_items=5)
+    news_first: conlist(Optional[int], min_items=12, max_items=12)
+    news_second: conlist(Optional[int], min_items=12, max_items=12)
+    game: Any = ""
+    game_time_seconds: Any = ""
+    atencao1: Any = ""
+    atencao2: Any = ""
+    exited_fullscreen: Any = False
+    had_inactivity: Any = False
+    timestamp: Optional[str] = None
+
+    # itens em branco ("" ou null) viram célula vazia na planilha
+    _blank_items = validator("wisconsin", "news_first", "news_second", pre=True, each_item=True, allow_reuse=True)(_empty_to_none)
+    _blank_cells = validator("wisconsin", "news_first", "news_second", allow_reuse=True)(_none_to_empty)
+
+
 @app.post("/api/finaliza-pesquisa")
 async def finaliza_pesquisa(request: Request):
     """
-    Recebe dados completos, calcula qap_sum com inversões nos itens especificados
-    e grava UMA linha usando append_full_response.
+    Recebe dados completos (SurveySubmission), calcula qap_sum com inversões
+    nos itens especificados e grava UMA linha usando append_full_response.
+    O corpo é decodificado com orjson e validado uma única vez; erros de
+    campo voltam como 422 com a localização exata.
     """
     try:
-        data = await request.json()
-    except Exception:
+        raw = orjson.loads(await request.body())
+    except orjson.JSONDecodeError:
         detail = "JSON inválido."
-        print(detail)
+        logger.debug(detail)
         raise HTTPException(status_code=400, detail= detail)
-        
 
-    # Validações básicas sobre qap_responses
-    qap = data.get("qap_responses")
-    if not isinstance(qap, (list, tuple)) or len(qap) != 37:
-        detail = "Campo 'qap_responses' deve ser lista com 37 elementos."
-        print(detail)
-        raise HTTPException(status_code=400, detail= detail)
-
-    # converte e valida cada resposta (garante número inteiro entre 1 e 5)
-    qap_ints = []
     try:
-        for i, val in enumerate(qap, start=0):
-            if val is None or str(val).strip() == "":
-                raise ValueError(f"Item QAP {i} está vazio.")
-            v = int(val)
-            if v < 1 or v > 5:
-                raise ValueError(f"Item QAP {i} com valor inválido: {v}. Deve ser 1..5.")
-            qap_ints.append(v)
-    except ValueError as ve:
-        print(str(ve))
-        raise HTTPException(status_code=400, detail=str(ve))
-
-    # calcula a soma com inversões nos índices listados
-    processed_vals_for_sum = []
-    for idx1, v in enumerate(qap_ints, start=0):
-        if idx1 in INVERT_QAP_ITEMS_1BASED:
-            inverted = 6 - v   # 1->5, 2->4, 3->3, 4->2, 5->1
-            processed_vals_for_sum.append(inverted)
-        else:
-            processed_vals_for_sum.append(v)
+        submission = SurveySubmission.parse_obj(raw)
+    except ValidationError as e:
+        logger.debug("Payload inválido: %s", e.errors())
+        raise HTTPException(status_code=422, detail=e.errors())
 
-    qap_sum_computed = sum(processed_vals_for_sum)
-
-    # define no payload (sobrescreve/insere) para gravar a soma correta
-    data["qap_sum"] = int(qap_sum_computed)
-
-    # opcional: você pode também gravar a versão "processada" em outra chave para auditoria:
-    # data["qap_processed_for_sum"] = processed_vals_for_sum
+    # calcula a soma com inversões nos itens listados (ver qap_scoring.py)
+    data = submission.dict()
+    data["qap_sum"] = qap_scoring.score_valid(submission.qap_responses)["qap_sum"]
 
     # garantir timestamp se necessário
     if not data.get("timestamp"):
         from datetime import datetime
         data["timestamp"] = datetime.utcnow().isoformat() + "Z"
 
-    # grava usando append_full_response (essa função validará formatos e tamanhos novamente)
+    # repetição da mesma submissão (retry do frontend) devolve o resultado original sem gravar de novo
+    idem_key = idempotency.make_key(request.headers.get("Idempotency-Key"), raw)
+    state, previous = await run_blocking("local", idempotency.begin, idem_key)
+    if state == idempotency.DONE:
+        return previous
+    if state == idempotency.IN_PROGRESS:
+        raise HTTPException(status_code=409, detail="Submissão idêntica ainda em processamento.", headers={"Retry-After": "2"})
+
+    # grava usando o store configurado (storage.py); blocos já validados pelo SurveySubmission.
+    # No padrão (SQLite local) a planilha é atualizada em segundo plano pela fila write-behind.
+    tab_name = os.getenv("SHEET_TAB", "responses")
     try:
-        append_full_response(data, tab_name=os.getenv("SHEET_TAB", "responses"))
-        return {
+        row = build_full_row(data, coerced=SUBMISSION_BLOCKS)
+        store = storage.get_store()
+        await run_blocking(store.io_backend, storage.append_row, tab_name, row)
+        result = {
             "ok": True,
             "message": "Pesquisa finalizada e gravada com sucesso.",
         }
+    except resilience.CircuitOpenError as e:
+        await run_blocking("local", idempotency.abort, idem_key)
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(int(e.retry_after) + 1)})
     except ValueError as ve:
+        await run_blocking("local", idempotency.abort, idem_key)
         detail = f"Erro de validação: {ve}"
-        print(detail)
+        logger.debug(detail)
         raise HTTPException(status_code=400, detail=detail)
     except Exception as e:
-        detail = f"Erro ao gravar no Google Sheets: {e}"
-        print(detail)
+        await run_blocking("local", idempotency.abort, idem_key)
+        detail = f"Erro ao gravar resposta: {e}"
+        logger.exception("Erro ao gravar resposta")
         raise HTTPException(status_code=500, detail= detail)
 
+    await run_blocking("local", idempotency.complete, idem_key, result)
+    return result
+
+
+SCORE_BATCH_MAX = int(os.getenv("SCORE_BATCH_MAX", "10000"))  # participantes por chamada
+# teto do corpo: folga larga por item e por participante, para JSON indentado caber
+_SCORE_BATCH_MAX_BYTES = SCORE_BATCH_MAX * (37 * 16 + 64) + 64 * 1024
+
+
+async def _read_body_limited(request: Request, limit: int) -> bytes:
+    """
+    Lê o corpo recusando com 413 assim que passar de `limit` bytes: pelo
+    Content-Length declarado antes de ler, e contando os bytes do stream
+    (corpo chunked ou Content-Length falso), sem bufferizar além do teto.
+    """
+    too_large = HTTPException(status_code=413, detail=f"No máximo {SCORE_BATCH_MAX} participantes por chamada.")
+    declared = request.headers.get("content-length")
+    if declared is not None and declared.isdigit() and int(declared) > limit:
+        raise too_large
+    chunks = []
+    size = 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        if size > limit:
+            raise too_large
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+
+def _score_batch_body(body: bytes) -> dict:
+    """Valida e pontua o corpo de /api/score-batch (roda fora do event loop)."""
+    try:
+        data = orjson.loads(body)
+    except orjson.JSONDecodeError:
+        raise HTTPException(status_code=400, detail="JSON inválido.")
+
+    responses = data.get("responses") if isinstance(data, dict) else None
+    if not isinstance(responses, list):
+        raise HTTPException(status_code=400, detail="Campo 'responses' deve ser lista de listas com 37 elementos.")
+    if len(responses) > SCORE_BATCH_MAX:
+        raise HTTPException(status_code=413, detail=f"No máximo {SCORE_BATCH_MAX} participantes por chamada.")
+    if not responses:
+        return {"ok": True, "n": 0, **{name: [] for name in ["qap_sum", *qap_scoring.SUBSCALES]}}
+    try:
+        scores = qap_scoring.score_batch(responses)
+    except ValueError as ve:
+        raise HTTPException(status_code=400, detail=str(ve))
+    return {"ok": True, "n": len(responses), **scores}
+
+
+@app.post("/api/score-batch")
+async def score_batch(request: Request):
+    """
+    Pontua vários participantes de uma vez (até SCORE_BATCH_MAX).
+    Exemplo de chamada:
+        POST /api/score-batch
+        {
+            "responses": [[1, 5, 3, ...37 itens], ...]
+        }
+    Devolve qap_sum e os totais por subescala, na mesma ordem das entradas.
+    """
+    body = await _read_body_limited(request, _SCORE_BATCH_MAX_BYTES)
+    return await run_blocking("local", _score_batch_body, body)
+
+
+def _require_export_token(request: Request) -> None:
+    """Exige "Authorization: Bearer <EXPORT_TOKEN>" (dados do estudo); sem EXPORT_TOKEN, 403."""
+    token = os.getenv("EXPORT_TOKEN")
+    if not token:
+        raise HTTPException(status_code=403, detail="Exportação desativada (EXPORT_TOKEN não configurado).")
+    auth = request.headers.get("authorization", "")
+    if not hmac.compare_digest(auth.encode("utf-8"), f"Bearer {token}".encode("utf-8")):
+        raise HTTPException(status_code=401, detail="Token de exportação inválido.")
+
+
+@app.get("/api/export")
+def export_responses(request: Request, format: str = "csv", tab: Optional[str] = None, page_size: int = 500, source: str = "store"):
+    """
+    Baixa todas as respostas gravadas em CSV, NDJSON ou Parquet (streaming).
+    Com source=archive lê do arquivo colunar (response_archive.py), atualizado
+    antes da exportação, em vez do store.
+    Requer o cabeçalho "Authorization: Bearer <EXPORT_TOKEN>"; sem EXPORT_TOKEN
+    configurado a exportação fica desativada.
+    Exemplo de chamada:
+        GET /api/export?format=csv
+        GET /api/export?format=parquet&source=archive
+    """
+    _require_export_token(request)
+
+    fmt = format.lower()
+    if fmt not in export.FORMATS:
+        raise HTTPException(status_code=400, detail=f"Formato inválido. Use: {', '.join(export.FORMATS)}.")
+    if fmt == "parquet" and not export.parquet_available():
+        raise HTTPException(status_code=501, detail="Exportação Parquet requer o pacote pyarrow.")
+    if source not in ("store", "archive"):
+        raise HTTPException(status_code=400, detail="Origem inválida. Use: store, archive.")
+    page_size = max(1, min(page_size, 5000))
+
+    tab_name = tab or os.getenv("SHEET_TAB", "responses")
+    # o nome da aba vira diretório e nome de trava no arquivo colunar
+    if not response_archive.valid_tab_name(tab_name):
+        raise HTTPException(status_code=400, detail="Aba inválida. Use só letras, números, '_' e '-'.")
+    media_type, ext = export.FORMATS[fmt]
+    store = storage.get_store()
+    if source == "archive":
+        if not store.has_row_ids:
+            raise HTTPException(status_code=409, detail="O arquivo colunar só está disponível com STORAGE_BACKEND=sqlite.")
+        response_archive.sync(store, tab_name)
+        pages = response_archive.ArchiveReader(tab_name).iter_pages(page_size)
+    else:
+        pages = store.iter_pages(tab_name, page_size)
+    return StreamingResponse(
+        export.stream(fmt, pages),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{tab_name}.{ext}"'},
+    )
+
+
+@app.get("/api/stats")
+async def study_statistics(request: Request):
+    """
+    Andamento do estudo: participantes por grupo (badnews/pacman), média e
+    desvio de qap_sum e de cada item dos blocos QAP, Wisconsin e notícias.
+    Vem de agregados mantidos a cada gravação (study_stats.py), sem reler
+    as respostas nem chamar o Google Sheets. Requer o mesmo token de /api/export.
+    """
+    _require_export_token(request)
+    snapshot = await run_blocking("local", study_stats.snapshot, storage.get_store())
+    return {"ok": True, **snapshot}
+
 
 class EmailRequest(BaseModel):
     destinatario: str
@@ -140,6 +378,10 @@ class EmailRequest(BaseModel):
 async def envia_email(request: EmailRequest):
     """
     Endpoint que envia o Termo de Consentimento para o email informado.
+    O envio vai para a caixa de saída (email_outbox.py) e o id devolvido
+    pode ser consultado em GET /api/tcle/{id}. Pedidos repetidos para o
+    mesmo email dentro de TCLE_DEDUP_WINDOW devolvem o envio já existente
+    ("duplicate": true) em vez de mandar outro.
     Exemplo de chamada:
         POST /api/tcle
         {
@@ -150,13 +392,169 @@ async def envia_email(request: EmailRequest):
     if not destinatario:
         raise HTTPException(status_code=400, detail="Campo 'destinatario' é obrigatório.")
 
-    ok = envia_email_simples(destinatario)
-    if not ok:
+    if email_outbox.EMAIL_OUTBOX:
+        message_id, status, duplicate = await run_blocking("local", email_outbox.submit, destinatario)
+        if duplicate:
+            message = f"Termo de consentimento já solicitado para {destinatario}."
+        else:
+            message = f"Termo de consentimento será enviado para {destinatario}."
+        return {"ok": True, "id": message_id, "status": status, "duplicate": duplicate, "message": message}
+
+    message_id, status, duplicate = await run_blocking("email", email_outbox.send_now, destinatario)
+    if status != 201:
         raise HTTPException(status_code=500, detail="Falha ao enviar o email.")
 
-    return {"ok": True, "message": f"Termo de consentimento enviado para {destinatario}."}
+    return {"ok": True, "id": message_id, "duplicate": duplicate, "message": f"Termo de consentimento enviado para {destinatario}."}
+
+
+@app.get("/api/tcle/{message_id}")
+async def status_email(message_id: str):
+    """Estado de entrega do TCLE: queued, sending, sent ou failed."""
+    status = await run_blocking("local", email_outbox.get_status, message_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Envio não encontrado.")
+    return {"ok": True, **status}
+
+
+@app.get("/api/queue-status")
+def queue_status():
+    """Profundidade da fila write-behind, atraso do envio para a planilha e caixa de saída de emails."""
+    return {
+        "ok": True,
+        "storage": storage.status(),
+        "idempotency": idempotency.stats(),
+        "email_outbox": email_outbox.stats(),
+        **write_queue.status(),
+    }
+
+
+@app.get("/api/sheets-status")
+def sheets_status():
+    """Contadores do cliente Google Sheets e do cache local de leituras."""
+    return {
+        "ok": True,
+        "client": g_sheets.get_client_stats(),
+        "read_cache": g_sheets.get_cache_stats(),
+        "circuit_breaker": resilience.SHEETS_BREAKER.state,
+    }
+
+
+@app.get("/api/inflight")
+def inflight_status():
+    """
+    Chamadas externas em andamento/em espera por backend (sheets, email, local)
+    e o estado do controle de admissão por endpoint.
+    """
+    return {"ok": True, **concurrency.inflight(), "admission": admission.status()}
+
+
+def prefork_warmup():
+    """
+    Chamado pelo gunicorn (gunicorn_conf.py) no processo mestre, depois de
+    importar o app e antes do fork: credenciais do Google e o PDF do TCLE são
+    carregados uma vez e herdados pelos workers. Não abre conexões nem threads.
+    """
+    preload_tcle()
+    if g_sheets.SPREADSHEET_ID:
+        try:
+            g_sheets.warm_up(build_service=False)
+        except Exception as e:
+            print(f"Pré-carga das credenciais do Google falhou ({e}); cada worker tentará de novo.")
+
+
+# warmup em segundo plano no startup: o servidor já aceita conexões (liveness)
+# enquanto credenciais, cliente do Sheets, PDF e stores locais são preparados;
+# GET /health/ready só responde 200 quando termina.
+STARTUP_WARMUP = os.getenv("STARTUP_WARMUP", "1") == "1"
+_readiness = {"ready": False, "warmup": "disabled" if not STARTUP_WARMUP else "pending", "steps": {}}
+_warmup_task: Optional[asyncio.Task] = None
+
+
+def _warmup_step(name: str, fn, *args) -> None:
+    start = time.perf_counter()
+    try:
+        fn(*args)
+        _readiness["steps"][name] = {"ok": True, "ms": round((time.perf_counter() - start) * 1000, 1)}
+    except Exception as e:
+        # falha no warmup não derruba o worker: a primeira requisição tenta de novo
+        _readiness["steps"][name] = {"ok": False, "error": str(e)}
+        print(f"Warmup '{name}' falhou: {e}")
+    startup_profile.mark(f"warmup: {name}", time.perf_counter() - start)
+
+
+async def _warm_up():
+    _readiness["warmup"] = "running"
+    start = time.perf_counter()
+    steps = [
+        run_blocking("local", _warmup_step, "tcle", preload_tcle),
+        run_blocking("local", _warmup_step, "study_stats", lambda: study_stats.load(storage.get_store())),
+        run_blocking("local", _warmup_step, "allocator", allocator.get_allocator, os.getenv("SHEET_contador_TAB", "contador"), "A1"),
+    ]
+    if g_sheets.SPREADSHEET_ID:
+        steps.append(run_blocking("sheets", _warmup_step, "sheets_client", g_sheets.warm_up))
+    await asyncio.gather(*steps)
+    startup_profile.mark("warmup (total)", time.perf_counter() - start)
+    _readiness["warmup"] = "done"
+    _readiness["ready"] = True
+    if startup_profile.ENABLED:
+        print(startup_profile.report())
+
+
+@app.on_event("startup")
+async def startup():
+    start = time.perf_counter()
+    # lido da linha de comando do servidor: os limites por processo dependem dele
+    logger.info("Workers do servidor: %d", concurrency.web_workers())
+    if STARTUP_WARMUP:
+        # PDF do TCLE, cliente do Sheets e stores são preparados em segundo plano
+        global _warmup_task
+        _warmup_task = asyncio.get_running_loop().create_task(_warm_up())
+    else:
+        # carrega e codifica o PDF do TCLE uma vez, antes do primeiro envio
+        preload_tcle()
+    if email_outbox.EMAIL_OUTBOX:
+        email_outbox.start_workers()
+    # catch-up das linhas de outros workers e checkpoint das estatísticas
+    study_stats.start_refresher(storage.get_store())
+    # a fila write-behind também replica as respostas do store SQLite;
+    # sem SPREADSHEET_ID as linhas ficam no journal até a planilha ser configurada
+    if g_sheets.SPREADSHEET_ID:
+        write_queue.start_flusher()
+    else:
+        print("SPREADSHEET_ID não configurado: envio para a planilha desativado.")
+    startup_profile.mark("evento de startup", time.perf_counter() - start)
+    startup_profile.mark("até o startup (desde o início do import)", startup_profile.since_start())
+    if not STARTUP_WARMUP:
+        _readiness["ready"] = True
+        if startup_profile.ENABLED:
+            print(startup_profile.report())
+
+
+@app.on_event("shutdown")
+def shutdown():
+    # grava o valor final do contador na planilha
+    close_allocators()
+    study_stats.stop_refresher()
+    study_stats.checkpoint()
+    write_queue.stop_flusher()
+    email_outbox.stop_workers()
+    concurrency.shutdown()
+
+
+@app.get("/metrics")
+def prometheus_metrics():
+    """Métricas no formato texto do Prometheus."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
 
 
 @app.get("/health")
 def health():
+    """Liveness: o processo está de pé e respondendo."""
     return {"ok": True}
+
+
+@app.get("/health/ready")
+def readiness():
+    """Readiness: 200 depois do startup e do warmup; 503 enquanto o worker ainda aquece."""
+    body = {"ok": _readiness["ready"], "warmup": _readiness["warmup"], "steps": _readiness["steps"]}
+    return JSONResponse(body, status_code=200 if _readiness["ready"] else 503)
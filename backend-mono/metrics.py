@@ -0,0 +1,203 @@
+# server/metrics.py
+"""
+metrics.py
+Métricas do processo no formato texto do Prometheus (GET /metrics).
+
+Implementação mínima e sem dependências: contadores, gauges e histogramas
+com labels, um decorator `timed` para medir chamadas externas (latência,
+erros por tipo e chamadas em andamento) e coletores que leem, na hora da
+raspagem, os contadores que os outros módulos já mantêm.
+Os valores são por processo; com vários workers cada um expõe os seus.
+"""
+
+import time
+import threading
+import functools
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+Labels = Tuple[str, ...]
+_INF_LABEL = 'le="+Inf"'
+
+
+def _fmt_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(v: str) -> str:
+    return str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _fmt_value(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if isinstance(v, float) and not v.is_integer() else str(int(v))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Sequence[str]) -> Labels:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name}: esperado labels {self.labelnames}, recebido {labels}")
+        return tuple(str(v) for v in labels)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"] + self._samples()
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, help_text, labelnames=()):
+        super().__init__(name, help_text, labelnames)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_fmt_labels(self.labelnames, k)} {_fmt_value(v)}" for k, v in items]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *labels: str, amount: float = 1) -> None:
+        self.inc(*labels, amount=-amount)
+
+    def set(self, value: float, *labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values: Dict[Labels, list] = {}  # [contagens por bucket..., soma, total]
+
+    def observe(self, value: float, *labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            data = self._values.get(key)
+            if data is None:
+                data = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    data[i] += 1
+                    break
+            data[-2] += value
+            data[-1] += 1
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = [(k, list(v)) for k, v in self._values.items()]
+        lines = []
+        for key, data in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, data):
+                cumulative += count
+                le = _fmt_labels(self.labelnames, key, f'le="{_fmt_value(bound)}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            lines.append(f"{self.name}_bucket{_fmt_labels(self.labelnames, key, _INF_LABEL)} {data[-1]}")
+            lines.append(f"{self.name}_sum{_fmt_labels(self.labelnames, key)} {data[-2]!r}")
+            lines.append(f"{self.name}_count{_fmt_labels(self.labelnames, key)} {data[-1]}")
+        return lines
+
+
+# coletor: função sem argumentos que devolve [(nome, tipo, help, [(labels dict, valor), ...]), ...]
+Collector = Callable[[], Iterable[Tuple[str, str, str, Iterable[Tuple[Dict[str, str], float]]]]]
+
+_metrics: List[_Metric] = []
+_collectors: List[Collector] = []
+
+
+def _register(metric):
+    _metrics.append(metric)
+    return metric
+
+
+def counter(name: str, help_text: str, labelnames: Sequence[str] = ()) -> Counter:
+    return _register(Counter(name, help_text, labelnames))
+
+
+def gauge(name: str, help_text: str, labelnames: Sequence[str] = ()) -> Gauge:
+    return _register(Gauge(name, help_text, labelnames))
+
+
+def histogram(name: str, help_text: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+    return _register(Histogram(name, help_text, labelnames, buckets))
+
+
+def register_collector(fn: Collector) -> Collector:
+    _collectors.append(fn)
+    return fn
+
+
+def render() -> str:
+    """Texto de exposição do Prometheus com todas as métricas e coletores."""
+    lines: List[str] = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+    for collect in _collectors:
+        try:
+            families = list(collect())
+        except Exception as e:
+            lines.append(f"# coletor {getattr(collect, '__name__', collect)} falhou: {type(e).__name__}")
+            continue
+        for name, kind, help_text, samples in families:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                lines.append(f"{name}{_fmt_labels(list(labels), list(labels.values()))} {_fmt_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+# --- métricas compartilhadas ---
+CALL_DURATION = histogram("app_call_duration_seconds", "Latência das chamadas externas instrumentadas.", ("op",))
+CALL_ERRORS = counter("app_call_errors_total", "Erros das chamadas instrumentadas, por tipo de exceção.", ("op", "error_type"))
+CALLS_IN_FLIGHT = gauge("app_calls_in_flight", "Chamadas instrumentadas em andamento.", ("op",))
+SHEETS_QUOTA_RETRIES = counter("sheets_quota_retries_total", "Retentativas causadas por limite de quota/sobrecarga do Google Sheets (429/503).", ("op",))
+
+HTTP_DURATION = histogram("http_request_duration_seconds", "Latência das requisições HTTP.", ("method", "path", "status"))
+HTTP_IN_FLIGHT = gauge("http_requests_in_flight", "Requisições HTTP em andamento.")
+
+
+def timed(op: str):
+    """Decorator: mede latência, conta erros por tipo e mantém o gauge de chamadas em andamento."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            CALLS_IN_FLIGHT.inc(op)
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            except Exception as e:
+                CALL_ERRORS.inc(op, type(e).__name__)
+                raise
+            finally:
+                CALL_DURATION.observe(time.perf_counter() - start, op)
+                CALLS_IN_FLIGHT.dec(op)
+        return wrapper
+    return decorator
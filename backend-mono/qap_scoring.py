@@ -0,0 +1,188 @@
+# server/qap_scoring.py
+"""
+qap_scoring.py
+Pontuação do QAP (37 itens Likert 1..5) com operações vetorizadas do NumPy.
+
+A máscara dos itens invertidos é calculada uma vez; pontuar um participante
+ou uma matriz (n, 37) de participantes é a mesma operação. Além do total
+(qap_sum) são calculados totais por subescala (QAP_SUBSCALES).
+"""
+
+import os
+import csv
+import json
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+from survey_schema import block_slice, column_index
+
+N_ITEMS = 37
+MIN_VALUE, MAX_VALUE = 1, 5
+
+# Itens de pontuação invertida (1->5, 2->4, 3->3, 4->2, 5->1).
+# Os números são aplicados como índices 0-based, exatamente como o endpoint
+# /api/finaliza-pesquisa sempre fez; mudar isso alteraria os qap_sum já gravados.
+INVERT_QAP_ITEMS_1BASED = {1,2,5,7,8,12,13,15,16,19,22,23,25,26,29,33,35}
+
+REVERSE_MASK = np.zeros(N_ITEMS, dtype=bool)
+REVERSE_MASK[sorted(INVERT_QAP_ITEMS_1BASED)] = True
+
+
+def _load_subscales() -> Dict[str, np.ndarray]:
+    """
+    Subescalas como {nome: índices dos itens}. Por padrão: itens diretos e
+    invertidos. QAP_SUBSCALES (JSON {"nome": [índices 0-based]}) substitui o padrão.
+    """
+    raw = os.getenv("QAP_SUBSCALES")
+    if raw:
+        spec = json.loads(raw)
+    else:
+        spec = {
+            "diretos": np.flatnonzero(~REVERSE_MASK).tolist(),
+            "invertidos": np.flatnonzero(REVERSE_MASK).tolist(),
+        }
+    subscales = {}
+    for name, items in spec.items():
+        idx = np.asarray(items, dtype=np.intp)
+        if idx.size and (idx.min() < 0 or idx.max() >= N_ITEMS):
+            raise ValueError(f"Subescala '{name}' com item fora de 0..{N_ITEMS - 1}.")
+        subscales[name] = idx
+    return subscales
+
+
+SUBSCALES = _load_subscales()
+
+
+def _parse_slow(qap: Sequence[Any]) -> np.ndarray:
+    """Conversão item a item, só para produzir a mensagem de erro exata."""
+    values = []
+    for i, val in enumerate(qap, start=0):
+        if val is None or str(val).strip() == "":
+            raise ValueError(f"Item QAP {i} está vazio.")
+        values.append(int(val))
+    return np.asarray(values, dtype=object)
+
+
+def _check_range(matrix: np.ndarray) -> None:
+    bad = (matrix < MIN_VALUE) | (matrix > MAX_VALUE)
+    if bad.any():
+        pos = np.argwhere(bad)[0]
+        i = int(pos[-1])
+        v = int(matrix[tuple(pos)])
+        prefix = f"Participante {int(pos[0])}: " if matrix.ndim == 2 else ""
+        raise ValueError(f"{prefix}Item QAP {i} com valor inválido: {v}. Deve ser 1..5.")
+
+
+def parse_responses(qap: Sequence[Any]) -> np.ndarray:
+    """
+    Converte as 37 respostas de um participante para int e valida 1..5.
+    Levanta ValueError com a mesma mensagem do endpoint original.
+    """
+    if not isinstance(qap, (list, tuple)) or len(qap) != N_ITEMS:
+        raise ValueError(f"Campo 'qap_responses' deve ser lista com {N_ITEMS} elementos.")
+    try:
+        arr = np.array(qap, dtype=np.int64)
+    except (TypeError, ValueError, OverflowError):
+        arr = _parse_slow(qap)
+    _check_range(arr)
+    return arr.astype(np.int16)
+
+
+def to_matrix(rows: Iterable[Sequence[Any]]) -> np.ndarray:
+    """Converte várias listas de respostas numa matriz (n, 37) validada."""
+    try:
+        matrix = np.array(rows, dtype=np.int64)
+    except (TypeError, ValueError, OverflowError) as e:
+        raise ValueError(f"Respostas QAP devem ser números inteiros: {e}") from e
+    if matrix.ndim != 2 or matrix.shape[1] != N_ITEMS:
+        raise ValueError(f"Cada participante deve ter {N_ITEMS} respostas QAP.")
+    _check_range(matrix)
+    return matrix.astype(np.int16)
+
+
+def apply_reverse(matrix: np.ndarray) -> np.ndarray:
+    """Aplica a inversão (6 - v) nos itens invertidos; aceita vetor ou matriz."""
+    return np.where(REVERSE_MASK, 6 - matrix, matrix)
+
+
+def score_matrix(matrix: np.ndarray) -> Dict[str, np.ndarray]:
+    """Totais por participante: 'qap_sum' e uma entrada por subescala."""
+    scored = apply_reverse(matrix).astype(np.int32, copy=False)
+    result = {"qap_sum": scored.sum(axis=-1)}
+    for name, idx in SUBSCALES.items():
+        result[name] = scored[..., idx].sum(axis=-1)
+    return result
+
+
+def score(qap: Sequence[Any]) -> Dict[str, int]:
+    """Pontua um participante (valida as respostas como parse_responses)."""
+    return {name: int(v) for name, v in score_matrix(parse_responses(qap)).items()}
+
+
+def score_valid(values: Sequence[int]) -> Dict[str, int]:
+    """Pontua um participante cujas respostas já foram validadas (ex.: SurveySubmission)."""
+    return {name: int(v) for name, v in score_matrix(np.asarray(values, dtype=np.int16)).items()}
+
+
+def score_batch(rows: Iterable[Sequence[Any]]) -> Dict[str, List[int]]:
+    """Pontua vários participantes de uma vez; devolve listas alinhadas às entradas."""
+    return {name: v.tolist() for name, v in score_matrix(to_matrix(rows)).items()}
+
+
+def rescore_export(path: str, output_path: Optional[str] = None, delimiter: str = ",") -> Dict[str, np.ndarray]:
+    """
+    Repontua um CSV exportado da planilha (layout de survey_schema, com ou sem
+    cabeçalho) numa única passada. Se `output_path` for dado, grava uma cópia
+    com qap_sum recalculado e as colunas das subescalas ao final.
+    """
+    qap_cols = block_slice("qap_responses")
+    sum_col = column_index("qap_sum")
+
+    with open(path, newline="", encoding="utf-8") as f:
+        rows = list(csv.reader(f, delimiter=delimiter))
+    header = None
+    if rows and rows[0] and rows[0][0] == "timestamp":
+        header, rows = rows[0], rows[1:]
+
+    matrix = to_matrix([r[qap_cols] for r in rows]) if rows else np.empty((0, N_ITEMS), dtype=np.int16)
+    scores = score_matrix(matrix)
+
+    if output_path:
+        extra = [name for name in scores if name != "qap_sum"]
+        with open(output_path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f, delimiter=delimiter)
+            if header is not None:
+                writer.writerow(header + extra)
+            for i, r in enumerate(rows):
+                r = list(r)
+                r[sum_col] = int(scores["qap_sum"][i])
+                writer.writerow(r + [int(scores[name][i]) for name in extra])
+    return scores
+
+
+def score_archive(reader, chunk: int = 65536) -> Dict[str, np.ndarray]:
+    """
+    Repontua o bloco QAP do arquivo colunar (response_archive.ArchiveReader)
+    direto do memmap, `chunk` participantes por vez. Itens vazios (-1) não
+    somam; as respostas gravadas pelo endpoint nunca têm vazios.
+    """
+    qap = reader.block("qap")
+    parts: Dict[str, List[np.ndarray]] = {name: [] for name in ["qap_sum", *SUBSCALES]}
+    for start in range(0, len(reader), chunk):
+        m = np.asarray(qap[start:start + chunk], dtype=np.int16)
+        scored = np.where(m < MIN_VALUE, 0, apply_reverse(m)).astype(np.int32)
+        parts["qap_sum"].append(scored.sum(axis=-1))
+        for name, idx in SUBSCALES.items():
+            parts[name].append(scored[:, idx].sum(axis=-1))
+    return {name: np.concatenate(v) if v else np.empty(0, dtype=np.int32) for name, v in parts.items()}
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) < 2:
+        print("uso: python qap_scoring.py export.csv [saida.csv]")
+        sys.exit(1)
+    result = rescore_export(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else None)
+    print(f"{len(result['qap_sum'])} participantes repontuados.")
@@ -0,0 +1,228 @@
+# server/resilience.py
+"""
+resilience.py
+Retry com backoff exponencial (com jitter) e circuit breaker para as
+chamadas ao Google Sheets.
+
+- Falhas transitórias (429, 5xx, erros de rede) são repetidas com backoff
+  exponencial com jitter, respeitando Retry-After quando a API envia, até
+  o prazo total da chamada (deadline). Escritas não idempotentes (append)
+  só são repetidas quando é certo que a tentativa não foi aplicada (ver
+  may_have_applied); nos outros casos quem chamou decide (write_queue
+  confere a planilha antes de reenviar).
+- O circuit breaker abre depois de SHEETS_BREAKER_THRESHOLD falhas
+  transitórias seguidas: enquanto aberto as chamadas falham na hora com
+  CircuitOpenError (quem puder guarda o trabalho localmente, ver
+  storage.SheetsStore e write_queue). Depois de SHEETS_BREAKER_RESET
+  segundos uma chamada de teste (half-open) decide se fecha de novo.
+"""
+
+import os
+import time
+import random
+import threading
+import logging
+from typing import Any, Callable, Optional
+
+from googleapiclient.errors import HttpError
+
+import metrics
+
+logger = logging.getLogger("resilience")
+
+MAX_ATTEMPTS = int(os.getenv("SHEETS_RETRY_ATTEMPTS", "4"))
+BACKOFF_BASE = float(os.getenv("SHEETS_RETRY_BASE", "0.5"))
+BACKOFF_MAX = float(os.getenv("SHEETS_RETRY_MAX", "8"))
+CALL_DEADLINE = float(os.getenv("SHEETS_CALL_DEADLINE", "20"))
+BREAKER_THRESHOLD = int(os.getenv("SHEETS_BREAKER_THRESHOLD", "5"))
+BREAKER_RESET = float(os.getenv("SHEETS_BREAKER_RESET", "30"))
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+_STATE_VALUE = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpenError(RuntimeError):
+    """A API está degradada e o circuit breaker está recusando chamadas."""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"Circuit breaker '{name}' aberto; tente novamente em {retry_after:.0f}s.")
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, threshold: int = BREAKER_THRESHOLD, reset_timeout: float = BREAKER_RESET):
+        self.name = name
+        self.threshold = max(1, threshold)
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                return HALF_OPEN
+            return self._state
+
+    def retry_after(self) -> float:
+        with self._lock:
+            return max(0.0, self.reset_timeout - (time.monotonic() - self._opened_at))
+
+    def allow(self) -> bool:
+        """True se a chamada pode seguir (no half-open, só uma chamada de teste por vez)."""
+        with self._lock:
+            if self._state == CLOSED:
+                return True
+            if self._state == OPEN:
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    return False
+                self._transition(HALF_OPEN)
+            if self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._probe_in_flight = False
+            if self._state != CLOSED:
+                self._transition(CLOSED)
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            self._probe_in_flight = False
+            if self._state == HALF_OPEN or self._failures >= self.threshold:
+                self._opened_at = time.monotonic()
+                if self._state != OPEN:
+                    self._transition(OPEN)
+
+    def release(self) -> None:
+        """Libera a vaga de teste sem contar sucesso nem falha (erro não transitório)."""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def _transition(self, state: str) -> None:
+        logger.warning("Circuit breaker '%s': %s -> %s", self.name, self._state, state)
+        BREAKER_TRANSITIONS.inc(self.name, state)
+        self._state = state
+
+
+BREAKER_TRANSITIONS = metrics.counter("circuit_breaker_transitions_total", "Mudanças de estado do circuit breaker.", ("breaker", "state"))
+SHEETS_BREAKER = CircuitBreaker("sheets")
+
+
+@metrics.register_collector
+def _collect_breakers():
+    yield ("circuit_breaker_state", "gauge", "Estado do circuit breaker (0=fechado, 1=half-open, 2=aberto).",
+           [({"breaker": SHEETS_BREAKER.name}, _STATE_VALUE[SHEETS_BREAKER.state])])
+
+
+def status_of(exc: BaseException) -> Optional[int]:
+    if isinstance(exc, HttpError):
+        return getattr(exc.resp, "status", None)
+    return None
+
+
+def is_transient(exc: BaseException) -> bool:
+    """Erros que valem nova tentativa: 429/5xx e falhas de rede/timeout."""
+    if isinstance(exc, HttpError):
+        return status_of(exc) in RETRYABLE_STATUS
+    # import tardio: httplib2/google-auth só são carregados junto com o cliente (g_sheets)
+    import httplib2
+    from google.auth.exceptions import TransportError
+
+    return isinstance(exc, (OSError, httplib2.HttpLib2Error, TransportError))
+
+
+def may_have_applied(exc: BaseException) -> bool:
+    """
+    False só quando é certo que a requisição não teve efeito: breaker aberto
+    antes do envio, recusa 4xx da API (inclui 429) ou conexão recusada.
+    Timeout, 5xx e outras falhas de rede são ambíguas: a escrita pode ter
+    sido aplicada mesmo sem resposta.
+    """
+    while exc is not None:
+        if isinstance(exc, CircuitOpenError) and exc.__cause__ is None:
+            return False
+        if isinstance(exc, HttpError):
+            status = status_of(exc)
+            return not (status is not None and 400 <= status < 500)
+        if isinstance(exc, ConnectionRefusedError):
+            return False
+        exc = exc.__cause__
+    return True
+
+
+def retry_after_seconds(exc: BaseException) -> Optional[float]:
+    if not isinstance(exc, HttpError):
+        return None
+    value = exc.resp.get("retry-after") if hasattr(exc.resp, "get") else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def backoff_delay(attempt: int) -> float:
+    """Backoff exponencial com "full jitter" (attempt começa em 1)."""
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * (2 ** (attempt - 1))))
+
+
+def call(
+    op: str,
+    fn: Callable[[], Any],
+    breaker: CircuitBreaker = SHEETS_BREAKER,
+    max_attempts: int = MAX_ATTEMPTS,
+    deadline: float = CALL_DEADLINE,
+    set_timeout: Optional[Callable[[float], None]] = None,
+    idempotent: bool = True,
+) -> Any:
+    """
+    Executa fn() com retry e circuit breaker. Levanta CircuitOpenError se o
+    breaker estiver aberto, ou a última exceção de fn quando não der mais
+    para tentar (erro não transitório, tentativas esgotadas ou prazo vencido).
+    Antes de cada tentativa, set_timeout (se dado) recebe os segundos que
+    restam do prazo, para que uma tentativa lenta também respeite o deadline.
+    Com idempotent=False, falhas que podem ter sido aplicadas (timeout, 5xx)
+    sobem na hora em vez de repetir a escrita.
+    """
+    give_up_at = time.monotonic() + deadline
+    attempt = 0
+    while True:
+        attempt += 1
+        if not breaker.allow():
+            raise CircuitOpenError(breaker.name, breaker.retry_after())
+        if set_timeout is not None:
+            set_timeout(max(0.1, give_up_at - time.monotonic()))
+        try:
+            result = fn()
+        except Exception as e:
+            if not is_transient(e):
+                breaker.release()
+                raise
+            breaker.record_failure()
+            if breaker.state == OPEN:
+                # esta falha abriu o breaker: não adianta esperar pelas próximas tentativas
+                raise CircuitOpenError(breaker.name, breaker.retry_after()) from e
+            if not idempotent and may_have_applied(e):
+                logger.warning("%s: falha ambígua (%s); escrita não idempotente não é repetida", op, type(e).__name__)
+                raise
+            delay = retry_after_seconds(e)
+            if delay is None:
+                delay = backoff_delay(attempt)
+            if attempt >= max_attempts or time.monotonic() + delay > give_up_at:
+                raise
+            if status_of(e) in (429, 503):
+                metrics.SHEETS_QUOTA_RETRIES.inc(op)
+            logger.info("%s: falha transitória (%s); tentativa %d em %.2fs", op, type(e).__name__, attempt + 1, delay)
+            time.sleep(delay)
+            continue
+        breaker.record_success()
+        return result
@@ -0,0 +1,338 @@
+# server/response_archive.py
+"""
+response_archive.py
+Arquivo colunar compacto das respostas, lido por memory map.
+
+Os blocos de respostas (QAP 37, Wisconsin 5, notícias 12 + 12) e o grupo
+ficam em colunas de largura fixa int8, e qap_sum em int16, cada um num
+arquivo binário próprio. Os ids das linhas do store ficam em int64, e os
+campos de texto (timestamp, perfil, atenção...) num sidecar JSON lines com
+índice de offsets. Célula vazia vira EMPTY (-1).
+
+Leitores (ArchiveReader) abrem as colunas com numpy.memmap, sem copiar: um
+scan de centenas de milhares de participantes usa poucos MB de RAM e não
+passa pelo Google Sheets.
+
+O arquivo é só de acréscimo e derivado do store local. sync() acrescenta as
+linhas com id maior que o último arquivado, sob trava de arquivo (vários
+workers podem chamar). meta.json guarda quantas linhas estão confirmadas:
+bytes além disso (gravação interrompida) são descartados na próxima sync.
+Como depende de ids, só o store SQLite alimenta o arquivo.
+
+Uso:
+    python response_archive.py sync       # atualiza a partir do store
+    python response_archive.py info
+    python response_archive.py rescore [saida.csv]
+"""
+
+import os
+import re
+import json
+import hashlib
+import logging
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from local_db import STATE_DIR, file_lock
+from survey_schema import HEADER, ROW_LENGTH, block_slice, column_index
+
+logger = logging.getLogger("response_archive")
+
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", os.path.join(STATE_DIR, "archive"))
+ARCHIVE_TAB = os.getenv("SHEET_TAB", "responses")
+EMPTY = -1
+VERSION = 1
+PAGE_SIZE = 5000
+_TAB_NAME = re.compile(r"[A-Za-z0-9_-]+")
+
+# coluna do arquivo -> (tipo, posições na linha de survey_schema)
+_BLOCKS = {"qap": "qap_responses", "wisconsin": "wisconsin", "news_first": "news_first", "news_second": "news_second"}
+NUMERIC_COLUMNS: Dict[str, Tuple[np.dtype, slice]] = {
+    **{name: (np.dtype(np.int8), block_slice(key)) for name, key in _BLOCKS.items()},
+    "qap_sum": (np.dtype(np.int16), block_slice("qap_sum")),
+}
+_GAME_COL = column_index("game")
+_NUMERIC_POSITIONS = {i for _, s in NUMERIC_COLUMNS.values() for i in range(s.start, s.stop)} | {_GAME_COL}
+STRING_FIELDS: List[str] = [h for i, h in enumerate(HEADER) if i not in _NUMERIC_POSITIONS]
+_STRING_POSITIONS = [HEADER.index(h) for h in STRING_FIELDS]
+_FINGERPRINT = hashlib.sha1("|".join(HEADER).encode("utf-8")).hexdigest()
+
+
+def valid_tab_name(tab_name: str) -> bool:
+    """Só nomes que servem de diretório e de nome de trava sem sair de ARCHIVE_DIR."""
+    return bool(_TAB_NAME.fullmatch(tab_name or ""))
+
+
+def _tab_directory(tab_name: str, directory: Optional[str]) -> str:
+    if not valid_tab_name(tab_name):
+        raise ValueError(f"Nome de aba inválido para o arquivo colunar: {tab_name!r}")
+    return directory or os.path.join(ARCHIVE_DIR, tab_name)
+
+
+def _files(directory: str) -> Dict[str, str]:
+    names = {name: f"{name}.{dt.str[1:]}" for name, (dt, _) in NUMERIC_COLUMNS.items()}
+    names.update({"game": "game.i1", "ids": "ids.i8", "strings": "strings.jsonl", "offsets": "strings.idx"})
+    return {k: os.path.join(directory, v) for k, v in names.items()}
+
+
+def _widths() -> Dict[str, int]:
+    return {name: s.stop - s.start for name, (_, s) in NUMERIC_COLUMNS.items()}
+
+
+def _empty_meta(tab_name: str) -> Dict[str, Any]:
+    return {
+        "version": VERSION,
+        "fingerprint": _FINGERPRINT,
+        "tab": tab_name,
+        "rows": 0,
+        "last_id": 0,
+        "strings_bytes": 0,
+        "game_codes": ["badnews", "pacman"],
+        "columns": {name: {"dtype": dt.name, "width": w} for (name, (dt, _)), w in zip(NUMERIC_COLUMNS.items(), _widths().values())},
+        "string_fields": STRING_FIELDS,
+    }
+
+
+def _read_meta(directory: str, tab_name: str) -> Dict[str, Any]:
+    try:
+        with open(os.path.join(directory, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+    except FileNotFoundError:
+        return _empty_meta(tab_name)
+    if meta.get("fingerprint") != _FINGERPRINT or meta.get("version") != VERSION:
+        raise RuntimeError(f"Arquivo em {directory} tem outro layout; apague o diretório para reconstruir.")
+    return meta
+
+
+def _write_meta(directory: str, meta: Dict[str, Any]) -> None:
+    path = os.path.join(directory, "meta.json")
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(tmp, path)
+
+
+def _encode_block(rows: Sequence[Sequence[Any]], s: slice, dtype: np.dtype) -> Tuple[np.ndarray, int]:
+    """Matriz (linhas, largura) no tipo da coluna; vazio e fora da faixa viram EMPTY."""
+    info = np.iinfo(dtype)
+    out = np.full((len(rows), s.stop - s.start), EMPTY, dtype=np.int64)
+    invalid = 0
+    for i, r in enumerate(rows):
+        for j, v in enumerate(r[s]):
+            if v is None or v == "":
+                continue
+            try:
+                x = int(v)
+            except (TypeError, ValueError):
+                invalid += 1
+                continue
+            if info.min < x <= info.max:
+                out[i, j] = x
+            else:
+                invalid += 1
+    return out.astype(dtype), invalid
+
+
+def _fit(row: Sequence[Any]) -> List[Any]:
+    row = list(row)
+    return row + [""] * (ROW_LENGTH - len(row)) if len(row) < ROW_LENGTH else row[:ROW_LENGTH]
+
+
+class ArchiveWriter:
+    """Acrescenta linhas ao arquivo. Use dentro de sync(), que segura a trava."""
+
+    def __init__(self, tab_name: str = ARCHIVE_TAB, directory: Optional[str] = None):
+        self.tab_name = tab_name
+        self.directory = _tab_directory(tab_name, directory)
+        self.files = _files(self.directory)
+
+    def _truncate_to(self, meta: Dict[str, Any]) -> None:
+        """Descarta bytes além das linhas confirmadas em meta.json (gravação interrompida)."""
+        n = meta["rows"]
+        sizes = {name: n * dt.itemsize * w for (name, (dt, _)), w in zip(NUMERIC_COLUMNS.items(), _widths().values())}
+        sizes.update({"game": n, "ids": n * 8, "offsets": n * 8, "strings": meta["strings_bytes"]})
+        for key, size in sizes.items():
+            path = self.files[key]
+            if not os.path.exists(path):
+                open(path, "wb").close()
+            if os.path.getsize(path) != size:
+                with open(path, "r+b") as f:
+                    f.truncate(size)
+
+    def append(self, rows: Sequence[Tuple[int, Sequence[Any]]]) -> int:
+        """Acrescenta (id, linha) com id maior que o último arquivado. Devolve quantas entraram."""
+        os.makedirs(self.directory, exist_ok=True)
+        meta = _read_meta(self.directory, self.tab_name)
+        rows = [(i, _fit(r)) for i, r in rows if i > meta["last_id"]]
+        if not rows:
+            return 0
+        self._truncate_to(meta)
+        values = [r for _, r in rows]
+
+        invalid = 0
+        for name, (dtype, s) in NUMERIC_COLUMNS.items():
+            block, bad = _encode_block(values, s, dtype)
+            invalid += bad
+            with open(self.files[name], "ab") as f:
+                f.write(block.tobytes())
+
+        codes = meta["game_codes"]
+        game = np.empty(len(values), dtype=np.int8)
+        for i, r in enumerate(values):
+            g = str(r[_GAME_COL])
+            if g == "":
+                game[i] = EMPTY
+                continue
+            if g not in codes:
+                codes.append(g)
+            game[i] = codes.index(g)
+        with open(self.files["game"], "ab") as f:
+            f.write(game.tobytes())
+        with open(self.files["ids"], "ab") as f:
+            f.write(np.array([i for i, _ in rows], dtype=np.int64).tobytes())
+
+        offsets = np.empty(len(values), dtype=np.int64)
+        pos = meta["strings_bytes"]
+        chunks = []
+        for i, r in enumerate(values):
+            line = json.dumps(["" if r[p] is None else r[p] for p in _STRING_POSITIONS], ensure_ascii=False).encode("utf-8") + b"\n"
+            offsets[i] = pos
+            pos += len(line)
+            chunks.append(line)
+        with open(self.files["strings"], "ab") as f:
+            f.write(b"".join(chunks))
+        with open(self.files["offsets"], "ab") as f:
+            f.write(offsets.tobytes())
+
+        # só agora as linhas passam a valer para os leitores
+        meta.update(rows=meta["rows"] + len(rows), last_id=rows[-1][0], strings_bytes=pos, game_codes=codes)
+        _write_meta(self.directory, meta)
+        if invalid:
+            logger.warning("%d células fora da faixa do tipo da coluna gravadas como vazias.", invalid)
+        return len(rows)
+
+
+class ArchiveReader:
+    """Acesso somente leitura, por memmap, às linhas confirmadas no momento da abertura."""
+
+    def __init__(self, tab_name: str = ARCHIVE_TAB, directory: Optional[str] = None):
+        self.tab_name = tab_name
+        self.directory = _tab_directory(tab_name, directory)
+        self.files = _files(self.directory)
+        self.meta = _read_meta(self.directory, tab_name)
+        self.rows: int = self.meta["rows"]
+        self.game_codes: List[str] = self.meta["game_codes"]
+
+    def __len__(self) -> int:
+        return self.rows
+
+    def _map(self, key: str, dtype: np.dtype, width: int = 0) -> np.ndarray:
+        shape = (self.rows, width) if width else (self.rows,)
+        if self.rows == 0:
+            return np.empty(shape, dtype=dtype)
+        return np.memmap(self.files[key], dtype=dtype, mode="r", shape=shape)
+
+    def block(self, name: str) -> np.ndarray:
+        """Matriz (linhas, itens) da coluna `name` (qap, wisconsin, news_first, news_second, qap_sum)."""
+        dtype, s = NUMERIC_COLUMNS[name]
+        width = s.stop - s.start
+        data = self._map(name, dtype, width)
+        return data if width > 1 else data.reshape(self.rows)
+
+    def games(self) -> np.ndarray:
+        """Código do grupo por linha (índice em game_codes; EMPTY sem grupo)."""
+        return self._map("game", np.dtype(np.int8))
+
+    def ids(self) -> np.ndarray:
+        return self._map("ids", np.dtype(np.int64))
+
+    def strings(self, start: int, stop: int) -> List[List[Any]]:
+        """Campos de texto das linhas [start, stop), na ordem de STRING_FIELDS."""
+        stop = min(stop, self.rows)
+        if start >= stop:
+            return []
+        offsets = self._map("offsets", np.dtype(np.int64))
+        begin = int(offsets[start])
+        end = int(offsets[stop]) if stop < self.rows else self.meta["strings_bytes"]
+        with open(self.files["strings"], "rb") as f:
+            f.seek(begin)
+            data = f.read(end - begin)
+        return [json.loads(line) for line in data.splitlines()]
+
+    def iter_pages(self, page_size: int = PAGE_SIZE) -> Iterator[List[List[Any]]]:
+        """Linhas completas no layout de survey_schema (mesmo formato de ResponseStore.iter_pages)."""
+        blocks = {name: self.block(name) for name in NUMERIC_COLUMNS}
+        games = self.games()
+        for start in range(0, self.rows, page_size):
+            stop = min(start + page_size, self.rows)
+            page = [[""] * ROW_LENGTH for _ in range(stop - start)]
+            for row, texts in zip(page, self.strings(start, stop)):
+                for p, v in zip(_STRING_POSITIONS, texts):
+                    row[p] = v
+            for name, (_, s) in NUMERIC_COLUMNS.items():
+                values = np.asarray(blocks[name][start:stop]).reshape(stop - start, -1).tolist()
+                for row, vals in zip(page, values):
+                    row[s] = ["" if v == EMPTY else v for v in vals]
+            for row, code in zip(page, games[start:stop].tolist()):
+                row[_GAME_COL] = "" if code == EMPTY else self.game_codes[code]
+            yield page
+
+
+def sync(store, tab_name: str = ARCHIVE_TAB, directory: Optional[str] = None) -> int:
+    """Acrescenta ao arquivo as linhas do store com id maior que o último arquivado."""
+    if not store.has_row_ids:
+        logger.warning("Store '%s' não tem ids de linha; o arquivo colunar só é alimentado pelo store SQLite.", store.name)
+        return 0
+    writer = ArchiveWriter(tab_name, directory)
+    added = 0
+    with file_lock(f"archive-{tab_name}"):
+        last_id = _read_meta(writer.directory, tab_name)["last_id"]
+        for page in store.iter_rows_since(tab_name, last_id, PAGE_SIZE):
+            added += writer.append(page)
+    if added:
+        logger.info("Arquivo colunar: %d linhas acrescentadas.", added)
+    return added
+
+
+def info(reader: ArchiveReader) -> Dict[str, Any]:
+    sizes = {k: os.path.getsize(p) for k, p in reader.files.items() if os.path.exists(p)}
+    return {
+        "tab": reader.tab_name,
+        "rows": reader.rows,
+        "last_id": reader.meta["last_id"],
+        "bytes": sum(sizes.values()),
+        "files": sizes,
+        "game_codes": reader.game_codes,
+    }
+
+
+if __name__ == "__main__":
+    import sys
+    import csv
+
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    command = sys.argv[1] if len(sys.argv) > 1 else "info"
+    if command == "sync":
+        import storage
+
+        print(f"{sync(storage.get_store())} linhas acrescentadas.")
+    elif command == "info":
+        print(json.dumps(info(ArchiveReader()), indent=2, ensure_ascii=False))
+    elif command == "rescore":
+        import qap_scoring
+
+        reader = ArchiveReader()
+        scores = qap_scoring.score_archive(reader)
+        if len(sys.argv) > 2:
+            with open(sys.argv[2], "w", newline="", encoding="utf-8") as f:
+                writer = csv.writer(f)
+                writer.writerow(["id", *scores])
+                for i, row_id in enumerate(reader.ids().tolist()):
+                    writer.writerow([row_id, *(int(v[i]) for v in scores.values())])
+        print(f"{len(reader)} participantes repontuados.")
+    else:
+        print("uso: python response_archive.py [sync|info|rescore [saida.csv]]")
+        sys.exit(1)
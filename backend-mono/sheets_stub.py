@@ -0,0 +1,211 @@
+# server/sheets_stub.py
+"""
+sheets_stub.py
+Servidor HTTP local que imita a API de valores do Google Sheets v4
+(values.append, values.get e values.update), para benchmarks e testes.
+
+Uso:
+    python sheets_stub.py --port 8030 --latency 0.15 --error-rate 0.02
+    SHEETS_API_ENDPOINT=http://127.0.0.1:8030/ SPREADSHEET_ID=stub uvicorn main:app
+
+As abas ficam em memória (criadas no primeiro acesso). Erros injetados
+voltam no formato de erro da API do Google, com Retry-After nos 429.
+GET /_stats devolve as chamadas recebidas por método e as linhas por aba.
+"""
+
+import re
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, List, Optional, Tuple
+from urllib.parse import unquote, urlsplit
+
+_PATH = re.compile(r"^/v4/spreadsheets/([^/]+)/values/([^:?]+)(?::(append))?$")
+_CELL = re.compile(r"^([A-Z]*)(\d*)$")
+
+_STATUS_NAMES = {429: "RESOURCE_EXHAUSTED", 500: "INTERNAL", 503: "UNAVAILABLE"}
+
+
+def _column_number(letters: str) -> int:
+    n = 0
+    for ch in letters:
+        n = n * 26 + ord(ch) - 64
+    return n
+
+
+def _column_letter(n: int) -> str:
+    letters = ""
+    while n > 0:
+        n, rem = divmod(n - 1, 26)
+        letters = chr(65 + rem) + letters
+    return letters
+
+
+def parse_range(a1: str) -> Tuple[str, int, Optional[int], int, Optional[int]]:
+    """
+    "Aba!A2:CB10" -> (aba, col1, linha1, col2, linha2), 1-based; linha None
+    quando o intervalo é de colunas inteiras ("Aba!A:A").
+    """
+    tab, _, cells = a1.rpartition("!")
+    tab = tab.strip("'") or cells
+    if not _:
+        return tab, 1, None, 26 * 27, None
+    start, _, end = cells.partition(":")
+    m1, m2 = _CELL.match(start.upper()), _CELL.match((end or start).upper())
+    if not m1 or not m2:
+        raise ValueError(f"intervalo inválido: {a1}")
+    col1 = _column_number(m1.group(1) or "A")
+    col2 = _column_number(m2.group(1)) if m2.group(1) else 26 * 27
+    row1 = int(m1.group(2)) if m1.group(2) else None
+    row2 = int(m2.group(2)) if m2.group(2) else None
+    return tab, col1, row1, col2, row2
+
+
+class SheetsStubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency: float = 0.0, error_rate: float = 0.0, error_status: int = 503):
+        super().__init__(address, _Handler)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.lock = threading.Lock()
+        self.tabs: dict = {}
+        self.stats = {"append": 0, "get": 0, "update": 0, "errors": 0, "rows_appended": 0}
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def rows(self, tab: str) -> List[List[Any]]:
+        return self.tabs.setdefault(tab, [])
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: SheetsStubServer
+    protocol_version = "HTTP/1.1"  # keep-alive, como a API real
+
+    def _reply(self, status: int, body: dict, headers: Optional[dict] = None) -> None:
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=UTF-8")
+        self.send_header("Content-Length", str(len(data)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _error(self, status: int, message: str) -> None:
+        headers = {"Retry-After": "1"} if status == 429 else None
+        body = {"error": {"code": status, "message": message, "status": _STATUS_NAMES.get(status, "FAILED_PRECONDITION")}}
+        self._reply(status, body, headers)
+
+    def _route(self, method: str) -> None:
+        length = int(self.headers.get("Content-Length", 0) or 0)
+        raw = self.rfile.read(length) if length else b""
+        path = urlsplit(self.path).path
+
+        if method == "GET" and path == "/_stats":
+            with self.server.lock:
+                tabs = {name: len(rows) for name, rows in self.server.tabs.items()}
+                return self._reply(200, {**self.server.stats, "tabs": tabs})
+
+        m = _PATH.match(path)
+        if not m:
+            return self._error(404, "not found")
+        a1 = unquote(m.group(2))
+        op = "append" if m.group(3) else {"GET": "get", "PUT": "update"}.get(method)
+        if op is None or (op == "append") != (method == "POST"):
+            return self._error(405, "método não suportado")
+
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        with self.server.lock:
+            self.server.stats[op] += 1
+            inject = random.random() < self.server.error_rate
+            if inject:
+                self.server.stats["errors"] += 1
+        if inject:
+            return self._error(self.server.error_status, "erro injetado")
+
+        try:
+            tab, col1, row1, col2, row2 = parse_range(a1)
+            body = json.loads(raw) if raw else {}
+        except ValueError as e:
+            return self._error(400, str(e))
+
+        with self.server.lock:
+            rows = self.server.rows(tab)
+            if op == "append":
+                values = body.get("values") or []
+                start = len(rows) + 1
+                rows.extend([list(v) for v in values])
+                self.server.stats["rows_appended"] += len(values)
+                width = max((len(v) for v in values), default=1)
+                end = start + len(values) - 1
+                updated = f"{tab}!{_column_letter(col1)}{start}:{_column_letter(col1 + width - 1)}{end}"
+                result = {"spreadsheetId": m.group(1), "updates": {
+                    "updatedRange": updated, "updatedRows": len(values), "updatedCells": sum(len(v) for v in values)}}
+            elif op == "update":
+                values = body.get("values") or []
+                r0 = (row1 or 1) - 1
+                while len(rows) < r0 + len(values):
+                    rows.append([])
+                for i, v in enumerate(values):
+                    target = rows[r0 + i]
+                    while len(target) < col1 - 1 + len(v):
+                        target.append("")
+                    target[col1 - 1:col1 - 1 + len(v)] = [str(x) if x is not None else "" for x in v]
+                result = {"spreadsheetId": m.group(1), "updatedRange": a1, "updatedRows": len(values)}
+            else:
+                first = (row1 or 1) - 1
+                last = len(rows) if row2 is None else min(row2, len(rows))
+                values = [[str(x) for x in r[col1 - 1:col2]] for r in rows[first:last]]
+                for v in values:
+                    while v and v[-1] == "":
+                        v.pop()
+                while values and not values[-1]:
+                    values.pop()
+                result = {"range": a1, "majorDimension": "ROWS"}
+                if values:
+                    result["values"] = values
+        self._reply(200, result)
+
+    def do_GET(self):
+        self._route("GET")
+
+    def do_POST(self):
+        self._route("POST")
+
+    def do_PUT(self):
+        self._route("PUT")
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub(port: int = 0, latency: float = 0.0, error_rate: float = 0.0, error_status: int = 503) -> SheetsStubServer:
+    """Sobe o stub numa thread e devolve o servidor (use server.url e server.shutdown())."""
+    server = SheetsStubServer(("127.0.0.1", port), latency=latency, error_rate=error_rate, error_status=error_status)
+    threading.Thread(target=server.serve_forever, name="sheets-stub", daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stub local da API de valores do Google Sheets v4.")
+    parser.add_argument("--port", type=int, default=8030)
+    parser.add_argument("--latency", type=float, default=0.0, help="segundos de atraso por chamada")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fração de chamadas que falham")
+    parser.add_argument("--error-status", type=int, default=503)
+    args = parser.parse_args()
+
+    server = SheetsStubServer(("127.0.0.1", args.port), args.latency, args.error_rate, args.error_status)
+    print(f"Stub do Google Sheets em {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,136 @@
+# server/startup_profile.py
+"""
+startup_profile.py
+Perfil da inicialização (cold start), ativado com STARTUP_PROFILE=1.
+
+Mede o tempo de import de cada módulo (tempo próprio e acumulado, com os
+imports aninhados) e a duração das etapas do startup (import do app,
+evento de startup, warmup) e imprime um resumo. Sem a variável, install()
+não faz nada e não há custo.
+
+Uso fora do servidor:
+    python startup_profile.py            # importa main e imprime o resumo
+"""
+
+import os
+import sys
+import time
+import threading
+import importlib.abc
+from typing import Dict, List
+
+ENABLED = os.getenv("STARTUP_PROFILE", "0") == "1"
+TOP_N = int(os.getenv("STARTUP_PROFILE_TOP", "25"))
+
+_t0 = time.perf_counter()
+_phases: List[tuple] = []
+_imports: Dict[str, List[float]] = {}  # módulo -> [acumulado, próprio]
+_local = threading.local()
+_installed = False
+
+
+class _ImportTimer(importlib.abc.MetaPathFinder):
+    """
+    Finder que só observa: encontra o spec com os finders normais e
+    envolve o exec_module do loader para medir a execução do módulo.
+    """
+
+    def find_spec(self, fullname, path, target=None):
+        if getattr(_local, "finding", False):
+            return None
+        _local.finding = True
+        try:
+            spec = None
+            for finder in sys.meta_path:
+                if finder is self or not hasattr(finder, "find_spec"):
+                    continue
+                spec = finder.find_spec(fullname, path, target)
+                if spec is not None:
+                    break
+        finally:
+            _local.finding = False
+        loader = spec.loader if spec is not None else None
+        # loaders de módulos builtin/frozen são classes compartilhadas: não mexe
+        if loader is None or isinstance(loader, type) or not hasattr(loader, "exec_module"):
+            return spec
+        if getattr(loader, "_startup_profile", False):
+            return spec  # loader compartilhado entre módulos (ex.: zipimport), já envolvido
+        original = loader.exec_module
+
+        def exec_module(module, _original=original):
+            _name = module.__name__
+            stack = getattr(_local, "stack", None)
+            if stack is None:
+                stack = _local.stack = []
+            stack.append(0.0)
+            start = time.perf_counter()
+            try:
+                _original(module)
+            finally:
+                elapsed = time.perf_counter() - start
+                children = stack.pop()
+                _imports[_name] = [elapsed, elapsed - children]
+                if stack:
+                    stack[-1] += elapsed
+
+        try:
+            loader.exec_module = exec_module
+            loader._startup_profile = True
+        except (AttributeError, TypeError):
+            pass
+        return spec
+
+
+def install() -> None:
+    """Começa a medir os imports (só com STARTUP_PROFILE=1). Chamar antes dos imports do app."""
+    global _installed
+    if ENABLED and not _installed:
+        sys.meta_path.insert(0, _ImportTimer())
+        _installed = True
+
+
+def uninstall() -> None:
+    global _installed
+    sys.meta_path[:] = [f for f in sys.meta_path if not isinstance(f, _ImportTimer)]
+    _installed = False
+
+
+def mark(phase: str, seconds: float) -> None:
+    """Registra a duração de uma etapa do startup."""
+    if ENABLED:
+        _phases.append((phase, seconds))
+
+
+def since_start() -> float:
+    """Segundos desde o import deste módulo (início do carregamento do app)."""
+    return time.perf_counter() - _t0
+
+
+def report(top: int = TOP_N) -> str:
+    """Resumo: etapas do startup e os `top` módulos com maior tempo próprio de import."""
+    lines = ["=== perfil de inicialização ==="]
+    for phase, seconds in _phases:
+        lines.append(f"{phase:<40}{seconds * 1000:>10.1f} ms")
+    if _imports:
+        total = sum(own for _, own in _imports.values())
+        lines.append(f"{len(_imports)} módulos importados, {total * 1000:.1f} ms no total")
+        lines.append(f"{'módulo':<48}{'próprio':>10}{'acumulado':>12}")
+        ranked = sorted(_imports.items(), key=lambda kv: kv[1][1], reverse=True)[:top]
+        for name, (cumulative, own) in ranked:
+            lines.append(f"{name:<48}{own * 1000:>8.1f}ms{cumulative * 1000:>10.1f}ms")
+    return "\n".join(lines)
+
+
+def import_times() -> Dict[str, Dict[str, float]]:
+    return {name: {"cumulative_ms": round(c * 1000, 2), "self_ms": round(s * 1000, 2)} for name, (c, s) in _imports.items()}
+
+
+if __name__ == "__main__":
+    ENABLED = True
+    install()
+    start = time.perf_counter()
+    import main  # noqa: F401
+
+    mark("import main", time.perf_counter() - start)
+    uninstall()
+    print(report())
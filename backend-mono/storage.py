@@ -0,0 +1,215 @@
+# server/storage.py
+"""
+storage.py
+Armazenamento das respostas por trás de append_full_response,
+increment_counter e count_rows.
+
+Backends (env STORAGE_BACKEND):
+- "sqlite" (padrão): as respostas são gravadas num SQLite local em modo WAL,
+  que é o registro oficial. Com SHEETS_REPLICA=1 (padrão) a tabela responses
+  é uma fonte da fila write-behind (write_queue.py): as linhas com id acima
+  da marca já copiada entram no journal e são replicadas para a planilha em
+  segundo plano. A cópia é tentada logo depois de cada gravação e repetida
+  pelo flusher, então uma falha ali só atrasa a réplica. Se a API do Google
+  estiver lenta ou fora, a pesquisa continua funcionando e a réplica se
+  atualiza depois.
+- "sheets": a planilha é o registro oficial (via fila write-behind ou, com
+  SHEETS_WRITE_BEHIND=0, append direto).
+
+O contador de grupos nos dois casos usa o alocador configurado (allocator.py).
+"""
+
+import os
+import json
+import time
+import threading
+import logging
+from typing import Any, Collection, Dict, Iterator, List, Sequence, Tuple
+
+import g_sheets
+import resilience
+import study_stats
+import write_queue
+from allocator import allocate
+from local_db import connect
+from survey_schema import ROW_LENGTH
+
+logger = logging.getLogger("storage")
+
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "sqlite").lower()
+SHEETS_REPLICA = os.getenv("SHEETS_REPLICA", "1") == "1"
+
+
+class ResponseStore:
+    """Interface dos backends de armazenamento."""
+
+    name = ""
+    # backend de concurrency.run_blocking adequado para as escritas deste store
+    io_backend = "local"
+    # linhas com id crescente (permite ler só o que entrou depois de um id, ver iter_rows_since)
+    has_row_ids = False
+
+    def append_response(self, tab_name: str, row: Sequence[Any]) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def count_rows(self, tab_name: str) -> int:
+        raise NotImplementedError
+
+    def increment_counter(self, tab_name: str, cell: str) -> int:
+        return allocate(tab_name=tab_name, cell=cell)
+
+    def iter_pages(self, tab_name: str, page_size: int = 500) -> Iterator[List[List[Any]]]:
+        """Percorre todas as linhas gravadas, página por página (memória constante)."""
+        raise NotImplementedError
+
+    def iter_rows_since(self, tab_name: str, last_id: int, page_size: int = 500) -> Iterator[List[Tuple[int, List[Any]]]]:
+        """Páginas de (id, linha) com id > last_id, em ordem de id."""
+        raise NotImplementedError
+
+
+class SheetsStore(ResponseStore):
+    name = "sheets"
+
+    def __init__(self):
+        self.io_backend = "local" if write_queue.WRITE_BEHIND else "sheets"
+
+    def append_response(self, tab_name: str, row: Sequence[Any]) -> Dict[str, Any]:
+        if write_queue.WRITE_BEHIND:
+            return {"queued": write_queue.enqueue(tab_name, row)}
+        try:
+            return g_sheets.append_row(tab_name, row)
+        except Exception as e:
+            # API degradada (breaker aberto ou falha transitória persistente): guarda no journal local
+            if not isinstance(e, resilience.CircuitOpenError) and not resilience.is_transient(e.__cause__ or e):
+                raise
+            logger.warning("Planilha indisponível (%s); linha guardada na fila write-behind.", e)
+            # o append pode ter chegado à planilha: o flusher confere antes de reenviar
+            return {"queued": write_queue.enqueue(tab_name, row, possibly_sent=resilience.may_have_applied(e)), "spilled": True}
+
+    def count_rows(self, tab_name: str) -> int:
+        return g_sheets.count_rows(tab_name)
+
+    def iter_pages(self, tab_name: str, page_size: int = 500) -> Iterator[List[List[Any]]]:
+        start = 1
+        while True:
+            rows = g_sheets.get_rows(tab_name, start, page_size, ROW_LENGTH)
+            # linha de cabeçalho (write_header_row) não é resposta
+            page = [r for r in rows if not (start == 1 and r and r[0] == "timestamp")]
+            if page:
+                yield page
+            if len(rows) < page_size:
+                return
+            start += page_size
+
+
+class SQLiteStore(ResponseStore):
+    name = "sqlite"
+    DB_NAME = "responses"
+    SOURCE = "sqlite-responses"  # nome da fonte na fila write-behind
+    has_row_ids = True
+
+    _SCHEMA = """
+    CREATE TABLE IF NOT EXISTS responses (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        tab TEXT NOT NULL,
+        row TEXT NOT NULL,
+        created_at REAL NOT NULL
+    )
+    """
+
+    def __init__(self, replicate: bool = SHEETS_REPLICA):
+        self.replicate = replicate
+        conn = connect(self.DB_NAME)
+        conn.execute(self._SCHEMA)
+        conn.execute("CREATE INDEX IF NOT EXISTS responses_tab ON responses (tab, id)")
+        if replicate:
+            # primeira execução: o que já está gravado foi enfileirado pela versão anterior
+            start_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM responses").fetchone()[0]
+            write_queue.register_source(self.SOURCE, self._rows_after, start_id)
+
+    def _rows_after(self, last_id: int, limit: int) -> List[Tuple[int, str, str, float]]:
+        return connect(self.DB_NAME).execute(
+            "SELECT id, tab, row, created_at FROM responses WHERE id > ? ORDER BY id LIMIT ?", (last_id, limit)
+        ).fetchall()
+
+    def append_response(self, tab_name: str, row: Sequence[Any]) -> Dict[str, Any]:
+        cur = connect(self.DB_NAME).execute(
+            "INSERT INTO responses (tab, row, created_at) VALUES (?, ?, ?)",
+            (tab_name, json.dumps(list(row), ensure_ascii=False), time.time()),
+        )
+        result: Dict[str, Any] = {"id": cur.lastrowid}
+        if self.replicate:
+            # a resposta já está salva; se a cópia falhar aqui o flusher a faz no próximo ciclo
+            try:
+                result["queued"] = write_queue.copy_from(self.SOURCE)
+            except Exception:
+                logger.exception("Falha ao copiar a resposta %d para a fila da planilha; o flusher tenta de novo.", cur.lastrowid)
+        return result
+
+    def count_rows(self, tab_name: str) -> int:
+        return connect(self.DB_NAME).execute("SELECT COUNT(*) FROM responses WHERE tab = ?", (tab_name,)).fetchone()[0]
+
+    def iter_pages(self, tab_name: str, page_size: int = 500) -> Iterator[List[List[Any]]]:
+        for page in self.iter_rows_since(tab_name, 0, page_size):
+            yield [row for _, row in page]
+
+    def iter_rows_since(self, tab_name: str, last_id: int, page_size: int = 500) -> Iterator[List[Tuple[int, List[Any]]]]:
+        while True:
+            # keyset pagination: cada página pode rodar numa thread diferente (StreamingResponse)
+            rows = connect(self.DB_NAME).execute(
+                "SELECT id, row FROM responses WHERE tab = ? AND id > ? ORDER BY id LIMIT ?",
+                (tab_name, last_id, page_size),
+            ).fetchall()
+            if not rows:
+                return
+            last_id = rows[-1][0]
+            yield [(r[0], json.loads(r[1])) for r in rows]
+            if len(rows) < page_size:
+                return
+
+
+_BACKENDS = {
+    "sqlite": SQLiteStore,
+    "sheets": SheetsStore,
+}
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store() -> ResponseStore:
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                cls = _BACKENDS.get(STORAGE_BACKEND)
+                if cls is None:
+                    raise RuntimeError(f"STORAGE_BACKEND inválido: {STORAGE_BACKEND!r} (use {', '.join(_BACKENDS)}).")
+                _store = cls()
+                logger.info("Armazenamento de respostas: %s", _store.name)
+    return _store
+
+
+def append_row(tab_name: str, row: Sequence[Any]) -> Dict[str, Any]:
+    """Grava uma linha já montada (ver g_sheets.build_full_row) no store configurado."""
+    store = get_store()
+    result = store.append_response(tab_name, row)
+    study_stats.on_append(store, tab_name, row, result.get("id"))
+    return result
+
+
+def append_full_response(payload: Dict[str, Any], tab_name: str = g_sheets.DEFAULT_TAB, coerced: Collection[str] = ()) -> Dict[str, Any]:
+    """Valida o payload, monta a linha e grava no store configurado."""
+    return append_row(tab_name, g_sheets.build_full_row(payload, coerced))
+
+
+def increment_counter(tab_name: str = "counter", cell: str = "A1") -> int:
+    return get_store().increment_counter(tab_name, cell)
+
+
+def count_rows(tab_name: str = g_sheets.DEFAULT_TAB) -> int:
+    return get_store().count_rows(tab_name)
+
+
+def status() -> Dict[str, Any]:
+    return {"backend": STORAGE_BACKEND, "sheets_replica": STORAGE_BACKEND == "sqlite" and SHEETS_REPLICA}
@@ -0,0 +1,339 @@
+# server/study_stats.py
+"""
+study_stats.py
+Estatísticas do estudo mantidas de forma incremental (GET /api/stats).
+
+Para cada grupo (coluna "game": badnews / pacman) são guardados contagem,
+soma e soma dos quadrados de qap_sum e de cada item dos blocos QAP (37),
+Wisconsin (5) e notícias (12 + 12). Média e desvio padrão saem desses
+agregados, então a consulta é O(1) e nunca relê respostas nem toca na API
+do Sheets.
+
+Os agregados são função das linhas do store até `last_id`, mais as linhas
+gravadas por este processo com id maior (`_ahead`). A gravação
+(storage.append_row) só soma a linha nova na memória, em O(1). As linhas
+de outros workers entram pelo catch-up (leitura do store a partir de
+last_id), feito na consulta (/api/stats) e por uma thread de fundo, que
+também salva o estado em STATE_DIR/study_stats.json (checkpoint). Assim
+vários workers lendo o mesmo SQLite chegam aos mesmos números. Na
+inicialização o checkpoint é carregado e completado com as linhas mais
+novas; sem checkpoint, os agregados são reconstruídos a partir do store
+local. Com STORAGE_BACKEND=sheets, que não tem ids, só entram as linhas
+gravadas por este processo, somadas às do checkpoint.
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+import logging
+from typing import Any, Dict, List, Optional, Sequence, Set
+
+import numpy as np
+
+from local_db import STATE_DIR
+from survey_schema import HEADER, block_slice, column_index
+
+logger = logging.getLogger("study_stats")
+
+STATS_TAB = os.getenv("SHEET_TAB", "responses")
+CHECKPOINT_EVERY = int(os.getenv("STATS_CHECKPOINT_EVERY", "50"))  # linhas novas entre checkpoints
+CHECKPOINT_INTERVAL = float(os.getenv("STATS_CHECKPOINT_INTERVAL", "30"))  # ou segundos
+PAGE_SIZE = 1000
+
+# nome no relatório -> campo do schema
+BLOCKS = {"qap": "qap_responses", "wisconsin": "wisconsin", "news_first": "news_first", "news_second": "news_second"}
+_SLICES = {name: block_slice(key) for name, key in BLOCKS.items()}
+_GAME_COL = column_index("game")
+_QAP_SUM_COL = column_index("qap_sum")
+# checkpoint de outro layout de linha não serve
+_FINGERPRINT = hashlib.sha1("|".join(HEADER).encode("utf-8")).hexdigest()
+
+
+def _num(v: Any) -> float:
+    if v is None or v == "":
+        return np.nan
+    try:
+        return float(int(v))
+    except (TypeError, ValueError):
+        return np.nan
+
+
+class _Moments:
+    """Contagem, soma e soma dos quadrados por item (células vazias não contam)."""
+
+    def __init__(self, size: int):
+        self.n = np.zeros(size, dtype=np.int64)
+        self.sum = np.zeros(size, dtype=np.int64)
+        self.sumsq = np.zeros(size, dtype=np.int64)
+
+    def add(self, values: np.ndarray) -> None:
+        """values: matriz (linhas x itens) em float, NaN para vazio."""
+        mask = ~np.isnan(values)
+        v = np.where(mask, values, 0).astype(np.int64)
+        self.n += mask.sum(axis=0)
+        self.sum += v.sum(axis=0)
+        self.sumsq += (v * v).sum(axis=0)
+
+    def summary(self) -> Dict[str, List[Optional[float]]]:
+        n = self.n.astype(np.float64)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = self.sum / n
+            var = (self.sumsq - self.sum.astype(np.float64) ** 2 / n) / (n - 1)
+        std = np.sqrt(np.clip(var, 0, None))
+        return {
+            "n": self.n.tolist(),
+            "mean": [None if not np.isfinite(x) else round(float(x), 4) for x in mean],
+            "std": [None if not np.isfinite(x) else round(float(x), 4) for x in std],
+            "sum": self.sum.tolist(),
+            "sumsq": self.sumsq.tolist(),
+        }
+
+    def to_dict(self) -> Dict[str, List[int]]:
+        return {"n": self.n.tolist(), "sum": self.sum.tolist(), "sumsq": self.sumsq.tolist()}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, List[int]]) -> "_Moments":
+        m = cls(len(data["n"]))
+        m.n[:], m.sum[:], m.sumsq[:] = data["n"], data["sum"], data["sumsq"]
+        return m
+
+
+class _GroupStats:
+    def __init__(self):
+        self.participants = 0
+        self.qap_sum = _Moments(1)
+        self.blocks = {name: _Moments(s.stop - s.start) for name, s in _SLICES.items()}
+
+    def add_rows(self, rows: Sequence[Sequence[Any]]) -> None:
+        self.participants += len(rows)
+        self.qap_sum.add(np.array([[_num(r[_QAP_SUM_COL])] for r in rows], dtype=np.float64))
+        for name, s in _SLICES.items():
+            self.blocks[name].add(np.array([[_num(v) for v in r[s]] for r in rows], dtype=np.float64))
+
+    def summary(self) -> Dict[str, Any]:
+        qap_sum = self.qap_sum.summary()
+        return {
+            "participants": self.participants,
+            "qap_sum": {k: v[0] for k, v in qap_sum.items()},
+            "items": {name: m.summary() for name, m in self.blocks.items()},
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "participants": self.participants,
+            "qap_sum": self.qap_sum.to_dict(),
+            "blocks": {name: m.to_dict() for name, m in self.blocks.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "_GroupStats":
+        g = cls()
+        g.participants = data["participants"]
+        g.qap_sum = _Moments.from_dict(data["qap_sum"])
+        g.blocks = {name: _Moments.from_dict(data["blocks"][name]) for name in _SLICES}
+        return g
+
+
+class StudyStats:
+    def __init__(self, tab_name: str = STATS_TAB, path: Optional[str] = None):
+        self.tab_name = tab_name
+        self.path = path or os.path.join(STATE_DIR, "study_stats.json")
+        self._lock = threading.RLock()
+        self._catch_up_lock = threading.Lock()  # um catch-up por vez; gravações não esperam por ele
+        self._groups: Dict[str, _GroupStats] = {}
+        self.last_id = 0
+        self._ahead: Set[int] = set()  # ids > last_id já somados por on_append
+        self._loaded = False
+        self._pending = 0  # linhas desde o último checkpoint
+        self._last_checkpoint = time.monotonic()
+
+    # --- atualização ---
+    def add_rows(self, rows: Sequence[Sequence[Any]]) -> None:
+        by_group: Dict[str, List[Sequence[Any]]] = {}
+        for r in rows:
+            if len(r) <= _GAME_COL:
+                continue
+            by_group.setdefault(str(r[_GAME_COL]) or "sem_grupo", []).append(r)
+        with self._lock:
+            for group, group_rows in by_group.items():
+                self._groups.setdefault(group, _GroupStats()).add_rows(group_rows)
+            self._pending += len(rows)
+
+    def catch_up(self, store) -> int:
+        """Soma as linhas do store com id > last_id (menos as já somadas). Devolve quantas entraram."""
+        added = 0
+        with self._catch_up_lock:
+            # as páginas são lidas sem a trava dos agregados; só a soma segura _lock
+            for page in store.iter_rows_since(self.tab_name, self.last_id, PAGE_SIZE):
+                with self._lock:
+                    new_rows = [row for row_id, row in page if row_id > self.last_id and row_id not in self._ahead]
+                    self._ahead.difference_update(row_id for row_id, _ in page)
+                    self.add_rows(new_rows)
+                    self.last_id = max(self.last_id, page[-1][0])
+                added += len(new_rows)
+        return added
+
+    def ensure_loaded(self, store) -> None:
+        if self._loaded:
+            return
+        with self._catch_up_lock:
+            if self._loaded:
+                return
+            start = time.perf_counter()
+            self.load()
+            self._loaded = True
+        added = self.catch_up(store) if store.has_row_ids else 0
+        logger.info("Estatísticas do estudo carregadas (last_id=%d, %d linhas novas em %.0f ms).",
+                    self.last_id, added, (time.perf_counter() - start) * 1000)
+        if added:
+            self.checkpoint()
+
+    def on_append(self, store, row: Sequence[Any], row_id: Optional[int] = None) -> None:
+        """Soma uma linha recém-gravada, só na memória (O(1); catch-up e checkpoint ficam fora da gravação)."""
+        if not self._loaded:
+            if store.has_row_ids:
+                return  # o catch-up da carga vai encontrar a linha
+            self.ensure_loaded(store)
+        with self._lock:
+            if row_id is not None:
+                if row_id <= self.last_id or row_id in self._ahead:
+                    return
+                self._ahead.add(row_id)
+            self.add_rows([row])
+
+    # --- persistência ---
+    def load(self) -> bool:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return False
+        except (OSError, ValueError):
+            logger.exception("Checkpoint de estatísticas ilegível em %s; reconstruindo.", self.path)
+            return False
+        if data.get("fingerprint") != _FINGERPRINT or data.get("tab") != self.tab_name:
+            logger.warning("Checkpoint de estatísticas de outro layout/aba; reconstruindo.")
+            return False
+        with self._lock:
+            self._groups = {g: _GroupStats.from_dict(v) for g, v in data["groups"].items()}
+            self.last_id = data["last_id"]
+            self._ahead = set(data.get("ahead", []))
+        return True
+
+    def checkpoint(self) -> None:
+        with self._lock:
+            data = {
+                "fingerprint": _FINGERPRINT,
+                "tab": self.tab_name,
+                "last_id": self.last_id,
+                "ahead": sorted(self._ahead),
+                "saved_at": time.time(),
+                "groups": {g: s.to_dict() for g, s in self._groups.items()},
+            }
+            self._pending = 0
+            self._last_checkpoint = time.monotonic()
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp, self.path)
+
+    def maybe_checkpoint(self) -> None:
+        if self._pending >= CHECKPOINT_EVERY or (self._pending and time.monotonic() - self._last_checkpoint >= CHECKPOINT_INTERVAL):
+            try:
+                self.checkpoint()
+            except OSError:
+                logger.exception("Falha ao salvar checkpoint das estatísticas.")
+
+    # --- leitura ---
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            groups = {g: s.summary() for g, s in sorted(self._groups.items())}
+            last_id = self.last_id
+        counts = {g: s["participants"] for g, s in groups.items()}
+        return {
+            "tab": self.tab_name,
+            "last_id": last_id,
+            "participants": sum(counts.values()),
+            "balance": {"counts": counts, "difference": (max(counts.values()) - min(counts.values())) if counts else 0},
+            "groups": groups,
+        }
+
+
+_stats = StudyStats()
+
+
+def on_append(store, tab_name: str, row: Sequence[Any], row_id: Optional[int] = None) -> None:
+    """Chamado depois de cada resposta gravada (storage.append_row)."""
+    if tab_name != _stats.tab_name:
+        return
+    try:
+        _stats.on_append(store, row, row_id)
+    except Exception:
+        # estatística nunca derruba a gravação; o próximo catch-up recupera
+        logger.exception("Falha ao atualizar estatísticas do estudo.")
+
+
+def load(store) -> None:
+    _stats.ensure_loaded(store)
+
+
+def refresh(store) -> None:
+    """Catch-up das linhas de outros workers e checkpoint se for a hora (fora do caminho de gravação)."""
+    _stats.ensure_loaded(store)
+    if store.has_row_ids:
+        _stats.catch_up(store)
+    _stats.maybe_checkpoint()
+
+
+def snapshot(store) -> Dict[str, Any]:
+    refresh(store)
+    return _stats.snapshot()
+
+
+def checkpoint() -> None:
+    if _stats._loaded:
+        _stats.checkpoint()
+
+
+class _Refresher:
+    """Thread de fundo: refresh() a cada CHECKPOINT_INTERVAL segundos."""
+
+    def __init__(self, store, interval: float = CHECKPOINT_INTERVAL):
+        self.store = store
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="study-stats", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                refresh(self.store)
+            except Exception:
+                logger.exception("Falha ao atualizar estatísticas do estudo em segundo plano.")
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        self._thread.join(timeout=timeout)
+
+
+_refresher: Optional[_Refresher] = None
+
+
+def start_refresher(store) -> None:
+    global _refresher
+    if _refresher is None:
+        _refresher = _Refresher(store)
+        _refresher.start()
+
+
+def stop_refresher() -> None:
+    global _refresher
+    if _refresher is not None:
+        _refresher.stop()
+        _refresher = None
@@ -0,0 +1,175 @@
+# server/survey_schema.py
+"""
+survey_schema.py
+Layout declarativo da linha de resposta gravada na planilha.
+
+Cada coluna (ou bloco de colunas) diz de qual campo do payload vem, quantas
+colunas ocupa e como o valor é convertido. O schema é compilado uma vez em
+um encoder que valida e monta a linha numa única passada, e também gera o
+cabeçalho da planilha e o índice nome → coluna.
+"""
+
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Callable, Collection, Dict, List, Optional, Tuple
+
+
+def now_iso() -> str:
+    return datetime.utcnow().isoformat() + "Z"
+
+
+def safe_cell(v: Any) -> str:
+    """Converte valor para string segura para planilha (vazio para None)."""
+    if v is None:
+        return ""
+    if isinstance(v, bool):
+        return "1" if v else "0"
+    if isinstance(v, (int, float)):
+        return str(v)
+    # para strings: strip e retornar
+    s = str(v).strip()
+    return s
+
+
+def _raw(v: Any) -> Any:
+    return v
+
+
+def _int_or_empty(x: Any) -> Any:
+    return int(x) if x is not None and x != "" else ""
+
+
+def _sim_nao(v: Any) -> str:
+    return "sim" if v else "não"
+
+
+def _nao_sim(v: Any) -> str:
+    return "não" if v else "sim"
+
+
+def _game(v: Any) -> str:
+    return "badnews" if v == "par" else "pacman"
+
+
+def _qap_sum_default(payload: Dict[str, Any]) -> int:
+    qap = payload.get("qap_responses") or []
+    return sum([int(x) for x in qap if isinstance(x, (int, float, str)) and str(x).strip() != ""])
+
+
+@dataclass(frozen=True)
+class Column:
+    """
+    Uma coluna (length=1) ou um bloco de `length` colunas vindas de uma lista.
+    `default` pode ser um valor ou uma função do payload (usada quando o campo falta).
+    """
+    key: str
+    header: str
+    encode: Callable[[Any], Any] = _raw
+    length: int = 1
+    default: Any = ""
+
+    @property
+    def is_block(self) -> bool:
+        return self.length > 1
+
+    def headers(self) -> List[str]:
+        if not self.is_block:
+            return [self.header]
+        return [f"{self.header}_{i}" for i in range(1, self.length + 1)]
+
+
+# Ordem exata das colunas na planilha (A = timestamp).
+SCHEMA: Tuple[Column, ...] = (
+    Column("timestamp", "timestamp", safe_cell, default=lambda payload: now_iso()),
+    Column("idade", "idade"),
+    Column("genero", "genero", safe_cell),
+    Column("etnia", "etnia", safe_cell),
+    Column("escolaridade", "escolaridade", safe_cell),
+    Column("estado", "estado", safe_cell),
+    Column("qap_responses", "qap", _int_or_empty, length=37),
+    Column("qap_sum", "qap_sum", int, default=_qap_sum_default),
+    Column("autodeclaracao", "autodeclaracao"),
+    Column("wisconsin", "wisconsin", _int_or_empty, length=5),
+    Column("news_first", "news_first", _int_or_empty, length=12),
+    Column("news_second", "news_second", _int_or_empty, length=12),
+    Column("game", "game", _game),
+    Column("game_time_seconds", "game_time_seconds"),
+    Column("atencao1", "atencao1", _sim_nao),
+    Column("atencao2", "atencao2", _sim_nao),
+    # gravadas invertidas: "sim" = permaneceu em tela cheia / não ficou inativo (> 4 min)
+    Column("exited_fullscreen", "permaneceu_fullscreen", _nao_sim, default=False),
+    Column("had_inactivity", "sem_inatividade", _nao_sim, default=False),
+)
+
+
+class RowEncoder:
+    """Schema compilado: monta linhas, cabeçalho e índice de colunas."""
+
+    def __init__(self, schema: Tuple[Column, ...]):
+        self.schema = schema
+        self.header: List[str] = [h for col in schema for h in col.headers()]
+        self.row_length = len(self.header)
+        self.index: Dict[str, int] = {h: i for i, h in enumerate(self.header)}
+        self.blocks: Dict[str, slice] = {}
+        self._plan = []
+        start = 0
+        for col in schema:
+            self.blocks[col.key] = slice(start, start + col.length)
+            start += col.length
+            self._plan.append((col.key, col.length if col.is_block else 0, col.encode, col.default, callable(col.default)))
+        self._block_errors = {
+            col.key: f"Campo '{col.key}' deve ser lista com {col.length} elementos." for col in schema if col.is_block
+        }
+
+    def encode(self, payload: Dict[str, Any], coerced: Collection[str] = ()) -> List[Any]:
+        """
+        Valida o payload e devolve a linha completa numa única passada.
+        Blocos listados em `coerced` já chegam convertidos (ex.: validados no
+        endpoint) e são copiados sem reconverter cada item.
+        Levanta ValueError se um bloco faltar, tiver o tamanho errado ou itens inválidos.
+        """
+        row: List[Any] = []
+        get = payload.get
+        for key, length, encode, default, default_is_fn in self._plan:
+            value = get(key)
+            if length:
+                if not isinstance(value, (list, tuple)) or len(value) != length:
+                    raise ValueError(self._block_errors[key])
+                if key in coerced:
+                    row.extend(value)
+                else:
+                    row.extend([encode(x) for x in value])
+                continue
+            if value is None:
+                if default_is_fn:
+                    row.append(encode(default(payload)))
+                    continue
+                value = default
+            row.append(encode(value))
+        return row
+
+    def column(self, name: str) -> int:
+        """Índice (0-based) da coluna pelo nome do cabeçalho."""
+        return self.index[name]
+
+
+ENCODER = RowEncoder(SCHEMA)
+HEADER: List[str] = ENCODER.header
+ROW_LENGTH: int = ENCODER.row_length
+
+
+def build_row(payload: Dict[str, Any], coerced: Collection[str] = ()) -> List[Any]:
+    return ENCODER.encode(payload, coerced)
+
+
+def header_row() -> List[str]:
+    return list(HEADER)
+
+
+def block_slice(key: str) -> slice:
+    """Faixa de colunas ocupada pelo campo `key` (ex.: 'qap_responses')."""
+    return ENCODER.blocks[key]
+
+
+def column_index(name: str) -> Optional[int]:
+    return ENCODER.index.get(name)
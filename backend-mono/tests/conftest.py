@@ -0,0 +1,58 @@
+# server/tests/conftest.py
+"""
+conftest.py
+Ambiente dos testes: STATE_DIR temporário e os stand-ins locais do Google
+Sheets (sheets_stub.py) e do Brevo (brevo_stub.py).
+
+Os módulos do app leem a configuração no import, então as variáveis são
+definidas aqui, antes de qualquer import de main/storage/email_outbox.
+"""
+
+import os
+import sys
+import tempfile
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+os.chdir(BACKEND_DIR)  # o PDF do TCLE é lido de ./data/pdf
+
+import brevo_stub  # noqa: E402
+import sheets_stub  # noqa: E402
+
+_brevo = brevo_stub.start_stub()
+_sheets = sheets_stub.start_stub()
+
+os.environ.update(
+    STATE_DIR=tempfile.mkdtemp(prefix="tests-state-"),
+    STORAGE_BACKEND="sqlite",
+    SHEETS_API_ENDPOINT=_sheets.url,
+    SPREADSHEET_ID="tests",
+    SHEET_TAB="responses",
+    BREVO_API_URL=_brevo.url,
+    BREVO_API_KEY="tests",
+    EMAIL_FROM="tests@bench.local",
+    EXPORT_TOKEN="tests-token",
+    STARTUP_WARMUP="0",
+)
+
+
+@pytest.fixture(scope="session")
+def brevo():
+    return _brevo
+
+
+@pytest.fixture(scope="session")
+def sheets():
+    return _sheets
+
+
+@pytest.fixture(scope="session")
+def client():
+    from fastapi.testclient import TestClient
+
+    import main
+
+    with TestClient(main.app) as c:
+        yield c
@@ -0,0 +1,65 @@
+# server/tests/test_admission.py
+"""Controle de admissão: limites por IP só atrás de proxies confiáveis e fila com timeout."""
+
+import asyncio
+import ipaddress
+import time
+import uuid
+
+import pytest
+
+import admission
+import email_outbox
+
+
+def _scope(peer, forwarded=None):
+    headers = [(b"x-forwarded-for", forwarded.encode())] if forwarded else []
+    return {"type": "http", "client": (peer, 40000), "headers": headers}
+
+
+@pytest.fixture
+def trusted(monkeypatch):
+    monkeypatch.setattr(admission, "TRUSTED_PROXIES", [ipaddress.ip_network("10.0.0.0/8")])
+
+
+def test_default_config_has_no_per_ip_limit(client):
+    # sem ADMISSION_TRUSTED_PROXIES, todos atrás do mesmo proxy não viram um único "cliente"
+    assert admission._client_ip(_scope("10.1.2.3", "203.0.113.7")) is None
+    statuses = [client.post("/api/tcle", json={"destinatario": f"adm-{uuid.uuid4().hex[:8]}@bench.local"}).status_code
+                for _ in range(60)]
+    assert 429 not in statuses
+    assert client.get("/api/inflight").json()["admission"]["per_ip_limits"] is False
+    # não deixa a caixa de saída cheia para os próximos testes
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline and email_outbox.stats()[email_outbox.QUEUED]:
+        time.sleep(0.05)
+
+
+def test_rightmost_untrusted_hop_is_the_client(trusted):
+    assert admission._client_ip(_scope("10.0.0.5", "203.0.113.7, 10.0.0.9")) == "203.0.113.7"
+    assert admission._client_ip(_scope("10.0.0.5")) == "10.0.0.5"  # só rede interna
+
+
+def test_spoofed_forwarded_entries_are_ignored(trusted):
+    # o cliente inventa o começo do cabeçalho; o proxy acrescenta o IP real
+    assert admission._client_ip(_scope("10.0.0.5", "1.2.3.4, 198.51.100.20")) == "198.51.100.20"
+    assert admission._client_ip(_scope("10.0.0.5", "lixo, 198.51.100.20")) == "198.51.100.20"
+    # conexão direta de fora: o cabeçalho não vale nada
+    assert admission._client_ip(_scope("198.51.100.20", "1.2.3.4")) == "198.51.100.20"
+
+
+def test_queue_timeout_leaves_the_queue(monkeypatch):
+    monkeypatch.setattr(admission, "QUEUE_TIMEOUT", 0.05)
+    policy = admission.EndpointPolicy("TEST", "POST", "/teste", concurrency=1, queue=4,
+                                      rate=0, burst=0, ip_rate=0, ip_burst=0)
+
+    async def scenario():
+        await admission.acquire(policy, None)
+        with pytest.raises(admission.Rejected) as excinfo:
+            await admission.acquire(policy, None)
+        assert excinfo.value.reason == "queue_timeout"
+        assert len(policy.waiters) == 0
+        admission.release(policy)
+
+    asyncio.run(scenario())
+    assert policy.in_flight == 0
@@ -0,0 +1,81 @@
+# server/tests/test_allocator.py
+"""Semente e espelho do contador de grupos (allocator.py) contra o stub do Sheets."""
+
+import uuid
+
+import pytest
+
+import allocator
+import g_sheets
+from local_db import connect
+
+
+@pytest.fixture
+def tab():
+    return f"contador_{uuid.uuid4().hex[:8]}"
+
+
+def _sheet_value(sheets, tab):
+    rows = sheets.rows(tab)
+    return rows[0][0] if rows and rows[0] else ""
+
+
+def test_seeds_from_sheet(tab):
+    g_sheets.set_cell_value(tab, "A1", 500)
+    alloc = allocator.SQLiteAllocator(tab, "A1")
+    try:
+        assert alloc.next() == 501
+    finally:
+        alloc.close()
+
+
+def test_read_failure_does_not_seed_zero(tab, sheets, monkeypatch):
+    g_sheets.set_cell_value(tab, "A1", 500)
+
+    def unavailable(*args, **kwargs):
+        raise RuntimeError("planilha fora do ar")
+
+    monkeypatch.setattr(g_sheets, "get_cell_value", unavailable)
+    with pytest.raises(RuntimeError):
+        allocator.SQLiteAllocator(tab, "A1")
+    row = connect(allocator.SQLiteAllocator.DB_NAME).execute(
+        "SELECT value FROM counters WHERE name = ?", (f"{tab}!A1",)).fetchone()
+    assert row is None
+
+    monkeypatch.undo()
+    alloc = allocator.SQLiteAllocator(tab, "A1")
+    try:
+        assert alloc.next() == 501
+        alloc._sync.flush()
+        assert _sheet_value(sheets, tab) == "501"
+    finally:
+        alloc.close()
+
+
+def test_invalid_cell_is_an_error(tab):
+    g_sheets.set_cell_value(tab, "A1", "abc")
+    with pytest.raises(ValueError):
+        allocator.SQLiteAllocator(tab, "A1")
+
+
+def test_empty_cell_starts_at_one(tab):
+    alloc = allocator.SQLiteAllocator(tab, "A1")
+    try:
+        assert alloc.next() == 1
+    finally:
+        alloc.close()
+
+
+def test_sync_never_lowers_the_sheet(tab, sheets):
+    # estado local atrasado (ex.: semeado errado por uma versão anterior)
+    connect(allocator.SQLiteAllocator.DB_NAME).execute(
+        "INSERT INTO counters (name, value) VALUES (?, ?)", (f"{tab}!A1", 3))
+    g_sheets.set_cell_value(tab, "A1", 500)
+    alloc = allocator.SQLiteAllocator(tab, "A1")
+    try:
+        alloc.next()
+        alloc._sync.flush()
+        assert _sheet_value(sheets, tab) == "500"
+        assert alloc.next() == 501
+    finally:
+        alloc.close()
@@ -0,0 +1,41 @@
+# server/tests/test_concurrency.py
+"""Número efetivo de workers do servidor (concurrency.web_workers)."""
+
+import pytest
+
+import concurrency
+
+
+@pytest.mark.parametrize("argv, expected", [
+    (["uvicorn", "main:app", "--workers", "4"], 4),
+    (["python", "-m", "uvicorn", "main:app", "--workers=3"], 3),
+    (["gunicorn", "-w", "2", "main:app"], 2),
+    (["gunicorn", "-w5", "main:app"], 5),
+    (["uvicorn", "main:app"], None),
+])
+def test_cli_workers(argv, expected):
+    assert concurrency._cli_workers(argv) == expected
+
+
+def _detect(monkeypatch, own, parent, env="1"):
+    cmdlines = {"own": own, "parent": parent}
+    monkeypatch.setattr(concurrency.os, "getpid", lambda: "own")
+    monkeypatch.setattr(concurrency.os, "getppid", lambda: "parent")
+    monkeypatch.setattr(concurrency, "_cmdline", lambda pid: cmdlines[pid])
+    monkeypatch.setattr(concurrency, "_web_workers", None)
+    monkeypatch.setenv("WEB_CONCURRENCY", env)
+    return concurrency.web_workers()
+
+
+def test_uvicorn_supervisor_flag_wins_over_env(monkeypatch):
+    spawned = ["python", "-c", "from multiprocessing.spawn import spawn_main; spawn_main()"]
+    assert _detect(monkeypatch, spawned, ["/usr/bin/python3", "/usr/local/bin/uvicorn", "main:app", "--workers", "4"]) == 4
+
+
+def test_single_process_uvicorn(monkeypatch):
+    assert _detect(monkeypatch, ["uvicorn", "main:app"], ["bash"], env="4") == 4
+    assert _detect(monkeypatch, ["uvicorn", "main:app", "--workers", "1"], ["bash"], env="4") == 1
+
+
+def test_without_server_command_line_uses_env(monkeypatch):
+    assert _detect(monkeypatch, ["python", "-m", "pytest"], ["bash"], env="3") == 3
@@ -0,0 +1,64 @@
+# server/tests/test_email_dedup.py
+"""Deduplicação do TCLE por destinatário (email_outbox.submit / send_now)."""
+
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import email_outbox
+
+
+def _email() -> str:
+    return f"dedup-{uuid.uuid4().hex[:12]}@bench.local"
+
+
+def test_concurrent_send_now_sends_once(brevo, monkeypatch):
+    email = _email()
+    monkeypatch.setattr(brevo, "latency", 0.2)  # as chamadas se sobrepõem ao envio em andamento
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(email_outbox.send_now, [email] * 8))
+
+    assert brevo.recipients.count(email) == 1
+    assert {message_id for message_id, _, _ in results} == {results[0][0]}
+    assert all(status == 201 for _, status, _ in results)
+    assert [duplicate for _, _, duplicate in results].count(False) == 1
+
+
+def test_submit_collapses_normalized_duplicates():
+    email = _email()
+    with ThreadPoolExecutor(max_workers=6) as pool:
+        results = list(pool.map(email_outbox.submit, [email, email.upper(), f"  {email} "] * 2))
+
+    assert len({message_id for message_id, _, _ in results}) == 1
+    assert [duplicate for _, _, duplicate in results].count(False) == 1
+
+
+def test_submit_dedup_survives_restart():
+    email = _email()
+    message_id, _, _ = email_outbox.submit(email)
+    email_outbox._recent.clear()  # memória perdida num reinício; o índice fica no SQLite
+
+    again, _, duplicate = email_outbox.submit(email)
+
+    assert duplicate
+    assert again == message_id
+
+
+def test_failed_message_does_not_block_resend():
+    email = _email()
+    message_id, _, _ = email_outbox.submit(email)
+    email_outbox._db().execute("UPDATE outbox SET status = ? WHERE id = ?", (email_outbox.FAILED, message_id))
+
+    again, _, duplicate = email_outbox.submit(email)
+
+    assert not duplicate
+    assert again != message_id
+
+
+def test_tcle_endpoint_reports_duplicate(client):
+    email = _email()
+    first = client.post("/api/tcle", json={"destinatario": email}).json()
+    second = client.post("/api/tcle", json={"destinatario": email}).json()
+
+    assert first["duplicate"] is False
+    assert second["duplicate"] is True
+    assert second["id"] == first["id"]
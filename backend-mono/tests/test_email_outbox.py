@@ -0,0 +1,90 @@
+# server/tests/test_email_outbox.py
+"""Caixa de saída do TCLE: retry das falhas transitórias e estado consultável por id."""
+
+import uuid
+
+import pytest
+
+import email_outbox
+
+
+@pytest.fixture(autouse=True)
+def paused_workers():
+    """Sem os workers de fundo do app: o teste processa a caixa com process_one."""
+    running = bool(email_outbox._workers)
+    email_outbox.stop_workers()
+    yield
+    if running:
+        email_outbox.start_workers()
+
+
+def _email() -> str:
+    return f"outbox-{uuid.uuid4().hex[:12]}@bench.local"
+
+
+def _drain():
+    while email_outbox.process_one():
+        pass
+
+
+def _make_ready(message_id):
+    email_outbox._db().execute("UPDATE outbox SET next_attempt_at = 0 WHERE id = ?", (message_id,))
+
+
+def test_transient_failure_is_retried(brevo, monkeypatch):
+    email = _email()
+    message_id = email_outbox.enqueue(email)
+    monkeypatch.setattr(brevo, "error_rate", 1.0)
+    monkeypatch.setattr(brevo, "error_status", 503)
+    _drain()
+
+    status = email_outbox.get_status(message_id)
+    assert status["status"] == email_outbox.QUEUED
+    assert status["attempts"] == 1
+    assert status["provider_status"] == 503
+    assert status["updated_at"] >= status["created_at"]
+
+    monkeypatch.undo()
+    _make_ready(message_id)
+    _drain()
+
+    status = email_outbox.get_status(message_id)
+    assert status["status"] == email_outbox.SENT
+    assert status["attempts"] == 2
+    assert brevo.recipients.count(email) == 1
+
+
+def test_permanent_failure_is_not_retried(brevo, monkeypatch):
+    message_id = email_outbox.enqueue(_email())
+    monkeypatch.setattr(brevo, "error_rate", 1.0)
+    monkeypatch.setattr(brevo, "error_status", 400)
+    _drain()
+
+    status = email_outbox.get_status(message_id)
+    assert status["status"] == email_outbox.FAILED
+    assert status["attempts"] == 1
+
+
+def test_gives_up_after_max_attempts(brevo, monkeypatch):
+    message_id = email_outbox.enqueue(_email())
+    monkeypatch.setattr(brevo, "error_rate", 1.0)
+    monkeypatch.setattr(brevo, "error_status", 503)
+    for _ in range(email_outbox.MAX_ATTEMPTS):
+        _make_ready(message_id)
+        _drain()
+
+    status = email_outbox.get_status(message_id)
+    assert status["status"] == email_outbox.FAILED
+    assert status["attempts"] == email_outbox.MAX_ATTEMPTS
+
+
+def test_tcle_endpoint_queues_and_reports_status(client):
+    resp = client.post("/api/tcle", json={"destinatario": _email()})
+    assert resp.status_code == 200
+    body = resp.json()
+    assert body["status"] == email_outbox.QUEUED
+
+    status = client.get(f"/api/tcle/{body['id']}")
+    assert status.status_code == 200
+    assert status.json()["id"] == body["id"]
+    assert client.get("/api/tcle/nao-existe").status_code == 404
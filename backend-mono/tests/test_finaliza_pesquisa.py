@@ -0,0 +1,49 @@
+# server/tests/test_finaliza_pesquisa.py
+"""Validação do payload de /api/finaliza-pesquisa (SurveySubmission)."""
+
+import main
+from loadtest import make_submission
+
+
+def test_qap_with_wrong_length_is_422(client):
+    payload = make_submission("par")
+    payload["qap_responses"] = payload["qap_responses"][:36]
+
+    resp = client.post("/api/finaliza-pesquisa", json=payload)
+
+    assert resp.status_code == 422
+    assert resp.json()["detail"][0]["loc"][0] == "qap_responses"
+
+
+def test_qap_item_out_of_range_is_422(client):
+    payload = make_submission("par")
+    payload["qap_responses"][3] = 9
+
+    resp = client.post("/api/finaliza-pesquisa", json=payload)
+
+    assert resp.status_code == 422
+    assert resp.json()["detail"][0]["loc"] == ["qap_responses", 3]
+
+
+def test_invalid_json_is_400(client):
+    resp = client.post("/api/finaliza-pesquisa", content=b"{nao-e-json", headers={"content-type": "application/json"})
+
+    assert resp.status_code == 400
+
+
+def test_client_qap_sum_is_ignored(client):
+    payload = make_submission("par")
+    payload["qap_sum"] = "não é número"
+
+    resp = client.post("/api/finaliza-pesquisa", json=payload)
+
+    assert resp.status_code == 200
+
+
+def test_blank_items_become_empty_cells():
+    payload = make_submission("par")
+    payload["wisconsin"] = [1, "", None, 2, 3]
+
+    submission = main.SurveySubmission.parse_obj(payload)
+
+    assert submission.wisconsin == [1, "", "", 2, 3]
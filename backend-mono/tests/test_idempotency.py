@@ -0,0 +1,51 @@
+# server/tests/test_idempotency.py
+"""Submissões repetidas de /api/finaliza-pesquisa gravam uma linha só."""
+
+import uuid
+
+import idempotency
+import write_queue
+from loadtest import make_submission
+
+
+def _flush():
+    write_queue._copy_sources()
+    while write_queue.flush_once():
+        pass
+
+
+def test_replay_with_idempotency_key_returns_same_body(client):
+    payload = make_submission("par")
+    headers = {"Idempotency-Key": uuid.uuid4().hex}
+
+    first = client.post("/api/finaliza-pesquisa", json=payload, headers=headers)
+    second = client.post("/api/finaliza-pesquisa", json=payload, headers=headers)
+
+    assert first.status_code == 200
+    assert second.status_code == 200
+    assert second.json() == first.json()
+
+
+def test_identical_payload_is_written_once(client, sheets):
+    payload = make_submission("impar")
+    payload["idade"] = "idempotencia-" + uuid.uuid4().hex
+
+    first = client.post("/api/finaliza-pesquisa", json=payload)
+    second = client.post("/api/finaliza-pesquisa", json=payload)
+    assert second.json() == first.json()
+
+    _flush()
+    rows = [r for r in sheets.rows("responses") if payload["idade"] in r]
+    assert len(rows) == 1
+
+
+def test_submission_in_progress_is_409(client):
+    payload = make_submission("par")
+    headers = {"Idempotency-Key": uuid.uuid4().hex}
+    key = idempotency.make_key(headers["Idempotency-Key"], payload)
+    assert idempotency.begin(key)[0] == idempotency.NEW
+
+    resp = client.post("/api/finaliza-pesquisa", json=payload, headers=headers)
+
+    assert resp.status_code == 409
+    assert resp.headers["retry-after"] == "2"
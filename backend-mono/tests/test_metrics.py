@@ -0,0 +1,31 @@
+# server/tests/test_metrics.py
+"""Métricas das chamadas externas e das rotas (/metrics)."""
+
+import uuid
+
+import email_sender
+import metrics
+
+
+def _sends():
+    data = metrics.CALL_DURATION._values.get(metrics.CALL_DURATION._key(("brevo_send",)))
+    return data[-1] if data else 0
+
+
+def test_each_send_is_recorded_once_and_quietly(brevo, capsys):
+    before = _sends()
+
+    assert email_sender.envia_email_simples(f"metrics-{uuid.uuid4().hex[:8]}@bench.local")
+
+    assert _sends() == before + 1
+    assert capsys.readouterr().out == ""
+
+
+def test_metrics_endpoint_uses_route_templates(client):
+    client.get("/api/tcle/nao-existe")
+
+    body = client.get("/metrics").text
+
+    assert 'path="/api/tcle/{message_id}"' in body
+    assert "nao-existe" not in body
+    assert "app_call_duration_seconds_count" in body
@@ -0,0 +1,129 @@
+# server/tests/test_resilience.py
+"""Retry, circuit breaker e escritas não idempotentes (resilience.call)."""
+
+import socket
+import time
+import uuid
+
+import pytest
+from googleapiclient.errors import HttpError
+from httplib2 import Response
+
+import g_sheets
+import resilience
+import write_queue
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(resilience, "backoff_delay", lambda attempt: 0.0)
+
+
+@pytest.fixture
+def breaker():
+    return resilience.CircuitBreaker("tests", threshold=3, reset_timeout=60)
+
+
+def _failing(exc, times):
+    calls = []
+
+    def fn():
+        calls.append(1)
+        if len(calls) <= times:
+            raise exc
+        return "ok"
+
+    return fn, calls
+
+
+def _http_error(status):
+    return HttpError(Response({"status": status}), b'{"error": {}}')
+
+
+def test_transient_failure_is_retried(breaker):
+    fn, calls = _failing(socket.timeout("timed out"), times=2)
+
+    assert resilience.call("tests", fn, breaker=breaker) == "ok"
+    assert len(calls) == 3
+
+
+def test_ambiguous_failure_of_a_write_is_not_retried(breaker):
+    for exc in (socket.timeout("timed out"), _http_error(503)):
+        fn, calls = _failing(exc, times=1)
+        with pytest.raises(type(exc)):
+            resilience.call("tests", fn, breaker=breaker, idempotent=False)
+        assert len(calls) == 1
+        breaker.record_success()
+
+
+def test_rejected_write_is_retried(breaker):
+    for exc in (_http_error(429), ConnectionRefusedError()):
+        fn, calls = _failing(exc, times=1)
+        assert resilience.call("tests", fn, breaker=breaker, idempotent=False) == "ok"
+        assert len(calls) == 2
+
+
+def test_non_transient_error_is_not_retried(breaker):
+    fn, calls = _failing(_http_error(400), times=1)
+
+    with pytest.raises(HttpError):
+        resilience.call("tests", fn, breaker=breaker)
+    assert len(calls) == 1
+    assert breaker.state == resilience.CLOSED
+
+
+def test_breaker_opens_and_fails_fast(breaker):
+    fn, calls = _failing(socket.timeout("timed out"), times=100)
+
+    with pytest.raises(resilience.CircuitOpenError):
+        resilience.call("tests", fn, breaker=breaker, max_attempts=10)
+    assert len(calls) == 3
+    with pytest.raises(resilience.CircuitOpenError):
+        resilience.call("tests", fn, breaker=breaker)
+    assert len(calls) == 3
+
+
+def test_each_attempt_gets_the_remaining_deadline(breaker):
+    fn, _ = _failing(socket.timeout("timed out"), times=2)
+    timeouts = []
+
+    resilience.call("tests", fn, breaker=breaker, deadline=5, set_timeout=timeouts.append)
+
+    assert len(timeouts) == 3
+    assert all(0 < t <= 5 for t in timeouts)
+    assert timeouts == sorted(timeouts, reverse=True)
+
+
+def test_may_have_applied():
+    wrapped = RuntimeError("Google Sheets API error")
+    wrapped.__cause__ = _http_error(429)
+
+    assert not resilience.may_have_applied(wrapped)
+    assert not resilience.may_have_applied(resilience.CircuitOpenError("tests", 1))
+    assert resilience.may_have_applied(socket.timeout("timed out"))
+    assert resilience.may_have_applied(_http_error(502))
+
+
+def test_slow_append_is_written_once(sheets, monkeypatch):
+    """Append que estoura o timeout mas é aplicado pela API: uma cópia só na planilha."""
+    running = write_queue._flusher is not None
+    write_queue.stop_flusher()
+    tab = f"slow_{uuid.uuid4().hex[:8]}"
+    try:
+        for i in range(3):
+            write_queue.enqueue(tab, [f"p{i}"])
+        monkeypatch.setattr(sheets, "latency", 1.5)
+        monkeypatch.setattr(g_sheets, "HTTP_TIMEOUT", 1.0)
+
+        assert write_queue.flush_once() == 0
+        time.sleep(1.0)  # o stub termina o append depois do timeout do cliente
+        monkeypatch.undo()
+        write_queue._db().execute("UPDATE pending SET lease_until = 0 WHERE tab = ?", (tab,))
+        while write_queue.flush_once():
+            pass
+
+        assert [r[0] for r in sheets.rows(tab)] == ["p0", "p1", "p2"]
+    finally:
+        resilience.SHEETS_BREAKER.record_success()
+        if running:
+            write_queue.start_flusher()
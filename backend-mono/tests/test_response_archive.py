@@ -0,0 +1,95 @@
+# server/tests/test_response_archive.py
+"""Ida e volta do arquivo colunar e recuperação de gravação interrompida."""
+
+import os
+
+import numpy as np
+import pytest
+
+import qap_scoring
+import response_archive
+from local_db import connect
+from storage import SQLiteStore
+from survey_schema import ROW_LENGTH, block_slice, column_index
+
+TAB = "archive_tests"
+
+
+def _row(i: int) -> list:
+    row = [""] * ROW_LENGTH
+    row[0] = f"2026-01-01T00:00:{i:02d}Z"
+    row[column_index("idade")] = str(18 + i)
+    row[column_index("game")] = "badnews" if i % 2 else "pacman"
+    qap = [1 + (i + k) % 5 for k in range(37)]
+    row[block_slice("qap_responses")] = qap
+    row[column_index("qap_sum")] = qap_scoring.score_valid(qap)["qap_sum"]
+    row[block_slice("wisconsin")] = [i % 3, "", 1, 2, 3]
+    row[block_slice("news_first")] = [1 + k % 5 for k in range(12)]
+    row[block_slice("news_second")] = [5 - k % 5 for k in range(12)]
+    return row
+
+
+@pytest.fixture
+def store():
+    s = SQLiteStore(replicate=False)
+    connect(SQLiteStore.DB_NAME).execute("DELETE FROM responses WHERE tab = ?", (TAB,))
+    return s
+
+
+def _stored(store) -> list:
+    return [[str(v) for v in r] for page in store.iter_pages(TAB) for r in page]
+
+
+def _archived(reader) -> list:
+    return [[str(v) for v in r] for page in reader.iter_pages(page_size=7) for r in page]
+
+
+def test_round_trip_matches_store(store, tmp_path):
+    for i in range(25):
+        store.append_response(TAB, _row(i))
+
+    assert response_archive.sync(store, TAB, str(tmp_path)) == 25
+    assert response_archive.sync(store, TAB, str(tmp_path)) == 0
+
+    reader = response_archive.ArchiveReader(TAB, str(tmp_path))
+    assert isinstance(reader.block("qap"), np.memmap)
+    assert _archived(reader) == _stored(store)
+    scores = qap_scoring.score_archive(reader, chunk=4)
+    assert scores["qap_sum"].tolist() == reader.block("qap_sum").tolist()
+
+
+def test_interrupted_append_is_discarded(store, tmp_path, monkeypatch):
+    for i in range(10):
+        store.append_response(TAB, _row(i))
+    response_archive.sync(store, TAB, str(tmp_path))
+    for i in range(10, 15):
+        store.append_response(TAB, _row(i))
+
+    # a gravação cai depois dos dados e antes de confirmar meta.json
+    def crash(directory, meta):
+        raise OSError("queda simulada")
+
+    monkeypatch.setattr(response_archive, "_write_meta", crash)
+    with pytest.raises(OSError):
+        response_archive.sync(store, TAB, str(tmp_path))
+    monkeypatch.undo()
+
+    reader = response_archive.ArchiveReader(TAB, str(tmp_path))
+    assert len(reader) == 10
+    assert os.path.getsize(reader.files["qap"]) > 10 * 37  # bytes órfãos no disco
+
+    assert response_archive.sync(store, TAB, str(tmp_path)) == 5
+    reader = response_archive.ArchiveReader(TAB, str(tmp_path))
+    assert os.path.getsize(reader.files["qap"]) == 15 * 37
+    assert _archived(reader) == _stored(store)
+
+
+def test_unsafe_tab_name_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        response_archive.ArchiveReader("../fora")
+
+
+def test_export_rejects_unsafe_tab(client):
+    resp = client.get("/api/export", params={"source": "archive", "tab": "../../x"},
+                      headers={"Authorization": "Bearer tests-token"})
+    assert resp.status_code == 400
@@ -0,0 +1,65 @@
+# server/tests/test_score_batch.py
+"""Limites de /api/score-batch: tamanho do corpo (sem bufferizar) e número de participantes."""
+
+import json
+
+import pytest
+
+import admission
+import main
+
+
+@pytest.fixture(autouse=True)
+def fresh_client_buckets():
+    """Cada teste começa com o bucket por IP do endpoint cheio (o TestClient usa sempre o mesmo IP)."""
+    admission._BY_ROUTE[("POST", "/api/score-batch")].clients.clear()
+
+
+def _responses(n):
+    return [[1 + (i + k) % 5 for k in range(37)] for i in range(n)]
+
+
+def test_pretty_printed_batch_is_accepted(client):
+    body = json.dumps({"responses": _responses(50)}, indent=8).encode()
+
+    resp = client.post("/api/score-batch", content=body, headers={"content-type": "application/json"})
+
+    assert resp.status_code == 200
+    assert resp.json()["n"] == 50
+
+
+def test_declared_length_over_cap_is_413(client, monkeypatch):
+    monkeypatch.setattr(main, "_SCORE_BATCH_MAX_BYTES", 1000)
+    body = json.dumps({"responses": _responses(20)}).encode()
+
+    resp = client.post("/api/score-batch", content=body)
+
+    assert resp.status_code == 413
+
+
+def test_chunked_body_over_cap_is_413(client, monkeypatch):
+    monkeypatch.setattr(main, "_SCORE_BATCH_MAX_BYTES", 1000)
+
+    def chunks():  # sem Content-Length: só a contagem do stream barra
+        for _ in range(100):
+            yield b" " * 100
+
+    resp = client.post("/api/score-batch", content=chunks())
+
+    assert resp.status_code == 413
+
+
+def test_too_many_participants_is_413(client, monkeypatch):
+    monkeypatch.setattr(main, "SCORE_BATCH_MAX", 3)
+
+    resp = client.post("/api/score-batch", json={"responses": _responses(4)})
+
+    assert resp.status_code == 413
+
+
+def test_empty_batch_has_the_same_keys(client):
+    full = client.post("/api/score-batch", json={"responses": _responses(1)}).json()
+    empty = client.post("/api/score-batch", json={"responses": []}).json()
+
+    assert empty["n"] == 0
+    assert set(empty) == set(full)
@@ -0,0 +1,51 @@
+# server/tests/test_sheets_cache.py
+"""Cache local de leituras do Sheets (g_sheets._ReadCache) contra o stub."""
+
+import uuid
+
+import pytest
+
+import g_sheets
+
+
+@pytest.fixture
+def tab():
+    return f"cache_{uuid.uuid4().hex[:8]}"
+
+
+def _gets(sheets):
+    return sheets.stats["get"]
+
+
+def test_cell_read_is_cached_and_updated_by_writes(tab, sheets):
+    g_sheets.set_cell_value(tab, "A1", 7)
+    before = _gets(sheets)
+
+    assert g_sheets.get_cell_value(tab, "A1") == "7"
+    assert g_sheets.get_cell_value(tab, "A1") == "7"
+    assert _gets(sheets) == before  # o set já deixou o valor no cache
+
+    g_sheets.set_cell_value(tab, "A1", 8)
+    assert g_sheets.get_cell_value(tab, "A1") == "8"
+    assert g_sheets.get_cell_value(tab, "A1", use_cache=False) == "8"
+    assert _gets(sheets) == before + 1
+
+
+def test_row_count_follows_appends_without_rereading(tab, sheets):
+    g_sheets.append_rows(tab, [["a"], ["b"]])
+    assert g_sheets.count_rows(tab) == 2
+    before = _gets(sheets)
+
+    g_sheets.append_rows(tab, [["c"], ["d"], ["e"]])
+
+    assert g_sheets.count_rows(tab) == 5
+    assert _gets(sheets) == before
+
+
+def test_append_invalidates_cached_reads_of_the_tab(tab):
+    g_sheets.append_rows(tab, [["a"]])
+    assert g_sheets.get_cell_value(tab, "A2") == ""
+
+    g_sheets.append_rows(tab, [["b"]])
+
+    assert g_sheets.get_cell_value(tab, "A2") == "b"
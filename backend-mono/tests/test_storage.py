@@ -0,0 +1,69 @@
+# server/tests/test_storage.py
+"""Réplica das respostas do store SQLite para a fila write-behind."""
+
+import uuid
+
+import pytest
+
+import write_queue
+from storage import SQLiteStore
+
+
+@pytest.fixture(autouse=True)
+def paused_flusher():
+    running = write_queue._flusher is not None
+    write_queue.stop_flusher()
+    yield
+    if running:
+        write_queue.start_flusher()
+
+
+@pytest.fixture
+def tab():
+    return f"store_{uuid.uuid4().hex[:8]}"
+
+
+def _pending(tab):
+    return write_queue._db().execute("SELECT COUNT(*) FROM pending WHERE tab = ?", (tab,)).fetchone()[0]
+
+
+def test_failed_copy_is_replicated_by_the_flusher(tab, sheets, monkeypatch):
+    store = SQLiteStore()
+
+    def broken(name, limit=write_queue.FLUSH_BATCH):
+        raise RuntimeError("journal indisponível")
+
+    monkeypatch.setattr(write_queue, "copy_from", broken)
+    result = store.append_response(tab, [f"{tab}-linha", 1])
+    monkeypatch.undo()
+
+    assert "id" in result
+    assert _pending(tab) == 0
+
+    write_queue._copy_sources()
+    while write_queue.flush_once():
+        pass
+
+    assert [r[0] for r in sheets.rows(tab)] == [f"{tab}-linha"]
+
+
+def test_each_row_is_copied_once(tab):
+    store = SQLiteStore()
+    for i in range(3):
+        store.append_response(tab, [f"{tab}-{i}"])
+
+    write_queue._copy_sources()
+    write_queue._copy_sources()
+
+    assert _pending(tab) == 3
+
+
+def test_existing_rows_are_not_copied_again_on_first_start(tab):
+    SQLiteStore(replicate=False).append_response(tab, [f"{tab}-antiga"])
+    write_queue._db().execute("DELETE FROM sources WHERE name = ?", (SQLiteStore.SOURCE,))
+
+    store = SQLiteStore()  # como um worker da versão nova subindo pela primeira vez
+    store.append_response(tab, [f"{tab}-nova"])
+
+    rows = write_queue._db().execute("SELECT row FROM pending WHERE tab = ?", (tab,)).fetchall()
+    assert rows == [(f'["{tab}-nova"]',)]
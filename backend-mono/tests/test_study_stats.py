@@ -0,0 +1,81 @@
+# server/tests/test_study_stats.py
+"""Agregados incrementais do estudo: cada linha entra uma vez, sem ler o store na gravação."""
+
+import uuid
+
+import pytest
+
+from loadtest import make_submission
+from main import SUBMISSION_BLOCKS, SurveySubmission
+from storage import SQLiteStore
+from study_stats import StudyStats
+from survey_schema import build_row
+
+
+@pytest.fixture
+def tab():
+    return f"stats_{uuid.uuid4().hex[:8]}"
+
+
+@pytest.fixture
+def store():
+    return SQLiteStore(replicate=False)
+
+
+def _row(group):
+    submission = SurveySubmission.parse_obj(make_submission(group))
+    return build_row(submission.dict(), coerced=SUBMISSION_BLOCKS)
+
+
+def _write(store, stats, group):
+    """Gravação deste worker: grava e avisa as estatísticas, como storage.append_row."""
+    row = _row(group)
+    result = store.append_response(stats.tab_name, row)
+    stats.on_append(store, row, result["id"])
+
+
+def _counts(stats):
+    return stats.snapshot()["balance"]["counts"]
+
+
+def test_own_and_other_workers_rows_count_once(tab, store, tmp_path):
+    stats = StudyStats(tab, str(tmp_path / "stats.json"))
+    stats.ensure_loaded(store)
+
+    _write(store, stats, "par")
+    store.append_response(tab, _row("impar"))  # outro worker
+    _write(store, stats, "par")
+
+    assert _counts(stats) == {"badnews": 2}
+    stats.catch_up(store)
+    stats.catch_up(store)
+    assert _counts(stats) == {"badnews": 2, "pacman": 1}
+    assert stats._ahead == set()
+
+
+def test_append_does_not_read_the_store(tab, store, tmp_path, monkeypatch):
+    stats = StudyStats(tab, str(tmp_path / "stats.json"))
+    stats.ensure_loaded(store)
+
+    def no_reads(*args, **kwargs):
+        raise AssertionError("a gravação não deve ler o store")
+
+    monkeypatch.setattr(store, "iter_rows_since", no_reads)
+    _write(store, stats, "impar")
+
+    assert _counts(stats) == {"pacman": 1}
+
+
+def test_checkpoint_keeps_rows_counted_ahead(tab, store, tmp_path):
+    path = str(tmp_path / "stats.json")
+    stats = StudyStats(tab, path)
+    stats.ensure_loaded(store)
+    store.append_response(tab, _row("impar"))  # outro worker, ainda sem catch-up
+    _write(store, stats, "par")
+    stats.checkpoint()
+
+    restarted = StudyStats(tab, path)
+    restarted.ensure_loaded(store)
+
+    assert _counts(restarted) == {"badnews": 1, "pacman": 1}
+    assert restarted.snapshot()["participants"] == 2
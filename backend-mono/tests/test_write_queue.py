@@ -0,0 +1,129 @@
+# server/tests/test_write_queue.py
+"""Fila write-behind: lotes reenviados depois de falhas não duplicam linhas na planilha."""
+
+import socket
+import uuid
+
+import pytest
+from googleapiclient.errors import HttpError
+from httplib2 import Response
+
+import g_sheets
+import write_queue
+
+
+@pytest.fixture(autouse=True)
+def paused_flusher():
+    """Sem o flusher de fundo do app: o teste decide quando cada lote sai."""
+    running = write_queue._flusher is not None
+    write_queue.stop_flusher()
+    yield
+    if running:
+        write_queue.start_flusher()
+
+
+@pytest.fixture
+def tab():
+    return f"wq_{uuid.uuid4().hex[:8]}"
+
+
+def _rows(n):
+    tag = uuid.uuid4().hex[:6]
+    return [[f"{tag}-p{i}", i, 2.5, True, ""] for i in range(n)]
+
+
+def _release_leases():
+    write_queue._db().execute("UPDATE pending SET lease_until = 0")
+
+
+def _flush_all():
+    while write_queue.flush_once():
+        pass
+
+
+def _fail_once(monkeypatch, exc, apply_first):
+    """append_rows falha uma vez com `exc`; com apply_first a planilha recebe as linhas antes."""
+    real = g_sheets.append_rows
+    calls = []
+
+    def append_rows(tab_name, rows, **kwargs):
+        calls.append(len(rows))
+        if len(calls) == 1:
+            if apply_first:
+                real(tab_name, rows, **kwargs)
+            raise exc
+        return real(tab_name, rows, **kwargs)
+
+    monkeypatch.setattr(g_sheets, "append_rows", append_rows)
+    return calls
+
+
+def test_ambiguous_failure_is_reconciled_not_resent(tab, sheets, monkeypatch):
+    rows = _rows(3)
+    for row in rows:
+        write_queue.enqueue(tab, row)
+    calls = _fail_once(monkeypatch, socket.timeout("timed out"), apply_first=True)
+
+    assert write_queue.flush_once() == 0
+    assert write_queue._db().execute("SELECT COUNT(*) FROM pending WHERE tab = ? AND check_from > 0", (tab,)).fetchone()[0] == 3
+
+    _release_leases()
+    _flush_all()
+
+    assert [r[0] for r in sheets.rows(tab)] == [r[0] for r in rows]
+    assert calls == [3]  # conferidas na planilha, sem segundo append
+    assert write_queue._db().execute("SELECT COUNT(*) FROM pending WHERE tab = ?", (tab,)).fetchone()[0] == 0
+
+
+def test_ambiguous_failure_that_did_not_apply_is_resent(tab, sheets, monkeypatch):
+    rows = _rows(2)
+    for row in rows:
+        write_queue.enqueue(tab, row)
+    calls = _fail_once(monkeypatch, socket.timeout("timed out"), apply_first=False)
+
+    write_queue.flush_once()
+    _release_leases()
+    _flush_all()
+
+    assert [r[0] for r in sheets.rows(tab)] == [r[0] for r in rows]
+    assert calls == [2, 2]
+
+
+def test_rejected_append_is_resent_without_check(tab, sheets, monkeypatch):
+    rows = _rows(2)
+    for row in rows:
+        write_queue.enqueue(tab, row)
+    quota = HttpError(Response({"status": 429}), b'{"error": {"code": 429}}')
+    wrapped = RuntimeError("Google Sheets API error")
+    wrapped.__cause__ = quota  # como append_rows embrulha o HttpError
+    _fail_once(monkeypatch, wrapped, apply_first=False)
+
+    write_queue.flush_once()
+    assert write_queue._db().execute("SELECT MAX(check_from) FROM pending WHERE tab = ?", (tab,)).fetchone()[0] == 0
+
+    _release_leases()
+    _flush_all()
+    assert [r[0] for r in sheets.rows(tab)] == [r[0] for r in rows]
+
+
+def test_only_the_missing_rows_are_resent(tab, sheets, monkeypatch):
+    rows = _rows(3)
+    for row in rows:
+        write_queue.enqueue(tab, row)
+    real = g_sheets.append_rows
+    calls = []
+
+    def partial(tab_name, batch, **kwargs):
+        calls.append(len(batch))
+        if len(calls) == 1:
+            real(tab_name, batch[:1], **kwargs)  # só a primeira chegou antes da queda
+            raise ConnectionResetError("connection reset")
+        return real(tab_name, batch, **kwargs)
+
+    monkeypatch.setattr(g_sheets, "append_rows", partial)
+    write_queue.flush_once()
+    _release_leases()
+    _flush_all()
+
+    assert [r[0] for r in sheets.rows(tab)] == [r[0] for r in rows]
+    assert calls == [3, 2]
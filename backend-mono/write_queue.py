@@ -0,0 +1,384 @@
+# server/write_queue.py
+"""
+write_queue.py
+Fila write-behind para as linhas de resposta.
+
+A linha é gravada num journal SQLite local (durável) e o endpoint retorna
+em seguida. Uma thread de fundo agrupa as linhas pendentes e envia cada
+grupo em UMA chamada values().append, com retry e backoff exponencial.
+Linhas são "arrendadas" (lease) antes do envio, então vários workers podem
+rodar o flusher sobre o mesmo journal sem duplicar envios. Com vários
+workers só um deles (LeaderLock) esvazia a fila, para que os lotes não
+sejam divididos entre processos.
+
+values().append não é idempotente. Quando um envio falha sem certeza de
+que a API não o aplicou (timeout, 5xx), as linhas ficam marcadas com a
+linha da planilha a partir da qual podem ter entrado (check_from). Antes
+de reenviá-las o flusher lê a planilha dali em diante e descarta as que
+já estão lá.
+
+Fontes (register_source): um store local pode ser a origem das linhas.
+copy_from copia para o journal as linhas da fonte com id acima de uma
+marca guardada aqui, na mesma transação que avança a marca; o flusher
+chama as fontes registradas a cada ciclo. Assim uma linha gravada no store
+chega à planilha mesmo que a cópia no momento da gravação tenha falhado.
+"""
+
+import os
+import re
+import json
+import time
+import random
+import threading
+import logging
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import g_sheets
+import resilience
+from local_db import LeaderLock, connect
+from metrics import SHEETS_QUOTA_RETRIES
+
+logger = logging.getLogger("write_queue")
+
+DB_NAME = "write_queue"
+WRITE_BEHIND = os.getenv("SHEETS_WRITE_BEHIND", "1") == "1"
+FLUSH_INTERVAL = float(os.getenv("SHEETS_FLUSH_INTERVAL", "2"))  # segundos entre lotes
+FLUSH_BATCH = int(os.getenv("SHEETS_FLUSH_BATCH", "200"))  # linhas por values().append
+LEASE_SECONDS = float(os.getenv("SHEETS_FLUSH_LEASE", "60"))
+BACKOFF_BASE = float(os.getenv("SHEETS_FLUSH_BACKOFF_BASE", "2"))
+BACKOFF_MAX = float(os.getenv("SHEETS_FLUSH_BACKOFF_MAX", "300"))
+RECONCILE_PAGE = int(os.getenv("SHEETS_RECONCILE_PAGE", "500"))  # linhas lidas por chamada ao conferir
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS pending (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    tab TEXT NOT NULL,
+    row TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    lease_until REAL NOT NULL DEFAULT 0,
+    check_from INTEGER NOT NULL DEFAULT 0
+)
+"""
+
+# marca de cada fonte: maior id da fonte já copiado para o journal
+_SOURCES_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sources (
+    name TEXT PRIMARY KEY,
+    last_id INTEGER NOT NULL
+)
+"""
+
+_init_lock = threading.Lock()
+_initialized = False
+_stats_lock = threading.Lock()
+# última linha da planilha ocupada por um append deste processo, por aba
+_last_row: Dict[str, int] = {}
+_stats: Dict[str, Any] = {
+    "rows_flushed": 0,
+    "rows_reconciled": 0,
+    "batches_flushed": 0,
+    "flush_errors": 0,
+    "last_flush_at": None,
+    "last_error": None,
+}
+
+
+def _db():
+    global _initialized
+    conn = connect(DB_NAME)
+    if not _initialized:
+        with _init_lock:
+            if not _initialized:
+                conn.execute(_SCHEMA)
+                columns = {row[1] for row in conn.execute("PRAGMA table_info(pending)")}
+                if "check_from" not in columns:
+                    # journal criado antes da conferência de envios incertos
+                    conn.execute("ALTER TABLE pending ADD COLUMN check_from INTEGER NOT NULL DEFAULT 0")
+                conn.execute("CREATE INDEX IF NOT EXISTS pending_lease ON pending (lease_until, id)")
+                conn.execute(_SOURCES_SCHEMA)
+                _initialized = True
+    return conn
+
+
+def enqueue(tab_name: str, row: Sequence[Any], possibly_sent: bool = False) -> int:
+    """
+    Grava a linha no journal local e devolve o id da entrada. possibly_sent
+    marca uma linha cujo append direto falhou sem resultado certo: ela é
+    conferida na planilha antes de ser enviada.
+    """
+    check_from = _last_row.get(tab_name, 0) + 1 if possibly_sent else 0
+    cur = _db().execute(
+        "INSERT INTO pending (tab, row, created_at, check_from) VALUES (?, ?, ?, ?)",
+        (tab_name, json.dumps(list(row), ensure_ascii=False), time.time(), check_from),
+    )
+    logger.debug("enqueue: tab=%s id=%d", tab_name, cur.lastrowid)
+    return cur.lastrowid
+
+
+# fetch(last_id, limit) -> [(id, aba, linha em JSON, created_at), ...] em ordem de id
+SourceFetch = Callable[[int, int], List[Tuple[int, str, str, float]]]
+_sources: Dict[str, SourceFetch] = {}
+
+
+def register_source(name: str, fetch: SourceFetch, start_id: int) -> None:
+    """
+    Registra uma fonte para o flusher copiar a cada ciclo. Na primeira vez
+    a marca começa em start_id (linhas até ele já foram enfileiradas).
+    """
+    _db().execute("INSERT OR IGNORE INTO sources (name, last_id) VALUES (?, ?)", (name, start_id))
+    _sources[name] = fetch
+
+
+def copy_from(name: str, limit: int = FLUSH_BATCH) -> int:
+    """Copia para o journal as linhas da fonte acima da marca e avança a marca junto. Devolve quantas."""
+    fetch = _sources[name]
+    conn = _db()
+    copied = 0
+    while True:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            last_id = conn.execute("SELECT last_id FROM sources WHERE name = ?", (name,)).fetchone()[0]
+            rows = fetch(last_id, limit)
+            if rows:
+                conn.executemany(
+                    "INSERT INTO pending (tab, row, created_at) VALUES (?, ?, ?)",
+                    [(tab, row, created_at) for _, tab, row, created_at in rows],
+                )
+                conn.execute("UPDATE sources SET last_id = ? WHERE name = ?", (rows[-1][0], name))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        copied += len(rows)
+        if len(rows) < limit:
+            if copied:
+                logger.debug("copy_from: %d linhas de %s", copied, name)
+            return copied
+
+
+def _copy_sources() -> None:
+    for name in list(_sources):
+        try:
+            copy_from(name)
+        except Exception:
+            logger.exception("Falha ao copiar linhas da fonte %s; nova tentativa no próximo ciclo.", name)
+
+
+def _backoff(attempts: int) -> float:
+    delay = min(BACKOFF_MAX, BACKOFF_BASE * (2 ** max(0, attempts - 1)))
+    return delay * random.uniform(0.5, 1.0)
+
+
+def _claim(limit: int) -> List[tuple]:
+    """Arrenda até `limit` linhas disponíveis, na ordem de chegada."""
+    conn = _db()
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        rows = conn.execute(
+            "SELECT id, tab, row, attempts, check_from FROM pending WHERE lease_until <= ? ORDER BY id LIMIT ?",
+            (now, limit),
+        ).fetchall()
+        if rows:
+            conn.executemany(
+                "UPDATE pending SET lease_until = ? WHERE id = ?",
+                [(now + LEASE_SECONDS, r[0]) for r in rows],
+            )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return rows
+
+
+def _cell_key(value: Any) -> str:
+    """Forma comparável de uma célula: a API devolve tudo como texto formatado."""
+    if value is None:
+        return ""
+    text = str(value).strip()
+    if text.lower() in ("true", "false"):
+        return text.upper()
+    try:
+        return repr(float(text))
+    except ValueError:
+        return text
+
+
+def _row_key(row: Sequence[Any]) -> Tuple[str, ...]:
+    cells = [_cell_key(v) for v in row]
+    while cells and cells[-1] == "":
+        cells.pop()
+    return tuple(cells)
+
+
+def _end_row(result: Dict[str, Any]) -> Optional[int]:
+    """Última linha ocupada pelo append ("Aba!A12:CB40" -> 40)."""
+    match = re.search(r"(\d+)$", (result.get("updates") or {}).get("updatedRange") or "")
+    return int(match.group(1)) if match else None
+
+
+def _already_in_sheet(tab_name: str, entries: List[tuple], rows: List[List[Any]]) -> List[int]:
+    """
+    Ids das linhas marcadas com check_from que já estão na planilha. Lê a
+    aba a partir da menor marca; cada linha da planilha casa com no máximo
+    uma entrada (linhas idênticas enviadas duas vezes continuam duas).
+    """
+    wanted: Dict[Tuple[str, ...], List[int]] = {}
+    for entry, row in zip(entries, rows):
+        if entry[4]:
+            wanted.setdefault(_row_key(row), []).append(entry[0])
+    start = min(entry[4] for entry in entries if entry[4])
+    width = max(len(row) for row in rows)
+    found: List[int] = []
+    while True:
+        page = g_sheets.get_rows(tab_name, start, RECONCILE_PAGE, width)
+        for sheet_row in page:
+            ids = wanted.get(_row_key(sheet_row))
+            if ids:
+                found.append(ids.pop(0))
+        if len(page) < RECONCILE_PAGE:
+            _last_row[tab_name] = max(_last_row.get(tab_name, 0), start + len(page) - 1)
+            return found
+        start += RECONCILE_PAGE
+
+
+def flush_once(limit: int = FLUSH_BATCH) -> int:
+    """Envia um lote de linhas pendentes (uma chamada por aba). Retorna quantas foram gravadas."""
+    # com a API degradada as linhas esperam no journal; o breaker decide quando testar de novo
+    if resilience.SHEETS_BREAKER.state == resilience.OPEN:
+        return 0
+    claimed = _claim(limit)
+    if not claimed:
+        return 0
+
+    by_tab: Dict[str, List[tuple]] = {}
+    for entry in claimed:
+        by_tab.setdefault(entry[1], []).append(entry)
+
+    conn = _db()
+    flushed = 0
+    for tab_name, entries in by_tab.items():
+        rows = [json.loads(e[2]) for e in entries]
+        sending = False
+        try:
+            if any(e[4] for e in entries):
+                delivered = set(_already_in_sheet(tab_name, entries, rows))
+                if delivered:
+                    conn.executemany("DELETE FROM pending WHERE id = ?", [(i,) for i in delivered])
+                    flushed += len(delivered)
+                    with _stats_lock:
+                        _stats["rows_reconciled"] += len(delivered)
+                    logger.info("flush: %d linhas já estavam em %s (envio anterior incerto)", len(delivered), tab_name)
+                    kept = [(e, r) for e, r in zip(entries, rows) if e[0] not in delivered]
+                    entries, rows = [e for e, _ in kept], [r for _, r in kept]
+                    if not entries:
+                        continue
+            sending = True
+            result = g_sheets.append_rows(tab_name, rows)
+        except Exception as e:
+            ids = [entry[0] for entry in entries]
+            attempts = max(entry[3] for entry in entries) + 1
+            retry_at = time.time() + _backoff(attempts)
+            # o append pode ter sido aplicado: marca de onde conferir (uma marca anterior continua valendo)
+            check_from = _last_row.get(tab_name, 0) + 1 if sending and resilience.may_have_applied(e) else 0
+            conn.executemany(
+                "UPDATE pending SET attempts = attempts + 1, lease_until = ?, "
+                "check_from = CASE WHEN check_from > 0 THEN check_from ELSE ? END WHERE id = ?",
+                [(retry_at, check_from, i) for i in ids],
+            )
+            if g_sheets.is_quota_error(e):
+                SHEETS_QUOTA_RETRIES.inc("flush")
+            with _stats_lock:
+                _stats["flush_errors"] += 1
+                _stats["last_error"] = str(e)
+            logger.warning("flush: falha ao enviar %d linhas para %s (tentativa %d): %s", len(ids), tab_name, attempts, e)
+            continue
+
+        ids = [entry[0] for entry in entries]
+        end_row = _end_row(result)
+        if end_row is not None:
+            _last_row[tab_name] = end_row
+        conn.executemany("DELETE FROM pending WHERE id = ?", [(i,) for i in ids])
+        flushed += len(ids)
+        with _stats_lock:
+            _stats["rows_flushed"] += len(ids)
+            _stats["batches_flushed"] += 1
+            _stats["last_flush_at"] = time.time()
+        logger.info("flush: %d linhas gravadas em %s", len(ids), tab_name)
+    return flushed
+
+
+def status() -> Dict[str, Any]:
+    """Profundidade da fila e atraso do flush (idade da linha pendente mais antiga)."""
+    conn = _db()
+    depth, oldest = conn.execute("SELECT COUNT(*), MIN(created_at) FROM pending").fetchone()
+    now = time.time()
+    with _stats_lock:
+        stats = dict(_stats)
+    return {
+        "write_behind": WRITE_BEHIND,
+        "queue_depth": depth,
+        "flush_lag_seconds": round(now - oldest, 3) if oldest is not None else 0.0,
+        "last_flush_age_seconds": round(now - stats["last_flush_at"], 3) if stats["last_flush_at"] else None,
+        "rows_flushed": stats["rows_flushed"],
+        "rows_reconciled": stats["rows_reconciled"],
+        "batches_flushed": stats["batches_flushed"],
+        "flush_errors": stats["flush_errors"],
+        "last_error": stats["last_error"],
+    }
+
+
+class _Flusher:
+    def __init__(self, interval: float = FLUSH_INTERVAL):
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="sheets-flusher", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            if not _leader.try_acquire():
+                self._stop.wait(self.interval)
+                continue
+            try:
+                _copy_sources()
+                # esvazia enquanto houver lotes cheios; depois espera o intervalo
+                while flush_once() >= FLUSH_BATCH and not self._stop.is_set():
+                    pass
+            except Exception:
+                logger.exception("flusher: erro inesperado")
+            self._stop.wait(self.interval)
+
+    def stop(self, timeout: float = 10.0) -> None:
+        self._stop.set()
+        self._thread.join(timeout=timeout)
+
+
+_flusher: Optional[_Flusher] = None
+_leader = LeaderLock("sheets-flusher")
+
+
+def start_flusher() -> None:
+    global _flusher
+    if _flusher is None:
+        _flusher = _Flusher()
+        _flusher.start()
+        logger.info("Flusher iniciado (intervalo=%ss, lote=%d)", FLUSH_INTERVAL, FLUSH_BATCH)
+
+
+def stop_flusher() -> None:
+    """Para o flusher e tenta enviar o que ainda estiver pendente."""
+    global _flusher
+    if _flusher is None:
+        return
+    _flusher.stop()
+    _flusher = None
+    _leader.release()
+    try:
+        _copy_sources()
+        flush_once()
+    except Exception:
+        logger.exception("Falha no flush final; linhas continuam no journal.")